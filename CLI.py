@@ -1,6 +1,7 @@
 # CLI.py
 import storage
 import analyzer
+import periods
 import datetime
 from habit import Habit
 
@@ -22,9 +23,10 @@ def get_user_choice():
 def create_habit_cli(conn):
     """Handles the user input for creating a new habit."""
     name = input("Enter habit name: ")
-    periodicity = input("Enter periodicity (daily or weekly): ").lower()
-    if periodicity not in ['daily', 'weekly']:
-        print("Invalid periodicity. Please choose 'daily' or 'weekly'.")
+    forms = ", ".join(periods.PERIODICITY_FORMS)
+    periodicity = input(f"Enter periodicity ({forms}): ").lower()
+    if periods.get_periodicity(periodicity) is None:
+        print(f"Invalid periodicity. Please choose one of: {forms}.")
         return
     h = Habit(name, periodicity)
     storage.save_habit(conn, h)
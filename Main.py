@@ -1,8 +1,11 @@
 import storage
-import analyzer
-from models import User, Habit
+from models import Habit
 import datetime
-import os
+import itertools
+import sys
+
+# analyzer and periods are imported by the interactive functions that use them,
+# so that the non-interactive commands start without them.
 
 
 # --- Main Application Logic ---
@@ -69,6 +72,7 @@ def run_interactive_app(conn):
         print("5. Delete my account")
         print("6. Sign out")
         print("7. View Raw Data (for persistence proof)")  # NEW DATA OPTION
+        print("8. Set my time zone")
 
         choice = input("Enter your choice: ")
 
@@ -91,6 +95,8 @@ def run_interactive_app(conn):
             return
         elif choice == '7':
             view_raw_data_cli(conn, user_id)
+        elif choice == '8':
+            set_timezone_cli(conn, user_id)
         else:
             print("Invalid choice. Please try again.")
 
@@ -98,10 +104,13 @@ def run_interactive_app(conn):
 # --- CLI Helper Functions ---
 def create_habit_cli(conn, user_id):
     """Handles the user input for creating a new habit."""
+    import periods
+
     name = input("Enter habit name: ")
-    periodicity = input("Enter periodicity (daily, weekly): ").lower()
-    if periodicity not in ['daily', 'weekly']:
-        print("Invalid periodicity. Please choose 'daily' or 'weekly'.")
+    forms = ", ".join(periods.PERIODICITY_FORMS)
+    periodicity = input(f"Enter periodicity ({forms}): ").lower()
+    if periods.get_periodicity(periodicity) is None:
+        print(f"Invalid periodicity. Please choose one of: {forms}.")
         return
     h = Habit(name, periodicity)
     storage.save_habit(conn, user_id, h)
@@ -123,7 +132,8 @@ def log_completion_cli(conn, user_id):
         choice = int(input("Enter habit number: "))
         if 1 <= choice <= len(habits):
             habit = habits[choice - 1]
-            storage.save_completion(conn, habit.habit_id, datetime.datetime.now())
+            # An aware time is recorded on the wall clock of the user's time zone
+            storage.save_completion(conn, habit.habit_id, datetime.datetime.now().astimezone())
             print(f"Completion logged for '{habit.name}'.")
         else:
             print("Invalid number. Please try again.")
@@ -131,6 +141,18 @@ def log_completion_cli(conn, user_id):
         print("Invalid input. Please enter a number.")
 
 
+def set_timezone_cli(conn, user_id):
+    """Handles setting the time zone completions are recorded in."""
+    current = storage.get_user_timezone(conn, user_id) or "system default"
+    name = input(f"Enter a time zone such as Europe/Berlin (current: {current}; blank for system default): ").strip()
+    try:
+        storage.set_user_timezone(conn, user_id, name or None)
+    except ValueError as e:
+        print(e)
+        return
+    print(f"Time zone set to {name or 'system default'}.")
+
+
 def delete_habit_cli(conn, user_id):
     """Handles deleting a chosen habit."""
     habits = storage.load_habits_for_user(conn, user_id)
@@ -156,6 +178,9 @@ def delete_habit_cli(conn, user_id):
 
 def analyze_habits_cli(conn, user_id):
     """Presents the analysis menu and handles user choices."""
+    import analyzer
+    import periods
+
     habits = storage.load_habits_for_user(conn, user_id)
     if not habits:
         print("No habits found to analyze.")
@@ -167,7 +192,8 @@ def analyze_habits_cli(conn, user_id):
         print("2. Filter habits by periodicity")
         print("3. View global longest streak")
         print("4. View longest streak for a specific habit")
-        print("5. Return to main menu")
+        print("5. Completion report for a time window")
+        print("6. Return to main menu")
 
         choice = input("Enter your choice: ")
 
@@ -177,8 +203,8 @@ def analyze_habits_cli(conn, user_id):
                 print(f"- {h.name} ({h.periodicity})")
 
         elif choice == '2':
-            period = input("Filter by 'daily' or 'weekly': ").lower()
-            filtered = analyzer.filter_habits_by_periodicity(habits, period)
+            period = input(f"Filter by periodicity ({', '.join(periods.PERIODICITY_FORMS)}): ").lower()
+            filtered = analyzer.habits_by_periodicity(habits, period)
             print(f"\n{period.capitalize()} Habits:")
             for h in filtered:
                 print(f"- {h.name}")
@@ -204,35 +230,80 @@ def analyze_habits_cli(conn, user_id):
                 print("Invalid input.")
 
         elif choice == '5':
+            window_report_cli(habits)
+
+        elif choice == '6':
             return
 
         else:
             print("Invalid choice. Please try again.")
 
 
+def window_report_cli(habits):
+    """Prints completion rate, streak and consistency figures of loaded habits over the last N days."""
+    import analyzer
+
+    try:
+        days = int(input("Report on the last how many days? [30]: ") or 30)
+        if days < 1:
+            raise ValueError
+    except ValueError:
+        print("Invalid input. Please enter a positive number.")
+        return
+    end = datetime.date.today()
+    start = end - datetime.timedelta(days=days - 1)
+    # The habits' completions are in memory, and only those inside the window are mapped
+    reports = analyzer.window_reports(habits, start, end)
+    if not reports:
+        print("No habits were tracked in this window.")
+        return
+
+    names = {h.habit_id: h.name for h in habits}
+    print(f"\nReport from {start} to {end}:")
+    print(f"{'Habit':<30} {'Rate':>6} {'Current':>8} {'Longest':>8} {'Breaks':>7} {'Mean gap':>9} {'Recent':>7}")
+    for r in reports:
+        mean_gap = f"{r.mean_gap:.1f}" if r.mean_gap is not None else "-"
+        print(f"{names[r.habit_id][:30]:<30} {r.completion_rate:>6.0%} {r.current_streak:>8} {r.longest_streak:>8} "
+              f"{r.breaks:>7} {mean_gap:>9} {r.recent_adherence:>7.0%}")
+    summary = analyzer.summarize_window(reports)
+    print(f"\nOverall: {summary.completed} of {summary.periods} periods completed ({summary.completion_rate:.0%}), "
+          f"mean habit rate {summary.mean_completion_rate:.0%}, {summary.breaks} breaks, "
+          f"best current streak {summary.longest_current_streak}.")
+
+
 def view_raw_data_cli(conn, user_id):
     """Displays raw data and timestamps for persistence proof."""
-    habits = storage.load_habits_for_user(conn, user_id)
-    if not habits:
+    # Habits and completions are streamed, so long histories are never loaded at once
+    habits = storage.iter_habits_for_user(conn, user_id)
+    first = next(habits, None)
+    if first is None:
         print("No habits found.")
         return
 
     print("\n--- RAW DATA LOGS (For Phase 2 Proof) ---")
-    for i, h in enumerate(habits):
+    for i, h in enumerate(itertools.chain((first,), habits)):
         print(f"\n[{i + 1}. {h.name} ({h.periodicity})]")
         print(f"  Habit ID: {h.habit_id}")
         # The 'created_at' attribute is a datetime object or iso string from the Habit model
         print(f"  Created At: {h.created_at}")
 
-        print(f"  Completions ({len(h.completions)} logs):")
+        if h.streak_summary:
+            print(f"  Completions ({h.streak_summary.total_count} logs):")
+        else:
+            print("  Completions:")
         for log in h.completions:
-            print(
-                f"    - {log.isoformat() if isinstance(log, datetime.datetime) else log}")  # Ensure datetime is formatted
+            # Ensure datetime is formatted
+            print(f"    - {log.isoformat() if isinstance(log, datetime.datetime) else log}")
+    cache = storage.get_habit_cache(conn)
+    if cache is not None:
+        print(f"\nHabit cache: {cache.hits} hits, {cache.misses} misses, {len(cache)} users cached")
     print("------------------------------------------")
 
 
 def generate_proof_screenshots(conn, user_id):
     """Generates the required streak outputs for the lecturer."""
+    import analyzer
+
     habits = storage.load_habits_for_user(conn, user_id)
 
     # 1. RAW DATA PROOF (Timestamps + 5+ habits + 4 weeks)
@@ -267,9 +338,112 @@ def generate_proof_screenshots(conn, user_id):
     print("DEMO COMPLETE. You are now logged into the proof user account.")
 
 
+# --- Command mode ---
+def parse_command(argv):
+    """
+    Parses the command line: a non-interactive command (log, streak, list or
+    batch), or none for the interactive app, in which case `command` is None.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="Main.py", description="Run one habit tracker command and exit. "
+                                     "Without a command the interactive app starts.")
+    parser.add_argument("--db", default=storage.DATABASE_NAME, help="The database file.")
+    parser.add_argument("--write-behind", action="store_true",
+                        help="In the interactive app, queue logged completions and write them in batches.")
+    commands = parser.add_subparsers(dest="command")
+
+    log = commands.add_parser("log", help="Log a completion of a habit.")
+    log.add_argument("--user", required=True)
+    log.add_argument("habit", help="The habit's name.")
+    log.add_argument("--at", type=datetime.datetime.fromisoformat,
+                     help="When it was completed, in ISO format; now by default.")
+
+    streak = commands.add_parser("streak", help="Print the current and longest streak of habits.")
+    streak.add_argument("--user", required=True)
+    streak.add_argument("habit", nargs="?", help="The habit's name; every habit by default.")
+
+    listing = commands.add_parser("list", help="Print a user's habits.")
+    listing.add_argument("--user", required=True)
+
+    batch = commands.add_parser("batch", help="Run JSON Lines commands and print a JSON result for each.")
+    batch.add_argument("file", nargs="?", default="-", help="The commands; standard input by default.")
+    batch.add_argument("--batch-size", type=int, default=10_000, help="Commands per transaction.")
+    return parser.parse_args(argv)
+
+
+def run_command(conn, args):
+    """
+    Runs a command parsed by parse_command as the named user and prints its
+    result as tab-separated lines. Commands ask for no password: whoever can
+    open the database file can already read and change it.
+    Returns the exit status.
+    """
+    if args.command == "batch":
+        return run_batch_command(conn, args)
+    user_id = storage.find_user(conn, args.user)
+    if user_id is None:
+        print(f"Unknown user: {args.user}", file=sys.stderr)
+        return 1
+    if args.command == "list":
+        for h in storage.list_habits(conn, user_id):
+            print(f"{h.name}\t{h.periodicity}\t{h.created_at.date().isoformat()}")
+        return 0
+
+    habits = storage.list_habits(conn, user_id)
+    if args.habit is not None:
+        habits = [h for h in habits if h.name == args.habit]
+        if not habits:
+            print(f"Unknown habit: {args.habit}", file=sys.stderr)
+            return 1
+
+    if args.command == "log":
+        # An aware time is recorded on the wall clock of the user's time zone
+        storage.save_completion(conn, habits[0].habit_id, args.at or datetime.datetime.now().astimezone())
+        print(f"Completion logged for '{habits[0].name}'.")
+        return 0
+    # Summaries missing, e.g. after a bulk import, are computed without storing
+    # them: a read-only command must not wait for the write lock
+    computed = storage.compute_streak_summaries(conn, [h.habit_id for h in habits if h.streak_summary is None])
+    for h in habits:
+        summary = h.streak_summary or computed.get(h.habit_id)
+        current, longest = (summary.current_streak, summary.longest_streak) if summary else (0, 0)
+        print(f"{h.name}\t{current}\t{longest}")
+    return 0
+
+
+def run_batch_command(conn, args):
+    """Runs the batch command (see batch.py). Returns 1 if any command failed."""
+    import batch  # Only the batch command needs the runner
+
+    if args.file == "-":
+        _, failures = batch.run_batch(conn, sys.stdin, sys.stdout, args.batch_size)
+    else:
+        with open(args.file, encoding="utf-8") as f:
+            _, failures = batch.run_batch(conn, f, sys.stdout, args.batch_size)
+    return 1 if failures else 0
+
+
 # --- Main function to run the application ---
 if __name__ == "__main__":
-    conn = storage.get_db_connection()
+    args = parse_command(sys.argv[1:])
+    conn = storage.get_db_connection(args.db)
+    # Only reads user_version when the schema is already current
     storage.create_tables(conn)
-    run_interactive_app(conn)
-    conn.close()
+    if args.command is not None:
+        try:
+            status = run_command(conn, args)
+        finally:
+            conn.close()
+        sys.exit(status)
+
+    if args.write_behind:
+        storage.enable_write_behind(conn)
+    # Menu actions reuse the signed-in user's loaded habits instead of reloading them
+    storage.enable_habit_cache(conn)
+    try:
+        run_interactive_app(conn)
+    finally:
+        # Write any buffered completions before the connection goes away
+        storage.disable_write_behind(conn)
+        conn.close()
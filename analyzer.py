@@ -1,13 +1,59 @@
+import bisect
+import collections
 import datetime
+import heapq
+import itertools
+import periods
+from models import WindowStats, WindowSummary
+
+# NumPy is optional; batch_streaks falls back to pure Python without it. It is
+# imported on first use, as it takes longer to import than the rest of the app.
+_NOT_IMPORTED = object()
+np = _NOT_IMPORTED
+
+
+def _numpy():
+    """Returns the numpy module, or None when it is not installed."""
+    global np
+    if np is _NOT_IMPORTED:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        np = numpy
+    return np
+
+
+# Completions are mapped to period ordinals through the periodicity registry
+# in periods.py. The periodicity is looked up once per habit, and its ordinal
+# function is then applied to every completion without further branching.
+# Periodicities needing several days per period (periods.TimesPerWeek) go
+# through Periodicity.completed_ordinals over sorted day indexes instead.
+
+
+def _day_function(compact):
+    """Maps a completion to its day index: epoch seconds when compact, otherwise a datetime."""
+    return periods.day_index if compact else periods.day_of_datetime
+
+
+def _completed_ordinals(completions, period, compact):
+    """Returns the ascending ordinals of a habit's completed periods, from completions in any order."""
+    return period.completed_ordinals(sorted(map(_day_function(compact), completions)))
 
 
 def calculate_streak(completions, periodicity):
     """
     Calculates the longest run streak for a given list of completion dates.
 
+    Each completion is mapped to an integer period ordinal once, and completions
+    falling in the same period collapse into one. Input in ascending order, as
+    storage.load_habits_for_user returns it, is handled in a single pass; other
+    input is sorted first.
+
     Args:
-        completions (list): A list of datetime objects for completions.
-        periodicity (str): "daily" or "weekly".
+        completions (list): A list of datetime objects for completions, or of
+            integer epoch seconds as loaded by storage.load_compact_habits_for_user.
+        periodicity (str): A periodicity registered in periods, e.g. "daily".
 
     Returns:
         int: The longest streak count.
@@ -15,74 +61,271 @@ def calculate_streak(completions, periodicity):
     if not completions:
         return 0
 
-    # Sort completions and remove duplicates
-    sorted_completions = sorted(list(set(completions)))
-    max_streak = 0
-    current_streak = 0
-
-    def get_period_start(date, period):
-        if period == "daily":
-            return date.date()
-        elif period == "weekly":
-            # For weekly, we find the start of the week (Monday)
-            return date.date() - datetime.timedelta(days=date.weekday())
-        return None
+    period = periods.get_periodicity(periodicity)
+    if period is None:
+        # Unknown periodicities have no notion of consecutive periods
+        return 1
+    compact = isinstance(completions[0], int)
+    if period.required > 1:
+        return _scan_runs(_completed_ordinals(completions, period, compact))[0]
 
-    for i in range(len(sorted_completions)):
-        current_date = sorted_completions[i]
+    to_ordinal = period.ordinal_function(compact)
+    runs = _scan_runs(map(to_ordinal, completions))
+    if runs is None:
+        runs = _scan_runs(sorted(map(to_ordinal, completions)))
+    return runs[0]
 
-        current_period_start = get_period_start(current_date, periodicity)
 
-        if i == 0:
-            current_streak = 1
+def _scan_runs(ordinals):
+    """
+    Scans an ascending iterable of ordinals, counting repeats once.
+    Returns (longest run, length of the final run), or None as soon as an
+    ordinal goes backwards.
+    """
+    longest = 0
+    current = 0
+    previous = None
+    for ordinal in ordinals:
+        if ordinal == previous:
+            continue
+        if previous is None or ordinal > previous + 1:
+            current = 1
+        elif ordinal == previous + 1:
+            current += 1
         else:
-            prev_date = sorted_completions[i - 1]
-            prev_period_start = get_period_start(prev_date, periodicity)
+            return None
+        if current > longest:
+            longest = current
+        previous = ordinal
+    return longest, current
+
+
+def streak_from_periods(period_indexes):
+    """
+    Returns the longest run of consecutive period indexes.
+
+    Args:
+        period_indexes (list): Integer period indexes, e.g. the lists returned by
+            storage.load_completion_periods; repeats are allowed. Ascending input
+            is handled in a single pass.
+
+    Returns:
+        int: The longest streak count.
+    """
+    runs = _scan_runs(period_indexes)
+    if runs is None:
+        runs = _scan_runs(sorted(period_indexes))
+    return runs[0]
+
+
+def _completion_values(habit):
+    """Returns a habit's completions, as the epochs array for a models.CompactHabit."""
+    epochs = getattr(habit, "epochs", None)
+    return habit.completions if epochs is None else epochs
+
+
+def habit_period_arrays(habits):
+    """
+    Flattens the completions of many habits into one list of period ordinals.
+
+    Habit i owns periods[offsets[i]:offsets[i + 1]]. Completions of a habit with
+    an unknown periodicity all map to one ordinal, so its streak is 1, as with
+    calculate_streak.
+
+    Returns:
+        tuple: (periods, offsets) as lists of ints, ready for batch_streaks.
+    """
+    flat = []
+    offsets = [0]
+    for h in habits:
+        completions = _completion_values(h)
+        if completions:
+            period = periods.get_periodicity(h.periodicity)
+            compact = isinstance(completions[0], int)
+            if period is None:
+                flat.extend([0] * len(completions))
+            elif period.required > 1:
+                flat.extend(_completed_ordinals(completions, period, compact))
+            else:
+                flat.extend(map(period.ordinal_function(compact), completions))
+        offsets.append(len(flat))
+    return flat, offsets
 
-            # Check if current completion is in the next consecutive period
-            if periodicity == "daily":
-                expected_prev_day = current_date.date() - datetime.timedelta(days=1)
-                if prev_period_start == expected_prev_day:
-                    current_streak += 1
-                elif prev_period_start != current_period_start:
-                    current_streak = 1
-            elif periodicity == "weekly":
-                expected_prev_week_start = current_period_start - datetime.timedelta(weeks=1)
-                if prev_period_start == expected_prev_week_start:
-                    current_streak += 1
-                elif prev_period_start != current_period_start:
-                    current_streak = 1
 
-        if current_streak > max_streak:
-            max_streak = current_streak
+def batch_streaks(periods, offsets):
+    """
+    Computes the longest and current streak of many habits at once.
+
+    Uses vectorised NumPy run-length operations when NumPy is installed and a
+    pure Python scan otherwise; both give the same result.
+
+    Args:
+        periods (sequence): Flat integer period ordinals of all habits, in any
+            order within a habit and with repeats allowed.
+        offsets (sequence): len(habits) + 1 boundaries into `periods`; habit i
+            owns periods[offsets[i]:offsets[i + 1]].
+
+    Returns:
+        tuple: (longest, current) lists with one int per habit. The current
+        streak is the length of the run ending at the habit's latest period.
+    """
+    if _numpy() is not None:
+        return _batch_streaks_numpy(periods, offsets)
+    return _batch_streaks_python(periods, offsets)
+
+
+def _batch_streaks_python(periods, offsets):
+    longest = []
+    current = []
+    for start, end in zip(offsets, offsets[1:]):
+        segment = periods[start:end]
+        runs = _scan_runs(segment)
+        if runs is None:
+            runs = _scan_runs(sorted(segment))
+        longest.append(runs[0])
+        current.append(runs[1])
+    return longest, current
 
-    return max_streak
+
+def _batch_streaks_numpy(periods, offsets):
+    p = np.asarray(periods, dtype=np.int64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    num_habits = len(offsets) - 1
+    longest = np.zeros(num_habits, dtype=np.int64)
+    current = np.zeros(num_habits, dtype=np.int64)
+    if p.size == 0:
+        return longest.tolist(), current.tolist()
+
+    # Habit index of every element
+    seg = np.repeat(np.arange(num_habits), np.diff(offsets))
+    same_habit = seg[1:] == seg[:-1]
+    if np.any(same_habit & (p[1:] < p[:-1])):
+        order = np.lexsort((p, seg))
+        p = p[order]
+        same_habit = seg[1:] == seg[:-1]  # seg is already grouped, so it is unchanged by the sort
+
+    # Collapse repeated periods within a habit
+    keep = np.ones(p.size, dtype=bool)
+    keep[1:] = ~(same_habit & (p[1:] == p[:-1]))
+    p = p[keep]
+    seg = seg[keep]
+
+    # A run starts at each habit boundary and wherever the period is not previous + 1
+    run_start = np.ones(p.size, dtype=bool)
+    run_start[1:] = (seg[1:] != seg[:-1]) | (p[1:] != p[:-1] + 1)
+    run_starts = np.flatnonzero(run_start)
+    run_len = np.diff(np.append(run_starts, p.size))
+    run_seg = seg[run_starts]
+
+    # Runs are grouped by habit; reduce each habit's group of runs
+    first_run = np.flatnonzero(np.r_[True, run_seg[1:] != run_seg[:-1]])
+    last_run = np.append(first_run[1:], run_len.size) - 1
+    habits_with_runs = run_seg[first_run]
+    longest[habits_with_runs] = np.maximum.reduceat(run_len, first_run)
+    current[habits_with_runs] = run_len[last_run]
+    return longest.tolist(), current.tolist()
+
+
+def _longest_streaks(habits):
+    """
+    Returns the longest streak of each habit, in order. Persisted streak summaries
+    loaded by storage are used as-is; the remaining habits go through batch_streaks.
+    """
+    streaks = []
+    missing = []
+    for i, h in enumerate(habits):
+        summary = getattr(h, "streak_summary", None)
+        if summary is not None:
+            streaks.append(summary.longest_streak)
+        else:
+            streaks.append(0)
+            missing.append(i)
+    if missing:
+        computed, _ = batch_streaks(*habit_period_arrays([habits[i] for i in missing]))
+        for i, streak in zip(missing, computed):
+            streaks[i] = streak
+    return streaks
 
 
 def longest_streak(habits):
     """Return the longest streak across all habits."""
-    longest = 0
-    for h in habits:
-        streak = calculate_streak(h.completions, h.periodicity)
-        if streak > longest:
-            longest = streak
-    return longest
+    return max(_longest_streaks(list(habits)), default=0)
 
 
 def longest_streak_for_habit(habit):
     """Return the longest streak for a given habit."""
-    return calculate_streak(habit.completions, habit.periodicity)
+    summary = getattr(habit, "streak_summary", None)
+    if summary is not None:
+        return summary.longest_streak
+    return calculate_streak(_completion_values(habit), habit.periodicity)
 
 
 def habits_by_periodicity(habits, periodicity):
-    """Return all habits matching a periodicity (daily/weekly)."""
+    """
+    Return all habits matching a periodicity (daily/weekly).
+    storage.load_habits_by_periodicity answers the same question in SQL.
+    """
     return [h for h in habits if h.periodicity == periodicity]
 
 
+def current_streak_for_habit(habit):
+    """Return the length of the run ending at a habit's latest period."""
+    summary = getattr(habit, "streak_summary", None)
+    if summary is not None:
+        return summary.current_streak
+    _, current = batch_streaks(*habit_period_arrays([habit]))
+    return current[0]
+
+
+def _rank_key(metric):
+    """
+    Builds the ranking key for top_k_streaks: a higher metric ranks first, and
+    ties go to the lower habit_id. Items without an id rank after those with one
+    and otherwise keep their input order.
+    """
+    def key(item):
+        habit_id = item.habit_id
+        return metric(item), (-habit_id if habit_id is not None else float("-inf"))
+    return key
+
+
+def top_k_streaks(habits, k, metric=longest_streak_for_habit):
+    """
+    Return the k highest-ranked habits by a streak metric, best first.
+
+    The metric is evaluated exactly once per habit and only a k-element heap is
+    kept, so `habits` may be any iterable, including a stream.
+
+    Args:
+        habits (iterable): Habits, or any objects with a habit_id attribute that
+            `metric` accepts (e.g. the rows of storage.iter_streak_summaries).
+        k (int): How many entries to return.
+        metric (callable): Maps an item to the number it is ranked by.
+
+    Returns:
+        list: At most k items; ties are broken by ascending habit_id.
+    """
+    return heapq.nlargest(k, habits, key=_rank_key(metric))
+
+
 def top_5_streaks(habits):
     """Return the top 5 habits with longest streaks."""
-    # Use the corrected function to get the streak
-    return sorted(habits, key=lambda h: longest_streak_for_habit(h), reverse=True)[:5]
+    return top_k_streaks(habits, 5)
+
+
+def streak_leaderboard(entries, k=10, metric="longest_streak"):
+    """
+    Return the top k streak summaries across all users.
+
+    Args:
+        entries (iterable): StreakLeaderboardEntry rows, typically streamed from
+            storage.iter_streak_summaries.
+        k (int): How many entries to return.
+        metric (str): "longest_streak" or "current_streak".
+    """
+    if metric not in ("longest_streak", "current_streak"):
+        raise ValueError(f"Unknown leaderboard metric: {metric}")
+    return top_k_streaks(entries, k, metric=lambda entry: getattr(entry, metric))
 
 
 def get_last_completion(completions):
@@ -90,8 +333,236 @@ def get_last_completion(completions):
     return max(completions) if completions else None
 
 
-def habits_missed_last_week(habits):
-    """Return habits not completed in the last 7 days."""
-    cutoff = datetime.datetime.now() - datetime.timedelta(days=7)
+def habits_missed_last_week(habits, cutoff=None):
+    """
+    Return habits not completed in the last 7 days, or since `cutoff` when given.
+    storage.load_habits_missed_since answers the same question in SQL.
+    """
+    if cutoff is None:
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=7)
     # Corrected to use the new get_last_completion helper function
-    return [h for h in habits if not get_last_completion(h.completions) or get_last_completion(h.completions) < cutoff]
\ No newline at end of file
+    return [h for h in habits if not get_last_completion(h.completions) or get_last_completion(h.completions) < cutoff]
+
+
+# --- Streaming consumers ---
+# These take habits as streamed by storage.iter_habits_for_user, whose
+# completions are one-shot iterators in ascending order. Each habit is read
+# once and only a few values are kept per habit, so histories of any size are
+# analysed in constant memory.
+
+def streak_runs(completions, periodicity):
+    """
+    Returns the (longest, current) streak of completions in ascending order,
+    reading them exactly once.
+
+    Raises:
+        ValueError: If the completions are not in ascending order.
+    """
+    iterator = iter(completions)
+    first = next(iterator, None)
+    if first is None:
+        return 0, 0
+    period = periods.get_periodicity(periodicity)
+    if period is None:
+        return 1, 1
+    compact = isinstance(first, int)
+    completions = itertools.chain((first,), iterator)
+    if period.required > 1:
+        ordinals = period.completed_ordinals(map(_day_function(compact), completions))
+    else:
+        ordinals = map(period.ordinal_function(compact), completions)
+    runs = _scan_runs(ordinals)
+    if runs is None:
+        raise ValueError("Streamed completions must be in ascending order.")
+    return runs
+
+
+def iter_streaks(habits):
+    """
+    Yields (habit, longest streak, current streak) for each habit. A habit's
+    streak summary is used when it has one, and its completions are not read.
+    """
+    for habit in habits:
+        summary = getattr(habit, "streak_summary", None)
+        if summary is not None:
+            yield habit, summary.longest_streak, summary.current_streak
+        else:
+            yield (habit, *streak_runs(habit.completions, habit.periodicity))
+
+
+def longest_streak_streamed(habits):
+    """Return the longest streak across a stream of habits."""
+    return max((longest for _, longest, _ in iter_streaks(habits)), default=0)
+
+
+def iter_last_completions(habits):
+    """Yields (habit, last completion or None) for each habit of a stream."""
+    for habit in habits:
+        last = collections.deque(habit.completions, maxlen=1)
+        yield habit, last[0] if last else None
+
+
+def iter_habits_missed(habits, cutoff=None):
+    """
+    Yields the habits of a stream not completed in the last 7 days, or since
+    `cutoff` when given, like habits_missed_last_week.
+    """
+    if cutoff is None:
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=7)
+    cutoff_epoch = periods.to_epoch(cutoff)
+    for habit, last in iter_last_completions(habits):
+        if last is None or last < (cutoff_epoch if isinstance(last, int) else cutoff):
+            yield habit
+
+
+# --- Windowed analytics ---
+# Windows are measured in a habit's own periods: the exact ordinals of its
+# periodicity (Periodicity.to_ordinal), day indexes for daily habits and week
+# indexes for weekly ones, the same ordinals as storage.load_completion_periods
+# reads from the rollups. A habit's statistics
+# come from one pass over its sorted ordinals inside the window, plus one for the
+# worst rolling adherence, so the cost follows the number of completed periods,
+# not the length of the window.
+
+def period_indexes(habit, since=None):
+    """
+    Returns the ascending ordinals of a habit's completed periods, as
+    storage.load_completion_periods returns them; with `since`, a date, only
+    those from the period containing it on, so a windowed report maps the
+    completions inside its window rather than the whole history. The habit's
+    periodicity must be registered.
+    """
+    completions = _completion_values(habit)
+    if not completions:
+        return []
+    period = periods.get_periodicity(habit.periodicity)
+    compact = isinstance(completions[0], int)
+    if since is not None:
+        first_day = period.first_day(period.to_ordinal(periods.day_of_date(since)))
+        bound = first_day * periods.SECONDS_PER_DAY if compact else periods.EPOCH + datetime.timedelta(days=first_day)
+        completions = [c for c in completions if c >= bound]
+    return list(_completed_ordinals(completions, period, compact))
+
+
+def window_bounds(periodicity, start, end):
+    """
+    Returns the (first, last) period ordinals of a periodicity from the date
+    `start` to the date `end`, inclusive.
+    """
+    period = periods.get_periodicity(periodicity)
+    if period is None:
+        raise ValueError(f"Windowed analytics need a registered periodicity, not {periodicity!r}.")
+    return period.to_ordinal(periods.day_of_date(start)), period.to_ordinal(periods.day_of_date(end))
+
+
+def window_stats(ordinals, first, last, rolling=7, habit_id=None):
+    """
+    Computes a habit's statistics over the periods `first` to `last`, inclusive.
+
+    Args:
+        ordinals (list): The habit's ascending, distinct period indexes; those
+            outside the window are skipped with a binary search.
+        rolling (int): Length of the rolling window, in periods, that the
+            adherence figures are taken over; capped at the window length.
+
+    Returns:
+        WindowStats: current_streak is the run reaching the last period, or the
+        one before it, since the last period may still be under way. breaks
+        counts the missed stretches between completed periods, and mean_gap the
+        average distance between consecutive completed periods.
+        recent_adherence is the completed share of the final `rolling` periods
+        and worst_adherence the lowest share over any `rolling` consecutive
+        periods of the window.
+    """
+    total = last - first + 1
+    if total <= 0:
+        raise ValueError("A window needs at least one period.")
+    inside = ordinals[bisect.bisect_left(ordinals, first):bisect.bisect_right(ordinals, last)]
+    k = min(rolling, total)
+    recent_from = last - k + 1
+
+    longest = run = breaks = recent = 0
+    previous = None
+    for ordinal in inside:
+        if previous is not None and ordinal == previous + 1:
+            run += 1
+        else:
+            if previous is not None:
+                breaks += 1
+            run = 1
+        if run > longest:
+            longest = run
+        if ordinal >= recent_from:
+            recent += 1
+        previous = ordinal
+    completed = len(inside)
+    current = run if previous is not None and previous >= last - 1 else 0
+    mean_gap = (inside[-1] - inside[0]) / (completed - 1) if completed > 1 else None
+    return WindowStats(habit_id, total, completed, completed / total, current, longest, breaks, mean_gap,
+                       recent / k, _lowest_window_count(inside, first, last, k) / k)
+
+
+def _lowest_window_count(inside, first, last, k):
+    """
+    Returns the fewest completed periods in any k consecutive periods from
+    `first` to `last`, given the ascending, distinct periods `inside` them.
+    """
+    # The count of the window ending at period e only drops when a completed
+    # period o leaves it, at e = o + k, so the lowest count is the first
+    # window's or one right after such a drop. Both indexes only move forward.
+    first_end = first + k - 1
+    upto = bisect.bisect_right(inside, first_end)
+    lowest = upto
+    for left, ordinal in enumerate(inside, 1):
+        end = ordinal + k
+        if end > last:
+            break
+        if end <= first_end:
+            continue
+        while upto < len(inside) and inside[upto] <= end:
+            upto += 1
+        lowest = min(lowest, upto - left)
+    return lowest
+
+
+def window_reports(habits, start, end, period_lists=None, rolling=7):
+    """
+    Computes WindowStats for each habit over the dates `start` to `end`,
+    inclusive. A habit's window starts no earlier than the period it was
+    created in, and habits created after `end` or of unregistered
+    periodicities are left out.
+
+    Args:
+        period_lists (dict): habit_id -> period indexes, as returned by
+            storage.load_completion_periods, which only needs to load them
+            from `start` on. When None the indexes are taken from each habit's
+            completions with period_indexes, from the window's start on.
+    """
+    reports = []
+    for habit in habits:
+        if periods.get_periodicity(habit.periodicity) is None:
+            continue
+        since = max(start, habit.created_at.date())
+        first, last = window_bounds(habit.periodicity, since, end)
+        if first > last:
+            continue
+        ordinals = period_indexes(habit, since) if period_lists is None else period_lists.get(habit.habit_id, [])
+        reports.append(window_stats(ordinals, first, last, rolling, habit.habit_id))
+    return reports
+
+
+def summarize_window(reports):
+    """
+    Combines WindowStats of many habits. completion_rate weighs every period
+    equally; mean_completion_rate weighs every habit equally.
+    """
+    total = sum(r.periods for r in reports)
+    completed = sum(r.completed for r in reports)
+    return WindowSummary(
+        len(reports), total, completed,
+        completed / total if total else 0.0,
+        sum(r.completion_rate for r in reports) / len(reports) if reports else 0.0,
+        max((r.current_streak for r in reports), default=0),
+        sum(r.breaks for r in reports),
+        min((r.worst_adherence for r in reports), default=0.0),
+    )
@@ -0,0 +1,181 @@
+"""
+Asyncio facade over the storage module.
+
+All writes go through one dedicated writer thread that owns its own connection.
+Writes queued while it is busy are group-committed: they run in a single
+transaction, each under its own savepoint so that one failing call does not
+undo the others, and their awaiting coroutines resume only after the commit.
+Reads run on a small thread pool of pooled connections, so neither an fsync nor
+a long history load blocks the event loop.
+"""
+import asyncio
+import concurrent.futures
+import queue
+import threading
+
+import passwords
+import storage
+
+# Sentinel queued by close() to stop the writer thread
+_STOP = object()
+
+
+class AsyncStorage:
+    """
+    Non-blocking access to a habit tracker database from asyncio code.
+
+    Mirrors register_user, login_user, save_habit, save_completion and
+    load_habits_for_user from storage, without the connection argument.
+    """
+
+    def __init__(self, path=storage.DATABASE_NAME, read_pool_size=4, max_batch=512, **pragmas):
+        if path == ":memory:":
+            raise ValueError("AsyncStorage needs a database file shared by its writer and readers.")
+        self.path = path
+        self.max_batch = max_batch
+        self.batches_committed = 0
+        self.writes_committed = 0
+
+        conn = storage.get_db_connection(path, **pragmas)
+        storage.create_tables(conn)
+        conn.close()
+
+        self._pool = storage.ConnectionPool(path, size=read_pool_size, **pragmas)
+        self._readers = concurrent.futures.ThreadPoolExecutor(max_workers=read_pool_size,
+                                                              thread_name_prefix="storage-reader")
+        self._writes = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, args=(pragmas,),
+                                        name="storage-writer", daemon=True)
+        self._writer.start()
+        self._closed = False
+
+    # --- Writer thread ---
+    def _write_loop(self, pragmas):
+        conn = storage.get_db_connection(self.path, **pragmas)
+        try:
+            while True:
+                item = self._writes.get()
+                if item is _STOP:
+                    return
+                batch = [item]
+                stop = False
+                while len(batch) < self.max_batch:
+                    try:
+                        item = self._writes.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stop = True
+                        break
+                    batch.append(item)
+                self._commit_batch(conn, batch)
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def _commit_batch(self, conn, batch):
+        """Runs a batch of writes in one transaction and resolves their futures after commit."""
+        outcomes = []
+        try:
+            with storage.unit_of_work(conn):
+                for loop, future, func, args in batch:
+                    conn.execute("SAVEPOINT async_write")
+                    try:
+                        outcomes.append((func(conn, *args), None))
+                    except Exception as exc:
+                        conn.execute("ROLLBACK TO async_write")
+                        outcomes.append((None, exc))
+                    conn.execute("RELEASE async_write")
+        except Exception as exc:
+            outcomes = [(None, exc)] * len(batch)
+        else:
+            self.batches_committed += 1
+            self.writes_committed += len(batch)
+        for (loop, future, _, _), (result, exc) in zip(batch, outcomes):
+            loop.call_soon_threadsafe(_resolve, future, result, exc)
+
+    # --- Submission helpers ---
+    async def _write(self, func, *args):
+        if self._closed:
+            raise RuntimeError("AsyncStorage is closed.")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._writes.put((loop, future, func, args))
+        return await future
+
+    async def _read(self, func, *args):
+        if self._closed:
+            raise RuntimeError("AsyncStorage is closed.")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, self._run_read, func, args)
+
+    def _run_read(self, func, args):
+        with self._pool.connection() as conn:
+            return func(conn, *args)
+
+    # --- Storage API ---
+    async def register_user(self, username, password, full_name, email):
+        """
+        Registers a new user. Returns True on success, False if the username exists.
+        The password is hashed on the KDF pool; only the insert goes to the writer.
+        """
+        if self._closed:
+            raise RuntimeError("AsyncStorage is closed.")
+        password_hash = await asyncio.get_running_loop().run_in_executor(passwords.kdf_pool(),
+                                                                         storage.hash_password, password)
+        return await self._write(storage.save_user, username, password_hash, full_name, email)
+
+    async def login_user(self, username, password):
+        """
+        Authenticates a user. Returns the user's ID on success, None on failure.
+        The password is verified on a reader; only the rehash of an outdated
+        hash goes to the writer.
+        """
+        verified = await self._read(storage.verify_login, username, password)
+        if verified is None:
+            return None
+        user_id, stored, rehashed = verified
+        if rehashed is not None:
+            await self._write(storage.save_rehashed_password, username, password, user_id, stored, rehashed)
+        return user_id
+
+    async def save_habit(self, user_id, habit):
+        """Saves a new habit for a user. Returns the new habit ID."""
+        return await self._write(storage.save_habit, user_id, habit)
+
+    async def save_completion(self, habit_id, timestamp):
+        """Saves a completion; returns once the batch containing it is committed."""
+        return await self._write(storage.save_completion, habit_id, timestamp)
+
+    async def load_habits_for_user(self, user_id):
+        """Loads all habits of a user. Returns a list of Habit objects."""
+        return await self._read(storage.load_habits_for_user, user_id)
+
+    # --- Lifecycle ---
+    async def close(self):
+        """Commits the writes already queued, then stops the writer and the readers."""
+        if self._closed:
+            return
+        self._closed = True
+        self._writes.put(_STOP)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._writer.join)
+        self._readers.shutdown(wait=True)
+        self._pool.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+def _resolve(future, result, exc):
+    """Completes a future on its event loop unless the awaiting task gave up on it."""
+    if future.cancelled():
+        return
+    if exc is not None:
+        future.set_exception(exc)
+    else:
+        future.set_result(result)
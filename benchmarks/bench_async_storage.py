@@ -0,0 +1,73 @@
+"""
+Benchmark: completions per second through AsyncStorage with 1, 10 and 100
+concurrent asyncio clients, next to synchronous storage.save_completion calls
+that commit one by one. Both run with synchronous=NORMAL (the default) and with
+synchronous=FULL, where every commit waits for an fsync.
+
+Run from the project root:
+    python benchmarks/bench_async_storage.py [completions_per_run]
+"""
+import asyncio
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import storage  # noqa: E402
+from async_storage import AsyncStorage  # noqa: E402
+from models import Habit  # noqa: E402
+
+START = datetime.datetime(2025, 1, 1, 8, 0)
+
+
+def sync_rate(path, total, synchronous):
+    conn = storage.get_db_connection(path, synchronous=synchronous)
+    storage.create_tables(conn)
+    storage.register_user(conn, "bench", "bench", "Bench User", "bench@example.com")
+    user_id = storage.login_user(conn, "bench", "bench")
+    habit_id = storage.save_habit(conn, user_id, Habit("Read", "daily"))
+    start = time.perf_counter()
+    for i in range(total):
+        storage.save_completion(conn, habit_id, START + datetime.timedelta(minutes=i))
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return total / elapsed
+
+
+async def async_rate(path, total, clients, synchronous):
+    async with AsyncStorage(path, synchronous=synchronous) as db:
+        await db.register_user("bench", "bench", "Bench User", "bench@example.com")
+        user_id = await db.login_user("bench", "bench")
+        habit_ids = [await db.save_habit(user_id, Habit(f"Habit {i}", "daily")) for i in range(clients)]
+        per_client = total // clients
+
+        async def client(habit_id):
+            for i in range(per_client):
+                await db.save_completion(habit_id, START + datetime.timedelta(minutes=i))
+
+        batches_before = db.batches_committed
+        start = time.perf_counter()
+        await asyncio.gather(*(client(habit_id) for habit_id in habit_ids))
+        elapsed = time.perf_counter() - start
+        batches = db.batches_committed - batches_before
+    return per_client * clients / elapsed, per_client * clients / batches
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    print(f"{'synchronous':<11} {'mode':<6} {'clients':>7} {'completions/s':>14} {'writes/commit':>14}")
+    for synchronous in ("NORMAL", "FULL"):
+        with tempfile.TemporaryDirectory() as tmp:
+            rate = sync_rate(os.path.join(tmp, "sync.db"), total, synchronous)
+            print(f"{synchronous:<11} {'sync':<6} {1:>7} {rate:>14,.0f} {1:>14}")
+            for clients in (1, 10, 100):
+                rate, per_commit = asyncio.run(async_rate(os.path.join(tmp, f"async_{clients}.db"), total,
+                                                          clients, synchronous))
+                print(f"{synchronous:<11} {'async':<6} {clients:>7} {rate:>14,.0f} {per_commit:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
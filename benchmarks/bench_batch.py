@@ -0,0 +1,98 @@
+"""
+Benchmark: commands per second of the batch runner (batch.py) against a local
+database file, for a scripted ingestion stream: a few users registering and
+logging in, adding habits, then mostly log commands with an occasional query.
+The stream is run in-process with batch.run_batch at several transaction sizes,
+and once end to end through `Main.py batch FILE`, start-up included.
+
+Run from the project root:
+    python benchmarks/bench_batch.py
+"""
+import datetime
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import batch  # noqa: E402
+import storage  # noqa: E402
+
+USERS = 10
+HABITS_PER_USER = 10
+LOGS = 200_000
+QUERY_EVERY = 10_000
+BATCH_SIZES = (1000, 10_000, 100_000)
+
+
+def setup_stream():
+    """Registers and logs in the users and adds their habits; dominated by the password KDF."""
+    lines = []
+    for u in range(USERS):
+        lines.append({"op": "register", "username": f"user{u}", "password": f"password-{u}"})
+        lines.append({"op": "login", "username": f"user{u}", "password": f"password-{u}"})
+        for h in range(HABITS_PER_USER):
+            lines.append({"op": "add_habit", "name": f"habit{h}", "periodicity": "daily" if h % 3 else "weekly"})
+    return [json.dumps(line) + "\n" for line in lines]
+
+
+def ingestion_stream():
+    """Log commands spread over every habit, with a query now and then."""
+    lines = []
+    start = datetime.datetime(2024, 1, 1, 7)
+    habits = USERS * HABITS_PER_USER
+    for i in range(LOGS):
+        habit = i % habits
+        at = start + datetime.timedelta(hours=i // habits * 6)
+        lines.append({"op": "log", "user": f"user{habit // HABITS_PER_USER}",
+                      "habit": f"habit{habit % HABITS_PER_USER}", "at": at.isoformat()})
+        if i % QUERY_EVERY == QUERY_EVERY - 1:
+            lines.append({"op": "query", "user": f"user{habit // HABITS_PER_USER}"})
+    return [json.dumps(line) + "\n" for line in lines]
+
+
+def timed_run(conn, lines, batch_size):
+    """Returns commands per second of one run."""
+    out = io.StringIO()
+    start = time.perf_counter()
+    commands, failures = batch.run_batch(conn, lines, out, batch_size)
+    elapsed = time.perf_counter() - start
+    assert failures == 0, out.getvalue()[:1000]
+    return commands / elapsed
+
+
+def main():
+    setup, ingestion = setup_stream(), ingestion_stream()
+    print(f"setup: {len(setup):,} commands; ingestion: {len(ingestion):,} commands, {LOGS:,} of them log")
+    print(f"{'runner':<24} {'setup cmds/s':>13} {'ingestion cmds/s':>17}")
+    with tempfile.TemporaryDirectory() as directory:
+        for batch_size in BATCH_SIZES:
+            conn = storage.get_db_connection(os.path.join(directory, f"batch-{batch_size}.db"))
+            storage.create_tables(conn)
+            setup_rate = timed_run(conn, setup, batch_size)
+            ingestion_rate = timed_run(conn, ingestion, batch_size)
+            conn.close()
+            print(f"{f'in-process, batch {batch_size:,}':<24} {setup_rate:>13,.0f} {ingestion_rate:>17,.0f}")
+
+        path = os.path.join(directory, "main.db")
+        files = []
+        for name, lines in (("setup", setup), ("ingestion", ingestion)):
+            files.append(os.path.join(directory, f"{name}.jsonl"))
+            with open(files[-1], "w", encoding="utf-8") as f:
+                f.writelines(lines)
+        rates = []
+        for file, lines in zip(files, (setup, ingestion)):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "Main.py", "--db", path, "batch", file], check=True, cwd=ROOT,
+                           stdout=subprocess.DEVNULL)
+            rates.append(len(lines) / (time.perf_counter() - start))
+        print(f"{'Main.py batch':<24} {rates[0]:>13,.0f} {rates[1]:>17,.0f}")
+
+
+if __name__ == "__main__":
+    main()
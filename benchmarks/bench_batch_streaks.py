@@ -0,0 +1,68 @@
+"""
+Benchmark: longest/current streaks for every habit, computed with a Python loop
+of calculate_streak against analyzer.batch_streaks (pure Python and NumPy).
+
+Sizes follow fixtures.load_complex_test_data (1000 habits, 90 daily / 20 weekly
+periods at 85% / 70% completion) and a 100k-habit scale-up. Completions are
+compact epoch seconds so the 100k case fits comfortably in memory.
+
+Run from the project root:
+    python benchmarks/bench_batch_streaks.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import analyzer  # noqa: E402
+from models import Habit  # noqa: E402
+
+DAY = 86400
+START = 1_735_722_000  # 2025-01-01T09:00:00 wall clock
+
+
+def make_habits(count):
+    rng = random.Random(count)
+    habits = []
+    for i in range(count):
+        if i % 2 == 0:
+            completions = [START + d * DAY for d in range(90) if rng.random() < 0.85]
+            habits.append(Habit(f"Daily {i}", "daily", completions=completions))
+        else:
+            completions = [START + w * 7 * DAY for w in range(20) if rng.random() < 0.7]
+            habits.append(Habit(f"Weekly {i}", "weekly", completions=completions))
+    return habits
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    numpy_module = analyzer._numpy()
+    print(f"{'habits':>7} {'loop (ms)':>10} {'flatten (ms)':>13} {'batch py (ms)':>14} {'batch numpy (ms)':>17}")
+    for count in (1000, 100_000):
+        habits = make_habits(count)
+        loop, loop_ms = timed(lambda: [analyzer.calculate_streak(h.completions, h.periodicity) for h in habits])
+        (flat, offsets), flatten_ms = timed(lambda: analyzer.habit_period_arrays(habits))
+
+        analyzer.np = None
+        (py_longest, _), py_ms = timed(lambda: analyzer.batch_streaks(flat, offsets))
+        analyzer.np = numpy_module
+        assert py_longest == loop
+
+        if numpy_module is None:
+            numpy_cell = "n/a"
+        else:
+            (np_longest, _), np_ms = timed(lambda: analyzer.batch_streaks(flat, offsets))
+            assert np_longest == loop
+            numpy_cell = f"{np_ms:.1f}"
+        print(f"{count:>7} {loop_ms:>10.1f} {flatten_ms:>13.1f} {py_ms:>14.1f} {numpy_cell:>17}")
+
+
+if __name__ == "__main__":
+    main()
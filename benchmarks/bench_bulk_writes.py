@@ -0,0 +1,70 @@
+"""
+Benchmark: rows per second for per-row saves (one commit each) against the
+batched save_habits_bulk / save_completions_bulk path (one transaction).
+
+Run from the project root:
+    python benchmarks/bench_bulk_writes.py
+"""
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import storage  # noqa: E402
+from models import Habit  # noqa: E402
+
+
+def fresh_connection(tmp, name):
+    conn = storage.get_db_connection(os.path.join(tmp, name))
+    storage.create_tables(conn)
+    storage.register_user(conn, "bench", "bench", "Bench User", "bench@example.com")
+    return conn, storage.login_user(conn, "bench", "bench")
+
+
+def rate(rows, seconds):
+    return rows / seconds if seconds else float("inf")
+
+
+def main():
+    start = datetime.datetime(2025, 1, 1, 8, 0, 0)
+    print(f"{'kind':<12} {'rows':>7} {'per-row (rows/s)':>17} {'bulk (rows/s)':>14} {'speedup':>8}")
+    for num_habits, completions_per_habit in ((50, 20), (200, 50)):
+        with tempfile.TemporaryDirectory() as tmp:
+            habits = [Habit(f"Habit {i}", "daily", created_at=start) for i in range(num_habits)]
+
+            # Per-row path: every call commits
+            conn, user_id = fresh_connection(tmp, "per_row.db")
+            t0 = time.perf_counter()
+            habit_ids = [storage.save_habit(conn, user_id, h) for h in habits]
+            t1 = time.perf_counter()
+            for habit_id in habit_ids:
+                for d in range(completions_per_habit):
+                    storage.save_completion(conn, habit_id, start + datetime.timedelta(days=d))
+            t2 = time.perf_counter()
+            conn.close()
+            per_row_habits, per_row_completions = t1 - t0, t2 - t1
+
+            # Bulk path: executemany inside one transaction
+            conn, user_id = fresh_connection(tmp, "bulk.db")
+            t0 = time.perf_counter()
+            habit_ids = storage.save_habits_bulk(conn, user_id, habits)
+            t1 = time.perf_counter()
+            storage.save_completions_bulk(conn, ((habit_id, start + datetime.timedelta(days=d))
+                                                 for habit_id in habit_ids
+                                                 for d in range(completions_per_habit)))
+            t2 = time.perf_counter()
+            conn.close()
+            bulk_habits, bulk_completions = t1 - t0, t2 - t1
+
+        num_completions = num_habits * completions_per_habit
+        for kind, rows, slow, fast in (("habits", num_habits, per_row_habits, bulk_habits),
+                                       ("completions", num_completions, per_row_completions, bulk_completions)):
+            print(f"{kind:<12} {rows:>7} {rate(rows, slow):>17,.0f} {rate(rows, fast):>14,.0f} "
+                  f"{slow / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark: storage.save_completion with completions in SQLite against the same
+calls with a completion_log.CompletionLog attached, then per-habit range scans
+and storage.load_habits_for_user over the data written.
+
+Both databases are files in a temporary directory with the default pragmas, and
+every SQLite save_completion commits on its own, as in the CLI. The log is
+opened with sync=False (see CompletionLog); pass "sync" to fsync every append.
+
+Run from the project root:
+    python benchmarks/bench_completion_log.py [habits] [completions per habit] [sync]
+"""
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import storage  # noqa: E402
+from models import Habit  # noqa: E402
+
+
+def setup(directory, num_habits, log_options):
+    conn = storage.get_db_connection(os.path.join(directory, "habits.db"))
+    storage.create_tables(conn)
+    if log_options is not None:
+        storage.attach_completion_log(conn, os.path.join(directory, "log"), **log_options)
+    storage.register_user(conn, "bench", "bench", "Bench User", "bench@example.com")
+    user_id = storage.login_user(conn, "bench", "bench")
+    habit_ids = storage.save_habits_bulk(conn, user_id, [Habit(f"Habit {i}", "daily") for i in range(num_habits)])
+    return conn, user_id, habit_ids
+
+
+def workload(habit_ids, completions_per_habit):
+    """One completion per habit per day, habits interleaved as real users log them."""
+    start = datetime.datetime(2024, 1, 1, 7, 0, 0)
+    return [(habit_id, start + datetime.timedelta(days=d, seconds=i))
+            for d in range(completions_per_habit)
+            for i, habit_id in enumerate(habit_ids)]
+
+
+def run(num_habits, completions_per_habit, log_options):
+    with tempfile.TemporaryDirectory() as directory:
+        conn, user_id, habit_ids = setup(directory, num_habits, log_options)
+        completions = workload(habit_ids, completions_per_habit)
+
+        began = time.perf_counter()
+        for habit_id, timestamp in completions:
+            storage.save_completion(conn, habit_id, timestamp)
+        append_seconds = time.perf_counter() - began
+
+        sample = random.Random(0).sample(habit_ids, min(len(habit_ids), 200))
+        began = time.perf_counter()
+        if log_options is None:
+            for habit_id in sample:
+                conn.execute("SELECT ts_epoch FROM completions WHERE habit_id = ? ORDER BY ts_epoch",
+                             (habit_id,)).fetchall()
+        else:
+            backend = storage._backend_of(conn)
+            for habit_id in sample:
+                backend.scan([habit_id])
+        scan_seconds = (time.perf_counter() - began) / len(sample)
+
+        began = time.perf_counter()
+        habits = storage.load_habits_for_user(conn, user_id)
+        load_seconds = time.perf_counter() - began
+        assert sum(len(h.completions) for h in habits) == len(completions)
+
+        storage.detach_completion_backend(conn)
+        conn.close()
+    return len(completions) / append_seconds, scan_seconds, load_seconds
+
+
+def main():
+    num_habits = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    completions_per_habit = int(sys.argv[2]) if len(sys.argv) > 2 else 365
+    sync = "sync" in sys.argv[3:]
+    total = num_habits * completions_per_habit
+    print(f"{num_habits} habits x {completions_per_habit} completions = {total:,} save_completion calls")
+    print(f"{'backend':<16} {'appends/s':>10} {'scan one habit (ms)':>20} {'load_habits_for_user (s)':>25}")
+    for label, options in (("sqlite", None), ("completion log", {"sync": sync})):
+        rate, scan, load = run(num_habits, completions_per_habit, options)
+        print(f"{label:<16} {rate:>10,.0f} {scan * 1000:>20.3f} {load:>25.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Stress benchmark: concurrent completion writers and habit readers against one
+database file, with the previous connection setup (one plain sqlite3.connect per
+thread, rollback journal, sqlite3's default settings) versus a
+storage.ConnectionPool of tuned WAL connections. The "nowait" rows repeat the
+previous setup with a zero busy timeout, as seen by clients that do not wait
+for locks at all.
+
+Reports operations per second and the share of operations that failed with
+"database is locked".
+
+Run from the project root:
+    python benchmarks/bench_concurrency.py [seconds_per_run]
+"""
+import datetime
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import storage  # noqa: E402
+from models import Habit  # noqa: E402
+
+
+def seed(path, journal_mode):
+    conn = storage.get_db_connection(path, journal_mode=journal_mode)
+    storage.create_tables(conn)
+    storage.register_user(conn, "bench", "bench", "Bench User", "bench@example.com")
+    user_id = storage.login_user(conn, "bench", "bench")
+    habit_ids = storage.save_habits_bulk(conn, user_id, [Habit(f"Habit {i}", "daily") for i in range(20)])
+    conn.close()
+    return user_id, habit_ids
+
+
+def run(open_connection, release, writers, readers, seconds, user_id, habit_ids):
+    stats = {"writes": 0, "reads": 0, "locked": 0, "attempts": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def work(kind, worker):
+        ops = locked = attempts = 0
+        n = 0
+        while time.perf_counter() < deadline:
+            conn = open_connection()
+            try:
+                attempts += 1
+                if kind == "writes":
+                    n += 1
+                    storage.save_completion(conn, habit_ids[(worker + n) % len(habit_ids)],
+                                            datetime.datetime(2025, 1, 1) + datetime.timedelta(minutes=n))
+                else:
+                    storage.load_habits_for_user(conn, user_id)
+                ops += 1
+            except sqlite3.OperationalError as exc:
+                if "locked" not in str(exc):
+                    raise
+                locked += 1
+                if conn.in_transaction:
+                    conn.rollback()
+            finally:
+                release(conn)
+        with lock:
+            stats[kind] += ops
+            stats["locked"] += locked
+            stats["attempts"] += attempts
+
+    threads = [threading.Thread(target=work, args=("writes", i)) for i in range(writers)]
+    threads += [threading.Thread(target=work, args=("reads", i)) for i in range(readers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return stats, elapsed
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3.0
+    print(f"{'mode':<8} {'writers':>7} {'readers':>7} {'writes/s':>9} {'reads/s':>9} {'locked %':>9}")
+    for writers, readers in ((1, 1), (4, 4), (8, 8)):
+        for mode in ("plain", "nowait", "pooled"):
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "stress.db")
+                if mode in ("plain", "nowait"):
+                    user_id, habit_ids = seed(path, "DELETE")
+                    timeout = 5.0 if mode == "plain" else 0
+                    # The previous get_db_connection, held by each thread for its lifetime
+                    local = threading.local()
+                    opened = []
+
+                    def open_connection():
+                        if not hasattr(local, "conn"):
+                            local.conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+                            local.conn.row_factory = sqlite3.Row
+                            # Not a setting: the rollup queries of save_completion call these
+                            storage.register_functions(local.conn)
+                            opened.append(local.conn)
+                        return local.conn
+
+                    def release(conn):
+                        pass
+
+                    stats, elapsed = run(open_connection, release, writers, readers, seconds, user_id, habit_ids)
+                    for conn in opened:
+                        conn.close()
+                else:
+                    user_id, habit_ids = seed(path, "WAL")
+                    pool = storage.ConnectionPool(path, size=writers + readers)
+                    stats, elapsed = run(pool.acquire, pool.release, writers, readers, seconds, user_id, habit_ids)
+                    pool.close()
+            locked_pct = 100 * stats["locked"] / stats["attempts"] if stats["attempts"] else 0
+            print(f"{mode:<8} {writers:>7} {readers:>7} {stats['writes'] / elapsed:>9.0f} "
+                  f"{stats['reads'] / elapsed:>9.0f} {locked_pct:>8.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark: a menu session of the interactive app, where every action loads the
+user's habits and some log a completion, with and without storage's habit cache.
+
+Run from the project root:
+    python benchmarks/bench_habit_cache.py
+"""
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import storage  # noqa: E402
+
+ACTIONS = 50
+
+
+def populate(conn, num_habits, completions_per_habit):
+    """Creates one user owning num_habits daily habits with the given history length."""
+    storage.register_user(conn, "bench", "bench", "Bench User", "bench@example.com")
+    user_id = storage.login_user(conn, "bench", "bench")
+    start = datetime.datetime(2020, 1, 1, 8, 0, 0)
+    cursor = conn.cursor()
+    habit_ids = []
+    for i in range(num_habits):
+        cursor.execute("INSERT INTO habits (user_id, name, periodicity, created_at, is_active) VALUES (?, ?, ?, ?, ?)",
+                       (user_id, f"Habit {i}", "daily", start.isoformat(), 1))
+        habit_ids.append(cursor.lastrowid)
+        storage.save_completions_bulk(conn, [(habit_ids[-1], start + datetime.timedelta(days=d))
+                                             for d in range(completions_per_habit)])
+    conn.commit()
+    return user_id, habit_ids
+
+
+def session(conn, user_id, habit_ids, completions_per_habit):
+    """ACTIONS menu actions; every other one logs a completion before the next load."""
+    day = datetime.datetime(2020, 1, 1, 20, 0) + datetime.timedelta(days=completions_per_habit)
+    for i in range(ACTIONS):
+        storage.load_habits_for_user(conn, user_id)
+        if i % 2:
+            storage.save_completion(conn, habit_ids[i % len(habit_ids)], day + datetime.timedelta(seconds=i))
+
+
+def main():
+    print(f"{'habits':>6} {'completions':>11} {'uncached (ms)':>14} {'cached (ms)':>12} {'speedup':>8} {'hits':>5} "
+          f"{'misses':>6}")
+    for num_habits, per_habit in ((10, 100), (20, 1000), (50, 2000)):
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = storage.get_db_connection(os.path.join(tmp, "bench.db"))
+            storage.create_tables(conn)
+            user_id, habit_ids = populate(conn, num_habits, per_habit)
+
+            start = time.perf_counter()
+            session(conn, user_id, habit_ids, per_habit)
+            uncached = (time.perf_counter() - start) * 1000
+
+            cache = storage.enable_habit_cache(conn)
+            start = time.perf_counter()
+            session(conn, user_id, habit_ids, per_habit + 1)
+            cached = (time.perf_counter() - start) * 1000
+            storage.disable_habit_cache(conn)
+            conn.close()
+        print(f"{num_habits:>6} {num_habits * per_habit:>11} {uncached:>14.1f} {cached:>12.1f} "
+              f"{uncached / cached:>7.1f}x {cache.hits:>5} {cache.misses:>6}")
+
+
+if __name__ == "__main__":
+    main()
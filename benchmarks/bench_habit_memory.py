@@ -0,0 +1,70 @@
+"""
+Benchmark: memory held by loaded habits, models.Habit (a list of datetimes per
+habit) against models.CompactHabit (__slots__ and an array of epoch seconds).
+
+Each habit gets `completions` daily completions, 90 by default as in
+fixtures.load_complex_test_data. Memory is the tracemalloc total still allocated
+after building the habits, so it covers the habit objects, their containers and
+every completion value. The 100k case with Habit holds over 400 MB and takes a
+few minutes under tracemalloc; pass smaller sizes to skip it.
+
+Run from the project root:
+    python benchmarks/bench_habit_memory.py [completions] [habit counts...]
+"""
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import periods  # noqa: E402
+from models import Habit, CompactHabit  # noqa: E402
+
+DAY = 86400
+START = 1_735_722_000  # 2025-01-01T09:00:00 wall clock
+
+
+def epochs_for(i, completions):
+    # Skip one day in seven so histories are not all identical runs
+    return [START + (i % 7) * 3600 + d * DAY for d in range(completions) if (d + i) % 7]
+
+
+def build_habits(count, completions):
+    return [Habit(f"Habit {i}", "daily", i, periods.from_epoch(START), True,
+                  [periods.from_epoch(e) for e in epochs_for(i, completions)])
+            for i in range(count)]
+
+
+def build_compact_habits(count, completions):
+    return [CompactHabit(f"Habit {i}", "daily", i, periods.from_epoch(START), True, epochs_for(i, completions))
+            for i in range(count)]
+
+
+def measure(build, count, completions):
+    """Returns the bytes still allocated by tracemalloc after `build` returns."""
+    gc.collect()
+    tracemalloc.start()
+    habits = build(count, completions)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del habits
+    gc.collect()
+    return current
+
+
+def main():
+    completions = int(sys.argv[1]) if len(sys.argv) > 1 else 90
+    counts = [int(arg) for arg in sys.argv[2:]] or [1000, 10_000, 100_000]
+    print(f"{completions} completions per habit")
+    print(f"{'habits':>7} {'Habit (MB)':>11} {'CompactHabit (MB)':>18} {'ratio':>6} {'bytes/completion':>17}")
+    for count in counts:
+        full = measure(build_habits, count, completions)
+        compact = measure(build_compact_habits, count, completions)
+        total = sum(len(epochs_for(i, completions)) for i in range(count))
+        print(f"{count:>7} {full / 1e6:>11.1f} {compact / 1e6:>18.1f} {full / compact:>6.1f} "
+              f"{full / total:>8.1f} / {compact / total:<6.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark: load latency of storage.load_habits_for_user against habit count and
+completions per habit, compared with the previous one-query-per-habit loader and
+with storage.load_compact_habits_for_user, which skips datetime parsing.
+
+Run from the project root:
+    python benchmarks/bench_load_habits.py
+"""
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import storage  # noqa: E402
+from models import Habit  # noqa: E402
+
+
+def load_habits_n_plus_one(conn, user_id):
+    """The original loader: one completions query per habit row."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM habits WHERE user_id = ?", (user_id,))
+    habits = []
+    for row in cursor.fetchall():
+        completions_cursor = conn.cursor()
+        completions_cursor.execute("SELECT timestamp FROM completions WHERE habit_id = ? ORDER BY timestamp",
+                                   (row['habit_id'],))
+        completions = [datetime.datetime.fromisoformat(c['timestamp']) for c in completions_cursor.fetchall()]
+        habits.append(Habit(row['name'], row['periodicity'], row['habit_id'], row['created_at'],
+                            row['is_active'], completions))
+    return habits
+
+
+def populate(conn, num_habits, completions_per_habit):
+    """Creates one user owning num_habits daily habits with the given history length."""
+    storage.register_user(conn, "bench", "bench", "Bench User", "bench@example.com")
+    user_id = storage.login_user(conn, "bench", "bench")
+    start = datetime.datetime(2025, 1, 1, 8, 0, 0)
+    cursor = conn.cursor()
+    for i in range(num_habits):
+        cursor.execute("INSERT INTO habits (user_id, name, periodicity, created_at, is_active) VALUES (?, ?, ?, ?, ?)",
+                       (user_id, f"Habit {i}", "daily", start.isoformat(), 1))
+        habit_id = cursor.lastrowid
+        storage.save_completions_bulk(conn, [(habit_id, start + datetime.timedelta(days=d))
+                                             for d in range(completions_per_habit)])
+    conn.commit()
+    return user_id
+
+
+def best_of(func, repeat=5):
+    """Returns the fastest wall-clock time of func() in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    print(f"{'habits':>7} {'compl/habit':>11} {'N+1 (ms)':>10} {'batched (ms)':>12} {'speedup':>8} "
+          f"{'compact (ms)':>12}")
+    for num_habits in (10, 100, 1000):
+        for completions_per_habit in (0, 10, 90):
+            with tempfile.TemporaryDirectory() as tmp:
+                conn = storage.get_db_connection(os.path.join(tmp, "bench.db"))
+                storage.create_tables(conn)
+                user_id = populate(conn, num_habits, completions_per_habit)
+                old = best_of(lambda: load_habits_n_plus_one(conn, user_id))
+                new = best_of(lambda: storage.load_habits_for_user(conn, user_id))
+                compact = best_of(lambda: storage.load_compact_habits_for_user(conn, user_id))
+                conn.close()
+            print(f"{num_habits:>7} {completions_per_habit:>11} {old:>10.2f} {new:>12.2f} {old / new:>7.1f}x "
+                  f"{compact:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
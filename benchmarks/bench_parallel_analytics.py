@@ -0,0 +1,71 @@
+"""
+Benchmark: parallel_analytics.global_analytics over every user of a database
+with 1, 2, 4 and 8 worker processes.
+
+Each user gets `habits` daily habits with `completions` completions each, and
+the streak summaries are deleted afterwards so that every worker recomputes
+streaks from the completions, which is the CPU-bound case. Speedup can only
+reach the number of CPUs, printed first.
+
+Run from the project root:
+    python benchmarks/bench_parallel_analytics.py [users] [habits per user] [completions per habit]
+"""
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import parallel_analytics  # noqa: E402
+import periods  # noqa: E402
+import storage  # noqa: E402
+from models import Habit  # noqa: E402
+
+DAY_MICROS = 86400 * 1000000
+
+
+def populate(conn, num_users, habits_per_user, completions_per_habit):
+    start = datetime.datetime(2024, 1, 1, 7, 0, 0)
+    base = periods.to_epoch_micros(start)
+    for u in range(num_users):
+        storage.register_user(conn, f"user{u}", "bench", f"User {u}", f"user{u}@example.com")
+        user_id = storage.login_user(conn, f"user{u}", "bench")
+        habit_ids = storage.save_habits_bulk(conn, user_id, [Habit(f"Habit {i}", "daily", created_at=start)
+                                                              for i in range(habits_per_user)])
+        # Every ninth day is skipped so streaks break up into runs
+        storage.import_completions(conn, ((habit_id, base + d * DAY_MICROS + (habit_id % 3600) * 1000000)
+                                          for habit_id in habit_ids
+                                          for d in range(completions_per_habit + completions_per_habit // 8)
+                                          if d % 9 != 8),
+                                   {habit_id: habit_id for habit_id in habit_ids})
+    conn.execute("DELETE FROM habit_streaks")
+    conn.commit()
+
+
+def main():
+    num_users = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    habits_per_user = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    completions_per_habit = int(sys.argv[3]) if len(sys.argv) > 3 else 365
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "analytics.db")
+        conn = storage.get_db_connection(path)
+        storage.create_tables(conn)
+        populate(conn, num_users, habits_per_user, completions_per_habit)
+        conn.close()
+
+        print(f"{os.cpu_count()} CPUs, {num_users} users x {habits_per_user} habits x "
+              f"~{completions_per_habit} completions")
+        print(f"{'workers':>7} {'seconds':>8} {'speedup':>8} {'completions/s':>14}")
+        baseline = None
+        for workers in (1, 2, 4, 8):
+            began = time.perf_counter()
+            result = parallel_analytics.global_analytics(path, workers=workers)
+            seconds = time.perf_counter() - began
+            baseline = baseline or seconds
+            print(f"{workers:>7} {seconds:>8.2f} {baseline / seconds:>8.2f} {result.completions / seconds:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmark: logins per second against password KDF cost, logging users in one
+at a time with storage.login_user, as one burst with storage.login_users (KDFs
+on the passwords thread pool), and repeated with the login cache enabled.
+
+The thread pool only helps with more than one CPU; see the CPU count printed.
+
+Run from the project root:
+    python benchmarks/bench_passwords.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import passwords  # noqa: E402
+import storage  # noqa: E402
+
+USERS = 16
+COSTS = [
+    ("scrypt n=2^12", {"scheme": passwords.SCRYPT, "n": 2 ** 12, "r": 8, "p": 1}),
+    ("scrypt n=2^14", {"scheme": passwords.SCRYPT, "n": 2 ** 14, "r": 8, "p": 1}),
+    ("pbkdf2 100k", {"scheme": passwords.PBKDF2, "iterations": 100_000}),
+    ("pbkdf2 600k", {"scheme": passwords.PBKDF2, "iterations": 600_000}),
+]
+
+
+def populate(conn, parameters):
+    credentials = [(f"user{i}", f"password-{i}") for i in range(USERS)]
+    for username, password in credentials:
+        conn.execute("INSERT INTO users (username, password) VALUES (?, ?)",
+                     (username, passwords.hash_password(password, parameters)))
+    conn.commit()
+    return credentials
+
+
+def rate(func):
+    start = time.perf_counter()
+    func()
+    return USERS / (time.perf_counter() - start)
+
+
+def main():
+    print(f"{os.cpu_count()} CPU(s), {passwords.KDF_WORKERS} KDF worker thread(s), {USERS} users")
+    print(f"{'KDF':<16} {'sequential/s':>13} {'burst/s':>9} {'cached/s':>10}")
+    for label, parameters in COSTS:
+        conn = storage.get_db_connection(":memory:")
+        storage.create_tables(conn)
+        credentials = populate(conn, parameters)
+        # Keep stored hashes as they are, so every round runs the same KDF
+        passwords.KDF_PARAMETERS = parameters
+        sequential = rate(lambda: [storage.login_user(conn, *pair) for pair in credentials])
+        burst = rate(lambda: storage.login_users(conn, credentials))
+        storage.enable_login_cache()
+        storage.login_users(conn, credentials)
+        cached = rate(lambda: [storage.login_user(conn, *pair) for pair in credentials])
+        storage.disable_login_cache()
+        conn.close()
+        print(f"{label:<16} {sequential:>13,.0f} {burst:>9,.0f} {cached:>10,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Micro-benchmark: streaks through the periodicity registry against the previous
+two-periodicity dispatch table, for daily and weekly histories as datetimes and
+as compact epoch seconds, plus the periodicities the registry adds.
+
+The baseline is the calculate_streak that looked its ordinal function up in a
+dict keyed by (periodicity, compact), copied here verbatim. Both look the
+periodicity up once per habit, so the registry should cost the same per
+completion; the many-habits rows show the per-habit lookup cost.
+
+Run from the project root:
+    python benchmarks/bench_periodicity.py
+"""
+import datetime
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import analyzer  # noqa: E402
+import periods  # noqa: E402
+
+_PERIOD_ORDINALS = {
+    ("daily", False): datetime.date.toordinal,
+    ("weekly", False): lambda ts: (ts.toordinal() - 1) // 7,
+    ("daily", True): periods.day_index,
+    ("weekly", True): periods.epoch_week,
+}
+
+
+def baseline_calculate_streak(completions, periodicity):
+    if not completions:
+        return 0
+
+    to_ordinal = _PERIOD_ORDINALS.get((periodicity, isinstance(completions[0], int)))
+    if to_ordinal is None:
+        # Unknown periodicities have no notion of consecutive periods
+        return 1
+
+    runs = analyzer._scan_runs(map(to_ordinal, completions))
+    if runs is None:
+        runs = analyzer._scan_runs(sorted(map(to_ordinal, completions)))
+    return runs[0]
+
+
+def history(length, seed=0):
+    """A history of `length` completions, mostly one per day, with occasional misses."""
+    rng = random.Random(seed)
+    start = datetime.datetime(2020, 1, 1, 7, 0)
+    return [start + datetime.timedelta(days=d, hours=rng.randrange(12))
+            for d in range(int(length / 0.9)) if rng.random() < 0.9][:length]
+
+
+def per_call_us(func, *args):
+    timer = timeit.Timer(lambda: func(*args))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=5, number=number)) / number * 1e6
+
+
+def many_habits(func, histories, periodicity):
+    for completions in histories:
+        func(completions, periodicity)
+
+
+def main():
+    print(f"{'case':>28} {'previous (us)':>14} {'registry (us)':>14} {'ratio':>6}")
+    for length in (90, 10000):
+        completions = history(length)
+        epochs = [periods.to_epoch(ts) for ts in completions]
+        for form, data in (("datetime", completions), ("compact", epochs)):
+            for periodicity in ("daily", "weekly"):
+                old = per_call_us(baseline_calculate_streak, data, periodicity)
+                new = per_call_us(analyzer.calculate_streak, data, periodicity)
+                print(f"{f'{length} {form} {periodicity}':>28} {old:>14.1f} {new:>14.1f} {new / old:>5.2f}x")
+
+    # Per-habit dispatch dominates when habits are short
+    histories = [[periods.to_epoch(ts) for ts in history(5, seed)] for seed in range(10000)]
+    for periodicity in ("daily", "weekly"):
+        old = per_call_us(many_habits, baseline_calculate_streak, histories, periodicity) / 1000
+        new = per_call_us(many_habits, analyzer.calculate_streak, histories, periodicity) / 1000
+        print(f"{f'10000 habits x 5 {periodicity}':>28} {old:>11.1f} ms {new:>11.1f} ms {new / old:>5.2f}x")
+
+    print(f"\n{'periodicity':>28} {'10000 datetimes (us)':>21} {'10000 compact (us)':>19}")
+    completions = history(10000)
+    epochs = [periods.to_epoch(ts) for ts in completions]
+    for periodicity in ("3x-weekly", "monthly", "every-3-days"):
+        dt = per_call_us(analyzer.calculate_streak, completions, periodicity)
+        compact = per_call_us(analyzer.calculate_streak, epochs, periodicity)
+        print(f"{periodicity:>28} {dt:>21.1f} {compact:>19.1f}")
+
+
+if __name__ == "__main__":
+    main()
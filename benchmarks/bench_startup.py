@@ -0,0 +1,94 @@
+"""
+Benchmark: cold-start latency of the non-interactive commands of Main.py
+(log, streak and list), each a fresh interpreter, against the bare interpreter
+and the imports the application used to load eagerly (NumPy, calendar,
+zoneinfo, concurrent.futures, pathlib and the completion log). The modules
+that take longest to import in `Main.py list`, as `python -X importtime`
+reports them, are listed after.
+
+Bytecode is compiled first, so the figures are those of an installed app
+rather than of its first run.
+
+Run from the project root:
+    python benchmarks/bench_startup.py
+"""
+import compileall
+import datetime
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import storage  # noqa: E402
+from models import Habit  # noqa: E402
+
+RUNS = 20
+HABITS = 20
+DAYS = 365
+EAGER_IMPORTS = "import storage, analyzer, numpy, calendar, zoneinfo, concurrent.futures, pathlib, completion_log"
+
+
+def populate(path):
+    conn = storage.get_db_connection(path)
+    storage.create_tables(conn)
+    storage.register_user(conn, "bench", "secret", "Bench User", "bench@example.com")
+    user_id = storage.find_user(conn, "bench")
+    habits = [Habit(f"habit{i}", "daily" if i % 2 else "weekly") for i in range(HABITS)]
+    habit_ids = storage.save_habits_bulk(conn, user_id, habits)
+    today = datetime.datetime.combine(datetime.date.today(), datetime.time(8))
+    storage.save_completions_bulk(conn, [(habit_id, today - datetime.timedelta(days=day))
+                                         for habit_id in habit_ids for day in range(DAYS)])
+    conn.close()
+
+
+def median_ms(argv):
+    times = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        subprocess.run(argv, check=True, cwd=ROOT, stdout=subprocess.DEVNULL)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def slowest_imports(argv, count=8):
+    """Returns the (self µs, cumulative µs, module) lines of -X importtime with the highest cumulative time."""
+    stderr = subprocess.run([sys.executable, "-X", "importtime", *argv], check=True, cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True).stderr
+    rows = []
+    for line in stderr.splitlines()[1:]:
+        own, cumulative, name = line.removeprefix("import time:").split("|")
+        rows.append((int(own), int(cumulative), name.strip()))
+    return sorted(rows, key=lambda row: -row[1])[:count]
+
+
+def main():
+    compileall.compile_dir(ROOT, maxlevels=0, quiet=1)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "habits.db")
+        populate(path)
+        main_py = [sys.executable, "Main.py", "--db", path]
+        cases = [
+            ("python -c pass", [sys.executable, "-c", "pass"]),
+            ("eager imports", [sys.executable, "-c", EAGER_IMPORTS]),
+            ("import Main", [sys.executable, "-c", "import Main"]),
+            ("Main.py list", main_py + ["list", "--user", "bench"]),
+            ("Main.py streak", main_py + ["streak", "--user", "bench"]),
+            ("Main.py log", main_py + ["log", "--user", "bench", "habit1"]),
+        ]
+        print(f"{'command':<16} {'median (ms)':>12}")
+        for label, argv in cases:
+            print(f"{label:<16} {median_ms(argv):>12.1f}")
+
+        print("\nSlowest imports of Main.py list (-X importtime):")
+        print(f"{'self (ms)':>10} {'cumulative (ms)':>16}  module")
+        for own, cumulative, name in slowest_imports(main_py[1:] + ["list", "--user", "bench"]):
+            print(f"{own / 1000:>10.1f} {cumulative / 1000:>16.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
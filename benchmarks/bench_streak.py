@@ -0,0 +1,49 @@
+"""
+Micro-benchmark: analyzer.calculate_streak against the original implementation
+on sorted and shuffled completion histories of increasing length.
+
+Run from the project root:
+    python benchmarks/bench_streak.py
+"""
+import datetime
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from analyzer import calculate_streak  # noqa: E402
+from test_analyzer import reference_calculate_streak  # noqa: E402
+
+
+def history(length, per_day=1):
+    """A daily history with occasional misses and per_day completions on each day."""
+    rng = random.Random(length)
+    start = datetime.datetime(2020, 1, 1, 7, 0)
+    return [start + datetime.timedelta(days=d, hours=h)
+            for d in range(length // per_day) if rng.random() < 0.9
+            for h in range(per_day)]
+
+
+def per_call_us(func, completions, periodicity):
+    timer = timeit.Timer(lambda: func(completions, periodicity))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=5, number=number)) / number * 1e6
+
+
+def main():
+    print(f"{'completions':>11} {'order':>8} {'period':>7} {'original (us)':>14} {'new (us)':>9} {'speedup':>8}")
+    for length, per_day in ((90, 1), (1000, 1), (10000, 1), (10000, 4)):
+        completions = history(length, per_day)
+        shuffled = completions[:]
+        random.Random(0).shuffle(shuffled)
+        for order, data in (("sorted", completions), ("shuffled", shuffled)):
+            for periodicity in ("daily", "weekly"):
+                old = per_call_us(reference_calculate_streak, data, periodicity)
+                new = per_call_us(calculate_streak, data, periodicity)
+                print(f"{len(data):>11} {order:>8} {periodicity:>7} {old:>14.1f} {new:>9.1f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark: peak memory and time of the longest-streak and missed-habit queries
+over one user's full history, loaded with storage.load_habits_for_user against
+streamed with storage.iter_habits_for_user.
+
+Streak summaries are dropped from the stream so that every completion is
+read, which is the worst case for streaming.
+
+Run from the project root:
+    python benchmarks/bench_streaming.py [habits] [completions per habit]
+"""
+import datetime
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import analyzer  # noqa: E402
+import storage  # noqa: E402
+from models import Habit  # noqa: E402
+
+
+def populate(conn, num_habits, completions_per_habit):
+    storage.register_user(conn, "bench", "bench", "Bench User", "bench@example.com")
+    user_id = storage.login_user(conn, "bench", "bench")
+    start = datetime.datetime(2020, 1, 1, 8, 0, 0)
+    habit_ids = storage.save_habits_bulk(conn, user_id, [Habit(f"Habit {i}", "daily", created_at=start)
+                                                          for i in range(num_habits)])
+    storage.save_completions_bulk(conn, ((habit_id, start + datetime.timedelta(days=d + d // 30))
+                                         for habit_id in habit_ids
+                                         for d in range(completions_per_habit)))
+    return user_id
+
+
+def without_summaries(habits):
+    for habit in habits:
+        habit.streak_summary = None
+        yield habit
+
+
+def loaded(conn, user_id, cutoff):
+    habits = storage.load_habits_for_user(conn, user_id)
+    for habit in habits:
+        habit.streak_summary = None
+    return analyzer.longest_streak(habits), len(analyzer.habits_missed_last_week(habits, cutoff))
+
+
+def streamed(conn, user_id, cutoff):
+    longest = analyzer.longest_streak_streamed(without_summaries(storage.iter_habits_for_user(conn, user_id)))
+    missed = sum(1 for _ in analyzer.iter_habits_missed(storage.iter_habits_for_user(conn, user_id), cutoff))
+    return longest, missed
+
+
+def measure(func, *args):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    num_habits = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    completions_per_habit = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    cutoff = datetime.datetime(2025, 1, 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = storage.get_db_connection(os.path.join(tmp, "stream.db"))
+        storage.create_tables(conn)
+        user_id = populate(conn, num_habits, completions_per_habit)
+        print(f"{num_habits * completions_per_habit:,} completions over {num_habits} habits")
+        print(f"{'mode':<9} {'time (s)':>9} {'peak (MB)':>10}")
+        results = []
+        for label, func in (("loaded", loaded), ("streamed", streamed)):
+            result, elapsed, peak = measure(func, conn, user_id, cutoff)
+            results.append(result)
+            print(f"{label:<9} {elapsed:>9.2f} {peak / 1e6:>10.1f}")
+        assert results[0] == results[1]
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
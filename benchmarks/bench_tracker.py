@@ -0,0 +1,73 @@
+"""
+Benchmark: tracker.HabitTracker lookups, filters and deletes at 100k habits,
+compared with the original tracker that kept one list and scanned or rebuilt it
+for every call.
+
+Habit names repeat every 1000 habits, so a name matches 100 habits, and half of
+the habits are daily.
+
+Run from the project root:
+    python benchmarks/bench_tracker.py [habit count]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from habit import Habit  # noqa: E402
+from tracker import HabitTracker  # noqa: E402
+
+
+class ListHabitTracker:
+    """The original tracker: a plain list with linear scans."""
+
+    def __init__(self):
+        self.habits = []
+
+    def add_habit(self, name, periodicity, description=""):
+        habit = Habit(name, periodicity, description)
+        self.habits.append(habit)
+        return habit
+
+    def find_by_name(self, name):
+        return [h for h in self.habits if h.name == name]
+
+    def list_habits(self, periodicity=None):
+        if periodicity:
+            return [h for h in self.habits if h.periodicity == periodicity]
+        return self.habits
+
+    def delete_habit(self, name):
+        self.habits = [h for h in self.habits if h.name != name]
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for i in range(repeat):
+        func(i)
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def run(tracker, count):
+    start = time.perf_counter()
+    for i in range(count):
+        tracker.add_habit(f"Habit {i % 1000}", "daily" if i % 2 else "weekly")
+    add_ms = (time.perf_counter() - start) * 1000
+    find_ms = timed(lambda i: tracker.find_by_name(f"Habit {i}"), 100)
+    filter_ms = timed(lambda i: tracker.list_habits("daily"), 10)
+    delete_ms = timed(lambda i: tracker.delete_habit(f"Habit {i}"), 100)
+    return add_ms, find_ms, filter_ms, delete_ms
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    print(f"{count} habits; per-call times except for adding all habits")
+    print(f"{'tracker':>8} {'add all (ms)':>13} {'find name (ms)':>15} {'filter (ms)':>12} {'delete name (ms)':>17}")
+    for label, tracker in (("list", ListHabitTracker()), ("indexed", HabitTracker())):
+        add_ms, find_ms, filter_ms, delete_ms = run(tracker, count)
+        print(f"{label:>8} {add_ms:>13.1f} {find_ms:>15.3f} {filter_ms:>12.3f} {delete_ms:>17.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark: export and import throughput of transfer.py for each format, in
+completion rows per second and file megabytes per second.
+
+The dataset has one user and 10M completions by default: 10,000 daily habits
+with 1,000 completions each at varying times of day. It is generated straight
+into SQLite with storage.import_completions. Pass a smaller total to shorten
+the run.
+
+Run from the project root:
+    python benchmarks/bench_transfer.py [completions]
+"""
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import periods  # noqa: E402
+import storage  # noqa: E402
+import transfer  # noqa: E402
+from models import Habit  # noqa: E402
+
+COMPLETIONS_PER_HABIT = 1000
+DAY_MICROS = 86400 * 1000000
+
+
+def populate(conn, total):
+    storage.register_user(conn, "bench", "bench", "Bench User", "bench@example.com")
+    user_id = storage.login_user(conn, "bench", "bench")
+    num_habits = max(1, total // COMPLETIONS_PER_HABIT)
+    start = datetime.datetime(2020, 1, 1)
+    habit_ids = storage.save_habits_bulk(conn, user_id, [Habit(f"Habit {i}", "daily", created_at=start)
+                                                          for i in range(num_habits)])
+    rng = random.Random(total)
+    base = periods.to_epoch_micros(start)
+
+    def rows():
+        for habit_id in habit_ids:
+            for day in range(COMPLETIONS_PER_HABIT):
+                yield habit_id, base + day * DAY_MICROS + rng.randrange(DAY_MICROS)
+
+    storage.import_completions(conn, rows(), {habit_id: habit_id for habit_id in habit_ids})
+    return num_habits * COMPLETIONS_PER_HABIT
+
+
+def size_of(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    with tempfile.TemporaryDirectory() as tmp:
+        source = storage.get_db_connection(os.path.join(tmp, "source.db"))
+        storage.create_tables(source)
+        t0 = time.perf_counter()
+        rows = populate(source, total)
+        print(f"{rows:,} completions generated in {time.perf_counter() - t0:.1f} s "
+              f"(database {size_of(os.path.join(tmp, 'source.db')) / 1e6:.0f} MB)")
+        print(f"{'format':<7} {'size (MB)':>10} {'export rows/s':>14} {'export MB/s':>12} "
+              f"{'import rows/s':>14} {'import MB/s':>12}")
+        for fmt in transfer.FORMATS:
+            path = os.path.join(tmp, f"export.{fmt}")
+            t0 = time.perf_counter()
+            transfer.export_data(source, path, fmt)
+            export_s = time.perf_counter() - t0
+            size = size_of(path)
+
+            target_path = os.path.join(tmp, f"import_{fmt}.db")
+            target = storage.get_db_connection(target_path)
+            storage.create_tables(target)
+            t0 = time.perf_counter()
+            counts = transfer.import_data(target, path, fmt)
+            import_s = time.perf_counter() - t0
+            assert counts["completions"] == rows
+            target.close()
+            os.remove(target_path)
+
+            print(f"{fmt:<7} {size / 1e6:>10.1f} {rows / export_s:>14,.0f} {size / 1e6 / export_s:>12.1f} "
+                  f"{rows / import_s:>14,.0f} {size / 1e6 / import_s:>12.1f}")
+        source.close()
+
+
+if __name__ == "__main__":
+    main()
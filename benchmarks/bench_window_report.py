@@ -0,0 +1,69 @@
+"""
+Benchmark: the windowed completion report of Main.analyze_habits_cli for one
+user with many habits, from the rollups (storage.load_completion_periods) and
+from habits already loaded in memory.
+
+Half the habits are daily with a completion on about 85% of `days` days, and
+half weekly over the same span, as in fixtures.load_complex_test_data.
+
+Run from the project root:
+    python benchmarks/bench_window_report.py [habits] [days]
+"""
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import analyzer  # noqa: E402
+import storage  # noqa: E402
+from models import Habit  # noqa: E402
+
+
+def populate(conn, num_habits, days, end):
+    storage.register_user(conn, "bench", "bench", "Bench User", "bench@example.com")
+    user_id = storage.login_user(conn, "bench", "bench")
+    start = end - datetime.timedelta(days=days)
+    habits = [Habit(f"Habit {i}", "daily" if i % 2 == 0 else "weekly", created_at=start) for i in range(num_habits)]
+    habit_ids = storage.save_habits_bulk(conn, user_id, habits)
+    rng = random.Random(0)
+    storage.save_completions_bulk(conn, ((habit_id, start + datetime.timedelta(days=d, hours=8))
+                                         for habit, habit_id in zip(habits, habit_ids)
+                                         for d in range(days)
+                                         if (habit.periodicity == "daily" or d % 7 == 0) and rng.random() < 0.85))
+    return user_id
+
+
+def timed(function, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        began = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - began)
+    return best, result
+
+
+def main():
+    num_habits = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 365
+    end = datetime.date(2025, 6, 30)
+    conn = storage.get_db_connection(":memory:")
+    storage.create_tables(conn)
+    user_id = populate(conn, num_habits, days, datetime.datetime.combine(end, datetime.time()))
+    habits = storage.load_habits_for_user(conn, user_id)
+    print(f"{num_habits} habits, {sum(len(h.completions) for h in habits):,} completions over {days} days")
+    print(f"{'window (days)':>13} {'rollups (ms)':>13} {'in memory (ms)':>15} {'completion rate':>16}")
+    for window in (7, 30, 90, days):
+        start = end - datetime.timedelta(days=window - 1)
+        from_rollups, reports = timed(lambda: analyzer.window_reports(
+            habits, start, end, storage.load_completion_periods(conn, user_id, start)))
+        in_memory, _ = timed(lambda: analyzer.window_reports(habits, start, end))
+        summary = analyzer.summarize_window(reports)
+        print(f"{window:>13} {from_rollups * 1000:>13.1f} {in_memory * 1000:>15.1f} {summary.completion_rate:>16.0%}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+An append-only, memory-mapped completion log: an alternative to the SQLite
+completions table for write-heavy workloads (see storage.attach_completion_log).
+
+Completions are split over shards by habit_id. Each shard is a log file of
+fixed-width records, two little-endian int64s (habit_id, wall-clock epoch
+microseconds), after a 16-byte header holding a magic number and a generation.
+Appending a completion is one write() of one record.
+
+A shard's log starts with a sorted segment, ordered by (habit_id, time) and
+described by an index file that maps each habit_id to its run of records.
+Records appended since are the unsorted tail, which is also kept in memory
+grouped by habit. A habit's completions are read through a memoryview slice of
+the mapped sorted segment, without copying the shard, plus its tail records. Compaction merges the tail into the sorted
+segment and rewrites the index once the tail reaches `compact_every` records.
+
+Compaction writes a new log and index under temporary names and renames them
+into place. The index records the generation of the log it describes, so after
+a crash between the two renames the mismatch is detected and the shard is
+compacted again from its log. A torn record at the end of a log is dropped when
+the shard is opened.
+"""
+import array
+import heapq
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b"HTLOGv1\n"
+_HEADER = struct.Struct("<8sq")  # magic, generation
+_RECORD = struct.Struct("<qq")  # habit_id, epoch microseconds
+_INDEX_HEADER = struct.Struct("<8sqq")  # magic, log generation, sorted records
+_INDEX_ENTRY = struct.Struct("<qqq")  # habit_id, first record, record count
+INDEX_MAGIC = b"HTIDXv1\n"
+
+
+class _Shard:
+    """One log file, its index and a read-only mapping of it."""
+
+    def __init__(self, log_path, index_path, sync):
+        self.log_path = log_path
+        self.index_path = index_path
+        self.sync = sync
+        self._open()
+
+    def _open(self):
+        if not os.path.exists(self.log_path):
+            self._write_log(self.log_path, 0, ())
+        with open(self.log_path, "r+b") as f:
+            magic, self.generation = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"Not a completion log: {self.log_path}")
+            size = f.seek(0, os.SEEK_END)
+            torn = (size - _HEADER.size) % _RECORD.size
+            if torn:
+                f.truncate(size - torn)
+        self.fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND)
+        self.records = (os.path.getsize(self.log_path) - _HEADER.size) // _RECORD.size
+        self._mapping = None
+        self._mapped_records = 0
+        self.tail = {}
+        if not self._read_index():
+            self.index = {}
+            self.sorted_records = 0
+            self.compact()
+        elif self.tail_records:
+            view = self._view()
+            try:
+                tail = view[2 * self.sorted_records:]
+                flat = tail.tolist()
+                tail.release()
+                for habit_id, micros in zip(flat[::2], flat[1::2]):
+                    self.tail.setdefault(habit_id, []).append(micros)
+            finally:
+                view.release()
+
+    def _read_index(self):
+        """Loads the index; returns False if it is missing or describes another generation."""
+        try:
+            with open(self.index_path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return False
+        if len(data) < _INDEX_HEADER.size:
+            return False
+        magic, generation, sorted_records = _INDEX_HEADER.unpack_from(data)
+        if magic != INDEX_MAGIC or generation != self.generation or sorted_records > self.records:
+            return False
+        self.sorted_records = sorted_records
+        self.index = {habit_id: (first, count)
+                      for habit_id, first, count in _INDEX_ENTRY.iter_unpack(data[_INDEX_HEADER.size:])}
+        return True
+
+    @property
+    def tail_records(self):
+        return self.records - self.sorted_records
+
+    def append(self, records):
+        """Appends a list of (habit_id, micros) records with one write."""
+        os.write(self.fd, b"".join(map(_RECORD.pack, *zip(*records))))
+        if self.sync:
+            os.fsync(self.fd)
+        self.records += len(records)
+        for habit_id, micros in records:
+            self.tail.setdefault(habit_id, []).append(micros)
+
+    def _view(self):
+        """Returns the records as a flat int64 memoryview over the mapped log."""
+        if self._mapped_records != self.records:
+            self._close_mapping()
+            if self.records:
+                with open(self.log_path, "rb") as f:
+                    self._mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mapped_records = self.records
+        if self._mapping is None:
+            return memoryview(b"").cast("q")
+        view = memoryview(self._mapping)[_HEADER.size:_HEADER.size + self.records * _RECORD.size].cast("q")
+        if sys.byteorder == "big":
+            # The file is little-endian; fall back to a swapped copy
+            swapped = array.array("q", view.tobytes())
+            view.release()
+            swapped.byteswap()
+            return memoryview(swapped)
+        return view
+
+    def _close_mapping(self):
+        if self._mapping is not None:
+            self._mapping.close()
+            self._mapping = None
+
+    def scan(self, habit_ids):
+        """Returns {habit_id: ascending list of microseconds} for the given habits."""
+        result = {}
+        view = self._view() if self.sorted_records else None
+        try:
+            for habit_id in habit_ids:
+                run = self.index.get(habit_id)
+                # Every other int64 of the habit's run is a timestamp
+                values = view[2 * run[0] + 1:2 * (run[0] + run[1]):2].tolist() if run is not None else []
+                unsorted = self.tail.get(habit_id)
+                if unsorted:
+                    values = list(heapq.merge(values, sorted(unsorted)))
+                result[habit_id] = values
+        finally:
+            if view is not None:
+                view.release()
+        return result
+
+    def compact(self, keep=None):
+        """
+        Rewrites the log as one sorted segment with a fresh index. `keep`, if
+        given, is called with (habit_id, micros) and drops records it rejects.
+        """
+        view = self._view()
+        try:
+            flat = view.tolist()
+        finally:
+            view.release()
+        # The sorted segment is already in order; only the tail needs sorting
+        boundary = 2 * self.sorted_records
+        merged = heapq.merge(zip(flat[0:boundary:2], flat[1:boundary:2]),
+                             sorted(zip(flat[boundary::2], flat[boundary + 1::2])))
+        records = [record for record in merged if keep is None or keep(*record)]
+
+        generation = self.generation + 1
+        self._close_mapping()
+        os.close(self.fd)
+        self._write_log(self.log_path + ".tmp", generation, records)
+        index = {}
+        for position, (habit_id, _) in enumerate(records):
+            first, count = index.get(habit_id, (position, 0))
+            index[habit_id] = (first, count + 1)
+        self._write_index(self.index_path + ".tmp", generation, len(records), index)
+        os.replace(self.log_path + ".tmp", self.log_path)
+        os.replace(self.index_path + ".tmp", self.index_path)
+
+        self.generation = generation
+        self.index = index
+        self.tail = {}
+        self.records = self.sorted_records = len(records)
+        self.fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND)
+        self._mapped_records = -1
+        return len(flat) // 2 - len(records)
+
+    @staticmethod
+    def _write_log(path, generation, records):
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, generation))
+            f.write(b"".join(map(_RECORD.pack, *zip(*records))) if records else b"")
+            f.flush()
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def _write_index(path, generation, sorted_records, index):
+        with open(path, "wb") as f:
+            f.write(_INDEX_HEADER.pack(INDEX_MAGIC, generation, sorted_records))
+            f.write(b"".join(_INDEX_ENTRY.pack(habit_id, first, count)
+                             for habit_id, (first, count) in sorted(index.items())))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def close(self):
+        self._close_mapping()
+        os.close(self.fd)
+
+
+class CompletionLog:
+    """
+    Completions of many habits in `shards` append-only log files in `directory`.
+
+    Args:
+        directory (str): Created if missing. A directory must always be opened
+            with the same number of shards.
+        shards (int): Habits are assigned to shard habit_id % shards.
+        compact_every (int): Compact a shard once its unsorted tail holds this
+            many records.
+        sync (bool): fsync after every append. Without it appends survive a
+            crash of the process but not of the machine.
+    """
+
+    def __init__(self, directory, shards=8, compact_every=65536, sync=False):
+        if shards < 1:
+            raise ValueError("A completion log needs at least one shard.")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.compact_every = compact_every
+        self._shards = [_Shard(os.path.join(directory, f"shard-{i:03d}.log"),
+                               os.path.join(directory, f"shard-{i:03d}.idx"), sync)
+                        for i in range(shards)]
+
+    def _shard(self, habit_id):
+        return self._shards[habit_id % len(self._shards)]
+
+    def __len__(self):
+        return sum(shard.records for shard in self._shards)
+
+    def append(self, habit_id, micros):
+        """Appends one completion."""
+        shard = self._shard(habit_id)
+        shard.append([(habit_id, micros)])
+        if shard.tail_records >= self.compact_every:
+            shard.compact()
+
+    def append_many(self, rows):
+        """Appends (habit_id, micros) rows with one write per shard. Returns the number appended."""
+        by_shard = {}
+        for habit_id, micros in rows:
+            by_shard.setdefault(habit_id % len(self._shards), []).append((habit_id, micros))
+        for number, records in by_shard.items():
+            shard = self._shards[number]
+            shard.append(records)
+            if shard.tail_records >= self.compact_every:
+                shard.compact()
+        return sum(len(records) for records in by_shard.values())
+
+    def scan(self, habit_ids):
+        """Returns {habit_id: ascending list of epoch microseconds} for the given habits."""
+        by_shard = {}
+        for habit_id in habit_ids:
+            by_shard.setdefault(habit_id % len(self._shards), []).append(habit_id)
+        result = {}
+        for number, ids in by_shard.items():
+            result.update(self._shards[number].scan(ids))
+        return result
+
+    def delete(self, habit_id, micros=None):
+        """
+        Deletes a habit's completions at exactly `micros`, or all of them when it
+        is None, by compacting the habit's shard. Returns the number deleted.
+        """
+        if micros is None:
+            return self._shard(habit_id).compact(lambda h, m: h != habit_id)
+        return self._shard(habit_id).compact(lambda h, m: h != habit_id or m != micros)
+
+    def delete_habits(self, habit_ids):
+        """Deletes every completion of the given habits. Returns the number deleted."""
+        doomed = set(habit_ids)
+        deleted = 0
+        for number in {habit_id % len(self._shards) for habit_id in doomed}:
+            deleted += self._shards[number].compact(lambda h, m: h not in doomed)
+        return deleted
+
+    def compact(self):
+        """Compacts every shard."""
+        for shard in self._shards:
+            shard.compact()
+
+    def close(self):
+        for shard in self._shards:
+            shard.close()
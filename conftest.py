@@ -0,0 +1,9 @@
+import pytest
+
+import passwords
+
+
+@pytest.fixture(autouse=True)
+def cheap_password_kdf(monkeypatch):
+    """Keeps password hashing fast in tests that only need users to exist; test_passwords covers the KDFs."""
+    monkeypatch.setattr(passwords, "KDF_PARAMETERS", {"scheme": passwords.SCRYPT, "n": 2 ** 4, "r": 8, "p": 1})
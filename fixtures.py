@@ -3,15 +3,26 @@ import random
 import storage
 from habit import Habit
 
+FIXTURE_USERNAME = "FixtureUser"
+FIXTURE_PASSWORD = "fixtures"
 
-def load_complex_test_data(conn, num_habits=1000):
+
+def get_fixture_user(conn):
+    """Returns the ID of the user that owns generated fixture habits, registering it if needed."""
+    storage.register_user(conn, FIXTURE_USERNAME, FIXTURE_PASSWORD, "Fixture User", "fixtures@example.com")
+    return storage.login_user(conn, FIXTURE_USERNAME, FIXTURE_PASSWORD)
+
+
+def load_complex_test_data(conn, num_habits=1000, user_id=None):
     """
     Creates and saves a complex set of up to 1000 habits with varied
     completion data to the database for realistic testing.
+    Everything is written in a single transaction through the bulk save APIs.
 
     Args:
         conn: The database connection object.
         num_habits (int): The total number of habits to create.
+        user_id (int, optional): The owner of the habits. Defaults to the fixture user.
     """
     print(f"Generating and saving a complex test dataset of {num_habits} habits...")
 
@@ -32,65 +43,68 @@ def load_complex_test_data(conn, num_habits=1000):
     ]
 
     habits_to_create = []
+    today = datetime.datetime.now()
 
-    # Create a mix of daily and weekly habits
+    # Create a mix of daily and weekly habits, created when their history starts
     for i in range(num_habits):
         if i % 2 == 0:
             name = f"{random.choice(daily_habits_list)} ({i + 1})"
-            habits_to_create.append(Habit(name, "daily"))
+            habits_to_create.append(Habit(name, "daily", created_at=today - datetime.timedelta(days=89)))
         else:
             name = f"{random.choice(weekly_habits_list)} ({i + 1})"
-            habits_to_create.append(Habit(name, "weekly"))
+            habits_to_create.append(Habit(name, "weekly", created_at=today - datetime.timedelta(weeks=19)))
+
+    if user_id is None:
+        user_id = get_fixture_user(conn)
 
-    # Add each habit to the database
-    for habit in habits_to_create:
-        habit_id = storage.save_habit(conn, habit)
+    with storage.unit_of_work(conn):
+        habit_ids = storage.save_habits_bulk(conn, user_id, habits_to_create)
 
         # Generate varied completion data for each habit
         completions_to_add = []
-        today = datetime.datetime.now()
-
-        if habit.periodicity == "daily":
-            # Simulate a continuous streak with occasional missed days over a 3-month period
-            for d in range(90):
-                if random.random() < 0.85:  # 85% chance of completion
-                    completions_to_add.append(today - datetime.timedelta(days=d))
-        elif habit.periodicity == "weekly":
-            # Simulate a 20-week history
-            for w in range(20):
-                if random.random() < 0.7:  # 70% chance of completion
-                    completions_to_add.append(today - datetime.timedelta(weeks=w))
-
-        for comp_date in completions_to_add:
-            storage.save_completion(conn, habit_id, comp_date)
+        for habit, habit_id in zip(habits_to_create, habit_ids):
+            if habit.periodicity == "daily":
+                # Simulate a continuous streak with occasional missed days over a 3-month period
+                for d in range(90):
+                    if random.random() < 0.85:  # 85% chance of completion
+                        completions_to_add.append((habit_id, today - datetime.timedelta(days=d)))
+            elif habit.periodicity == "weekly":
+                # Simulate a 20-week history
+                for w in range(20):
+                    if random.random() < 0.7:  # 70% chance of completion
+                        completions_to_add.append((habit_id, today - datetime.timedelta(weeks=w)))
+
+        storage.save_completions_bulk(conn, completions_to_add)
 
     print(f"Generated and saved a complex dataset of {num_habits} habits.")
-    return storage.load_all_habits(conn)
+    return storage.load_habits_for_user(conn, user_id)
 
 
-def load_sample_habits(conn, num_daily=25, num_weekly=25, num_weeks=4):
+def load_sample_habits(conn, num_daily=25, num_weekly=25, num_weeks=4, user_id=None):
     """
     Creates and saves a simple set of sample habits for basic testing.
     Retained for compatibility with existing tests.
     """
     print("Generating and saving simple sample habits...")
-    habits = []
-
-    for i in range(1, num_daily + 1):
-        habit = Habit(name=f"Daily Habit {i}", periodicity="daily")
-        habit_id = storage.save_habit(conn, habit)
-        for d in range(num_weeks * 7):
-            completion_date = datetime.datetime.now() - datetime.timedelta(days=d)
-            storage.save_completion(conn, habit_id, completion_date)
-        habits.append(habit)
-
-    for i in range(1, num_weekly + 1):
-        habit = Habit(name=f"Weekly Habit {i}", periodicity="weekly")
-        habit_id = storage.save_habit(conn, habit)
-        for w in range(num_weeks):
-            completion_date = datetime.datetime.now() - datetime.timedelta(weeks=w)
-            storage.save_completion(conn, habit_id, completion_date)
-        habits.append(habit)
+    if user_id is None:
+        user_id = get_fixture_user(conn)
+
+    now = datetime.datetime.now()
+    created_at = now - datetime.timedelta(weeks=num_weeks)
+    habits = [Habit(name=f"Daily Habit {i}", periodicity="daily", created_at=created_at)
+              for i in range(1, num_daily + 1)]
+    habits += [Habit(name=f"Weekly Habit {i}", periodicity="weekly", created_at=created_at)
+               for i in range(1, num_weekly + 1)]
+
+    with storage.unit_of_work(conn):
+        habit_ids = storage.save_habits_bulk(conn, user_id, habits)
+        completions = []
+        for habit, habit_id in zip(habits, habit_ids):
+            if habit.periodicity == "daily":
+                completions += [(habit_id, now - datetime.timedelta(days=d)) for d in range(num_weeks * 7)]
+            else:
+                completions += [(habit_id, now - datetime.timedelta(weeks=w)) for w in range(num_weeks)]
+        storage.save_completions_bulk(conn, completions)
 
     print(f"Test data for {len(habits)} habits saved successfully.")
-    return storage.load_all_habits(conn)
\ No newline at end of file
+    return storage.load_habits_for_user(conn, user_id)
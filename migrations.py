@@ -0,0 +1,251 @@
+"""
+Versioned, forward-only schema migrations for the habit tracker database.
+
+The schema version is kept in SQLite's ``PRAGMA user_version``. Each entry in
+MIGRATIONS upgrades the schema by exactly one version and runs inside its own
+transaction together with the version bump, so a database is never left
+half-migrated. Steps are only ever appended; an existing step must not change
+once it has shipped, because databases in the field have already applied it.
+"""
+import datetime
+
+import periods
+
+
+def _create_base_tables(conn):
+    """Version 1: the original users, habits and completions tables."""
+    cursor = conn.cursor()
+    # Users table to store user information and securely hashed passwords
+    cursor.execute("""
+                   CREATE TABLE IF NOT EXISTS users
+                   (
+                       user_id
+                       INTEGER
+                       PRIMARY
+                       KEY
+                       AUTOINCREMENT,
+                       username
+                       TEXT
+                       NOT
+                       NULL
+                       UNIQUE,
+                       password
+                       TEXT
+                       NOT
+                       NULL,
+                       full_name
+                       TEXT,
+                       email
+                       TEXT
+                   );
+                   """)
+    # Habits table to store each habit, linked to a user
+    cursor.execute("""
+                   CREATE TABLE IF NOT EXISTS habits
+                   (
+                       habit_id
+                       INTEGER
+                       PRIMARY
+                       KEY
+                       AUTOINCREMENT,
+                       user_id
+                       INTEGER
+                       NOT
+                       NULL,
+                       name
+                       TEXT
+                       NOT
+                       NULL,
+                       periodicity
+                       TEXT
+                       NOT
+                       NULL,
+                       created_at
+                       TEXT
+                       NOT
+                       NULL,
+                       is_active
+                       INTEGER
+                       NOT
+                       NULL,
+                       FOREIGN
+                       KEY
+                   (
+                       user_id
+                   ) REFERENCES users
+                   (
+                       user_id
+                   ) ON DELETE CASCADE
+                       );
+                   """)
+    # Completions table to log each completion for a habit
+    cursor.execute("""
+                   CREATE TABLE IF NOT EXISTS completions
+                   (
+                       completion_id
+                       INTEGER
+                       PRIMARY
+                       KEY
+                       AUTOINCREMENT,
+                       habit_id
+                       INTEGER
+                       NOT
+                       NULL,
+                       timestamp
+                       TEXT
+                       NOT
+                       NULL,
+                       FOREIGN
+                       KEY
+                   (
+                       habit_id
+                   ) REFERENCES habits
+                   (
+                       habit_id
+                   ) ON DELETE CASCADE
+                       );
+                   """)
+
+
+def _add_lookup_indexes(conn):
+    """
+    Version 2: indexes for the per-user habit load and the ordered completion fetch.
+    The completions index holds both columns the loaders read, so it covers them.
+    """
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_habits_user_id ON habits (user_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_completions_habit_timestamp ON completions (habit_id, timestamp)")
+
+
+def _add_integer_time_columns(conn):
+    """
+    Version 3: integer epoch seconds plus day and ISO-week indexes on completions.
+    Existing rows are backfilled from their ISO-8601 timestamp text in batches.
+    """
+    for column in ("ts_epoch", "day_index", "week_index"):
+        conn.execute(f"ALTER TABLE completions ADD COLUMN {column} INTEGER")
+
+    last_id = 0
+    while True:
+        rows = conn.execute("SELECT completion_id, timestamp FROM completions "
+                            "WHERE completion_id > ? ORDER BY completion_id LIMIT 10000", (last_id,)).fetchall()
+        if not rows:
+            break
+        updates = []
+        for completion_id, timestamp in rows:
+            _, epoch, day, week = periods.completion_columns(datetime.datetime.fromisoformat(timestamp))
+            updates.append((epoch, day, week, completion_id))
+        conn.executemany("UPDATE completions SET ts_epoch = ?, day_index = ?, week_index = ? "
+                         "WHERE completion_id = ?", updates)
+        last_id = rows[-1][0]
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_completions_habit_epoch "
+                 "ON completions (habit_id, ts_epoch, day_index, week_index)")
+
+
+def _add_streak_summaries(conn):
+    """
+    Version 4: one row of streak state per habit, maintained by storage on every
+    completion write. Rows are built lazily, so the table starts empty.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS habit_streaks
+        (
+            habit_id       INTEGER PRIMARY KEY,
+            current_streak INTEGER NOT NULL,
+            longest_streak INTEGER NOT NULL,
+            last_period    INTEGER NOT NULL,
+            total_count    INTEGER NOT NULL
+        )
+    """)
+
+
+def _add_period_rollups(conn):
+    """
+    Version 5: per-habit completion counts for each day and each week with a
+    completion, maintained by storage on every completion write. Backfilled
+    from the existing completions.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS habit_day_rollups
+        (
+            habit_id    INTEGER NOT NULL,
+            day_index   INTEGER NOT NULL,
+            week_index  INTEGER NOT NULL,
+            completions INTEGER NOT NULL,
+            completed   INTEGER NOT NULL,
+            PRIMARY KEY (habit_id, day_index)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS habit_week_rollups
+        (
+            habit_id       INTEGER NOT NULL,
+            week_index     INTEGER NOT NULL,
+            completions    INTEGER NOT NULL,
+            days_completed INTEGER NOT NULL,
+            completed      INTEGER NOT NULL,
+            PRIMARY KEY (habit_id, week_index)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        INSERT INTO habit_day_rollups (habit_id, day_index, week_index, completions, completed)
+        SELECT habit_id, day_index, MAX(week_index), COUNT(*), 1
+        FROM completions
+        GROUP BY habit_id, day_index
+    """)
+    conn.execute("""
+        INSERT INTO habit_week_rollups (habit_id, week_index, completions, days_completed, completed)
+        SELECT d.habit_id, d.week_index, SUM(d.completions), COUNT(*),
+               CASE h.periodicity WHEN 'daily' THEN COUNT(*) = 7 ELSE 1 END
+        FROM habit_day_rollups d
+        JOIN habits h ON h.habit_id = d.habit_id
+        GROUP BY d.habit_id, d.week_index
+    """)
+
+
+def _add_user_timezones(conn):
+    """
+    Version 6: an optional IANA time zone per user, whose wall clock the user's
+    timezone-aware completions are recorded in. NULL keeps the system's.
+    """
+    conn.execute("ALTER TABLE users ADD COLUMN timezone TEXT")
+
+
+# MIGRATIONS[i] upgrades a database from version i to version i + 1.
+MIGRATIONS = [
+    _create_base_tables,
+    _add_lookup_indexes,
+    _add_integer_time_columns,
+    _add_streak_summaries,
+    _add_period_rollups,
+    _add_user_timezones,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(conn):
+    """Returns the schema version recorded in the database header."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """
+    Applies every pending migration step in order.
+    Returns the schema version the database ends up at.
+    """
+    version = get_schema_version(conn)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"Database schema version {version} is newer than this application "
+                           f"supports ({SCHEMA_VERSION}).")
+    for target in range(version + 1, SCHEMA_VERSION + 1):
+        conn.execute("BEGIN")
+        try:
+            MIGRATIONS[target - 1](conn)
+            # PRAGMA does not accept bound parameters; target is always an int here.
+            conn.execute(f"PRAGMA user_version = {target:d}")
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+    return SCHEMA_VERSION
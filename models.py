@@ -1,5 +1,10 @@
+import array
+import collections
+import collections.abc
 import datetime
 
+import periods
+
 
 class User:
     """Represents a user in the system."""
@@ -11,13 +16,53 @@ class User:
         self.email = email
 
 
+# Persisted streak state of one habit, as kept in the habit_streaks table.
+# last_period is the habit's latest period ordinal (see periods.py).
+StreakSummary = collections.namedtuple(
+    "StreakSummary", ["current_streak", "longest_streak", "last_period", "total_count"])
+
+
+# One habit's streak summary together with its owner, as streamed by
+# storage.iter_streak_summaries for cross-user leaderboards.
+StreakLeaderboardEntry = collections.namedtuple(
+    "StreakLeaderboardEntry",
+    ["user_id", "username", "habit_id", "name", "periodicity", "current_streak", "longest_streak"])
+
+
+# Analytics over a set of users, as computed by parallel_analytics for one shard
+# of users and merged across shards. top_streaks holds StreakLeaderboardEntry
+# rows best first, and missed the (user_id, habit_id) of habits not completed
+# since the cutoff.
+GlobalAnalytics = collections.namedtuple(
+    "GlobalAnalytics", ["users", "habits", "completions", "longest_streak", "top_streaks", "missed"])
+
+
+# One habit's statistics over a window of periods, as computed by
+# analyzer.window_stats. Rates are fractions of periods; mean_gap is None with
+# fewer than two completed periods.
+WindowStats = collections.namedtuple(
+    "WindowStats", ["habit_id", "periods", "completed", "completion_rate", "current_streak", "longest_streak",
+                    "breaks", "mean_gap", "recent_adherence", "worst_adherence"])
+
+# WindowStats of many habits combined by analyzer.summarize_window.
+WindowSummary = collections.namedtuple(
+    "WindowSummary", ["habits", "periods", "completed", "completion_rate", "mean_completion_rate",
+                      "longest_current_streak", "breaks", "worst_adherence"])
+
+
 class Habit:
-    """Represents a habit with its name, periodicity, and completion history."""
+    """
+    Represents a habit with its name, periodicity, and completion history.
+    habit.Habit is the same class with the (name, periodicity, description)
+    constructor used by the CLI and the tests.
+    """
 
-    def __init__(self, name, periodicity, habit_id=None, created_at=None, is_active=True, completions=None):
+    def __init__(self, name, periodicity, habit_id=None, created_at=None, is_active=True, completions=None,
+                 description=""):
         self.habit_id = habit_id
         self.name = name
-        self.periodicity = periodicity
+        self.description = description
+        self.periodicity = periodicity.lower()
 
         if created_at is None:
             self.created_at = datetime.datetime.now()
@@ -30,3 +75,99 @@ class Habit:
 
         self.is_active = is_active
         self.completions = completions if completions is not None else []
+        # StreakSummary loaded from storage, or None when it has not been built
+        self.streak_summary = None
+
+    def log_completion(self, timestamp=None):
+        """
+        Logs a completion for the habit with a specific timestamp, defaulting to now.
+        This only changes the in-memory habit; storage.save_completion persists it.
+        """
+        if not timestamp:
+            timestamp = datetime.datetime.now()
+        self.completions.append(timestamp)
+        # A loaded summary no longer counts every completion
+        self.streak_summary = None
+
+    def get_last_completion(self):
+        """Returns the timestamp of the last completion, or None."""
+        if self.completions:
+            return max(self.completions)
+        return None
+
+    def __repr__(self):
+        return f"Habit(name='{self.name}', periodicity='{self.periodicity}', is_active={self.is_active})"
+
+
+class CompletionView(collections.abc.Sequence):
+    """
+    A read-only sequence of datetimes over an array of epoch seconds.
+    Each datetime is created when it is accessed and is not kept.
+    """
+
+    __slots__ = ("_epochs",)
+
+    def __init__(self, epochs):
+        self._epochs = epochs
+
+    def __len__(self):
+        return len(self._epochs)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [periods.from_epoch(epoch) for epoch in self._epochs[index]]
+        return periods.from_epoch(self._epochs[index])
+
+    def __iter__(self):
+        return map(periods.from_epoch, self._epochs)
+
+    def __eq__(self, other):
+        return list(self) == other
+
+    def __repr__(self):
+        return f"CompletionView({list(self)!r})"
+
+
+class CompactHabit:
+    """
+    A habit whose completions are kept as wall-clock epoch seconds (see periods.py)
+    in a signed 64-bit array rather than as a list of datetime objects, which
+    takes 8 bytes per completion instead of about 56. Attributes are declared in
+    __slots__, so instances have no per-object __dict__.
+
+    `completions` is a lazy datetime view of `epochs` for code written against
+    Habit; analyzer reads `epochs` directly.
+    """
+
+    __slots__ = ("habit_id", "name", "periodicity", "created_at", "is_active", "epochs", "streak_summary")
+
+    def __init__(self, name, periodicity, habit_id=None, created_at=None, is_active=True, epochs=None):
+        self.habit_id = habit_id
+        self.name = name
+        self.periodicity = periodicity
+        if created_at is None:
+            self.created_at = datetime.datetime.now()
+        elif isinstance(created_at, str):
+            self.created_at = datetime.datetime.fromisoformat(created_at)
+        else:
+            self.created_at = created_at
+        self.is_active = is_active
+        self.epochs = array.array("q", epochs if epochs is not None else ())
+        # StreakSummary loaded from storage, or None when it has not been built
+        self.streak_summary = None
+
+    @property
+    def completions(self):
+        return CompletionView(self.epochs)
+
+    @completions.setter
+    def completions(self, timestamps):
+        self.epochs = array.array("q", map(periods.to_epoch, timestamps))
+
+    @classmethod
+    def from_habit(cls, habit):
+        """Returns a CompactHabit copy of a Habit, keeping its streak summary."""
+        compact = cls(habit.name, habit.periodicity, habit.habit_id, habit.created_at, habit.is_active)
+        compact.completions = habit.completions
+        compact.streak_summary = habit.streak_summary
+        return compact
@@ -0,0 +1,130 @@
+"""
+Analytics over every user of a database, computed in parallel worker processes.
+
+The users are split into contiguous shards by user_id, and the shards are
+spread over a ProcessPoolExecutor. Each worker opens its own read-only
+connection, streams the habits of its users with storage.iter_habits_for_user
+and returns a GlobalAnalytics partial aggregate: counts, the longest streak, its
+own top k streaks and its missed habits. Partials only hold k leaderboard rows
+besides the missed list, so little crosses the process boundary, and
+merge_analytics combines them into the same GlobalAnalytics for all users.
+
+Workers read the database file, so completions still queued in a write-behind
+buffer or kept in a completion backend (see storage) are not seen. Habits of
+storage.LEGACY_USER_ID belong to no user and are not included.
+"""
+import concurrent.futures
+import datetime
+import itertools
+import os
+
+import analyzer
+import periods
+import storage
+from models import GlobalAnalytics, StreakLeaderboardEntry
+
+# Shards handed to each worker, so that a worker which draws quick shards can
+# take on more while another finishes a heavy one
+SHARDS_PER_WORKER = 4
+
+
+def global_analytics(path=storage.DATABASE_NAME, workers=None, k=10, cutoff=None, shards=None):
+    """
+    Computes analytics over every user in the database file at `path`.
+
+    Args:
+        path (str): The database file; ':memory:' cannot be shared with workers.
+        workers (int): Worker processes, os.cpu_count() by default. With one
+            worker the shards are analysed in this process.
+        k (int): How many entries top_streaks keeps.
+        cutoff (datetime): Habits without a completion since then are missed;
+            7 days ago by default.
+        shards (int): How many shards the users are split into,
+            SHARDS_PER_WORKER per worker by default.
+
+    Returns:
+        GlobalAnalytics: top_streaks ranked as analyzer.streak_leaderboard ranks
+        them, and missed ordered by user_id and habit_id.
+    """
+    if path == ":memory:":
+        raise ValueError("Parallel analytics need a database file the workers can open.")
+    workers = workers or os.cpu_count() or 1
+    if cutoff is None:
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=7)
+    conn = storage.get_db_connection(path, read_only=True)
+    try:
+        users = storage.list_users(conn)
+    finally:
+        conn.close()
+    parts = partition_users(users, shards or workers * SHARDS_PER_WORKER)
+    arguments = (itertools.repeat(path), parts, itertools.repeat(k), itertools.repeat(periods.to_epoch(cutoff)))
+    if workers == 1:
+        return merge_analytics(map(analyse_shard, *arguments), k)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        # map yields results in shard order, which keeps `missed` sorted
+        return merge_analytics(pool.map(analyse_shard, *arguments), k)
+
+
+def partition_users(users, shards):
+    """Splits a list of users into at most `shards` contiguous, near-equal, non-empty slices."""
+    shards = max(1, min(shards, len(users)))
+    size, extra = divmod(len(users), shards)
+    parts = []
+    start = 0
+    for i in range(shards):
+        end = start + size + (i < extra)
+        parts.append(users[start:end])
+        start = end
+    return [part for part in parts if part]
+
+
+def analyse_shard(path, users, k, cutoff_epoch):
+    """
+    Computes the partial GlobalAnalytics of some users on a read-only connection
+    of its own. Runs in a worker process, so its arguments and result are plain
+    picklable values.
+
+    Args:
+        users (list): (user_id, username) pairs, as storage.list_users returns them.
+        cutoff_epoch (int): The missed-habit cutoff in wall-clock epoch seconds.
+    """
+    counts = {"habits": 0, "completions": 0, "longest_streak": 0}
+    missed = []
+
+    def entries(conn):
+        for user_id, username in users:
+            for habit in storage.iter_habits_for_user(conn, user_id, compact=True):
+                epochs = list(habit.completions)
+                summary = habit.streak_summary
+                if summary is not None:
+                    longest, current = summary.longest_streak, summary.current_streak
+                else:
+                    longest, current = analyzer.streak_runs(epochs, habit.periodicity)
+                counts["habits"] += 1
+                counts["completions"] += len(epochs)
+                counts["longest_streak"] = max(counts["longest_streak"], longest)
+                if not epochs or epochs[-1] < cutoff_epoch:
+                    missed.append((user_id, habit.habit_id))
+                yield StreakLeaderboardEntry(user_id, username, habit.habit_id, habit.name, habit.periodicity,
+                                             current, longest)
+
+    conn = storage.get_db_connection(path, read_only=True)
+    try:
+        top = analyzer.streak_leaderboard(entries(conn), k)
+    finally:
+        conn.close()
+    return GlobalAnalytics(len(users), counts["habits"], counts["completions"], counts["longest_streak"], top, missed)
+
+
+def merge_analytics(partials, k=10):
+    """Combines partial GlobalAnalytics of disjoint sets of users, given in user_id order."""
+    partials = list(partials)
+    return GlobalAnalytics(
+        sum(p.users for p in partials),
+        sum(p.habits for p in partials),
+        sum(p.completions for p in partials),
+        max((p.longest_streak for p in partials), default=0),
+        # The global top k is among the union of every shard's top k
+        analyzer.streak_leaderboard(itertools.chain.from_iterable(p.top_streaks for p in partials), k),
+        list(itertools.chain.from_iterable(p.missed for p in partials)),
+    )
@@ -0,0 +1,180 @@
+"""
+Password hashing for the users table.
+
+Hashes are stored as "$"-separated strings that carry their own parameters,
+with the salt and derived key in unpadded base64:
+
+    scrypt$<n>$<r>$<p>$<salt>$<key>
+    pbkdf2_sha256$<iterations>$<salt>$<key>
+
+New hashes use KDF_PARAMETERS. A stored hash keeps verifying after the
+parameters change, and needs_rehash reports it so that storage.login_user can
+store a fresh hash once the password is known. Rows written before salted
+hashing hold the bare hex SHA-256 of the password; they verify the same way.
+
+A KDF is slow on purpose, so two things keep login bursts moving: the KDF runs
+on a thread pool (hashlib releases the GIL while deriving), and a LoginCache
+remembers recent successful logins so that repeating one skips the KDF.
+"""
+import base64
+import collections
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+
+SCRYPT = "scrypt"
+PBKDF2 = "pbkdf2_sha256"
+
+# Parameters of new hashes. scrypt needs 128 * r * n bytes, 16 MiB here
+KDF_PARAMETERS = {"scheme": SCRYPT, "n": 2 ** 14, "r": 8, "p": 1}
+
+# Threads the KDF thread pool runs; each concurrent scrypt holds its own memory
+KDF_WORKERS = os.cpu_count() or 1
+
+_SALT_BYTES = 16
+_KEY_BYTES = 32
+_PARAMETER_NAMES = {SCRYPT: ("n", "r", "p"), PBKDF2: ("iterations",)}
+
+_kdf_pool = None
+_kdf_pool_lock = threading.Lock()
+
+
+def _b64(data):
+    return base64.b64encode(data).decode("ascii").rstrip("=")
+
+
+def _unb64(text):
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def _derive(password, scheme, parameters, salt):
+    password = password.encode("utf-8")
+    if scheme == SCRYPT:
+        n, r, p = parameters
+        # OpenSSL refuses more than 32 MiB unless maxmem allows it
+        return hashlib.scrypt(password, salt=salt, n=n, r=r, p=p, maxmem=128 * r * (n + p + 2) + 1024 * 1024,
+                              dklen=_KEY_BYTES)
+    if scheme == PBKDF2:
+        return hashlib.pbkdf2_hmac("sha256", password, salt, parameters[0], dklen=_KEY_BYTES)
+    raise ValueError(f"Unknown password hashing scheme: {scheme}")
+
+
+def _current_parameters(parameters=None):
+    parameters = parameters or KDF_PARAMETERS
+    scheme = parameters["scheme"]
+    if scheme not in _PARAMETER_NAMES:
+        raise ValueError(f"Unknown password hashing scheme: {scheme}")
+    return scheme, tuple(int(parameters[name]) for name in _PARAMETER_NAMES[scheme])
+
+
+def hash_password(password, parameters=None):
+    """Hashes a password with a fresh salt, using `parameters` or KDF_PARAMETERS."""
+    scheme, values = _current_parameters(parameters)
+    salt = secrets.token_bytes(_SALT_BYTES)
+    key = _derive(password, scheme, values, salt)
+    return "$".join([scheme, *map(str, values), _b64(salt), _b64(key)])
+
+
+def _parse(stored):
+    """Splits a stored hash into (scheme, parameters, salt, key); legacy hashes have scheme None."""
+    fields = stored.split("$")
+    scheme = fields[0]
+    names = _PARAMETER_NAMES.get(scheme)
+    if names is None or len(fields) != len(names) + 3:
+        return None, (), b"", stored
+    return scheme, tuple(map(int, fields[1:-2])), _unb64(fields[-2]), _unb64(fields[-1])
+
+
+def verify_password(password, stored):
+    """Checks a password against a stored hash in constant time with respect to the hash."""
+    scheme, parameters, salt, key = _parse(stored)
+    if scheme is None:
+        # Unsalted SHA-256 hex digest written by earlier releases
+        return hmac.compare_digest(hashlib.sha256(password.encode("utf-8")).hexdigest(), stored)
+    return hmac.compare_digest(_derive(password, scheme, parameters, salt), key)
+
+
+def needs_rehash(stored, parameters=None):
+    """Tells whether a stored hash was made with other than the current parameters."""
+    scheme, values, _, _ = _parse(stored)
+    return (scheme, values) != _current_parameters(parameters)
+
+
+def kdf_pool():
+    """Returns the thread pool password KDFs run on, creating it with KDF_WORKERS threads on first use."""
+    global _kdf_pool
+    with _kdf_pool_lock:
+        if _kdf_pool is None:
+            # Imported here: concurrent.futures pulls in logging, which logins without a burst never need
+            import concurrent.futures
+            _kdf_pool = concurrent.futures.ThreadPoolExecutor(max_workers=KDF_WORKERS,
+                                                              thread_name_prefix="password-kdf")
+        return _kdf_pool
+
+
+def verify_many(pairs):
+    """Verifies (password, stored hash) pairs on the KDF thread pool. Returns a list of bools in order."""
+    pairs = list(pairs)
+    if len(pairs) < 2:
+        return [verify_password(password, stored) for password, stored in pairs]
+    return list(kdf_pool().map(lambda pair: verify_password(*pair), pairs))
+
+
+class LoginCache:
+    """
+    Remembers recent successful logins so that repeating one skips the KDF.
+
+    Entries are keyed by an HMAC of the username, stored hash and password under
+    a key made for this cache, so no password or KDF output is kept, and a
+    changed password or rehash no longer matches. An entry expires `ttl`
+    seconds after the login that verified it, and the least recently used entry
+    is dropped beyond `max_entries`. `hits` and `misses` count lookups.
+    """
+
+    def __init__(self, max_entries=1024, ttl=300.0):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1.")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._key = secrets.token_bytes(32)
+        self._entries = collections.OrderedDict()  # token -> (user_id, expiry)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _token(self, username, stored, password):
+        message = "\0".join((username, stored, password)).encode("utf-8")
+        return hmac.new(self._key, message, hashlib.sha256).digest()
+
+    def get(self, username, stored, password):
+        """Returns the user ID of a matching unexpired login, or None."""
+        token = self._token(username, stored, password)
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, username, stored, password, user_id):
+        """Records a verified login."""
+        token = self._token(username, stored, password)
+        with self._lock:
+            self._entries[token] = (user_id, time.monotonic() + self.ttl)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
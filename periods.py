@@ -0,0 +1,302 @@
+"""
+Integer period arithmetic for completion timestamps.
+
+Completion timestamps are naive local wall-clock datetimes. Their compact form
+is the number of wall-clock seconds since 1970-01-01T00:00:00, taken without any
+timezone conversion, so that plain integer division yields the calendar day and
+the Monday-based ISO week the user saw the completion in. Timezone-aware
+timestamps are brought onto a user's wall clock with to_local first.
+
+The second half of this module is the periodicity registry: the kinds of period
+a habit can be tracked in, each mapping day indexes to period ordinals.
+"""
+import datetime
+import itertools
+import re
+
+SECONDS_PER_DAY = 86400
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# 1970-01-01 was a Thursday; shifting day indexes by three makes weeks start on Monday.
+_WEEK_SHIFT = 3
+
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+# date.toordinal() of 1970-01-01; a datetime's day index is its ordinal minus this
+_EPOCH_ORDINAL = EPOCH.toordinal()
+
+
+def to_epoch(timestamp):
+    """Returns the wall-clock seconds since 1970-01-01 for a datetime (sub-second part dropped)."""
+    # The arithmetic of calendar.timegm, without importing calendar (and locale) for it
+    return ((timestamp.toordinal() - _EPOCH_ORDINAL) * SECONDS_PER_DAY
+            + timestamp.hour * 3600 + timestamp.minute * 60 + timestamp.second)
+
+
+def from_epoch(epoch):
+    """Returns the naive datetime for wall-clock epoch seconds."""
+    return EPOCH + datetime.timedelta(seconds=epoch)
+
+
+def to_epoch_micros(timestamp):
+    """Returns the wall-clock microseconds since 1970-01-01 for a datetime, keeping the sub-second part."""
+    return (timestamp - EPOCH) // _MICROSECOND
+
+
+def from_epoch_micros(micros):
+    """Returns the naive datetime for wall-clock epoch microseconds."""
+    return EPOCH + datetime.timedelta(microseconds=micros)
+
+
+def day_index(epoch):
+    """Returns the day number (days since 1970-01-01) of wall-clock epoch seconds."""
+    return epoch // SECONDS_PER_DAY
+
+
+def week_index(day):
+    """Returns the Monday-based week number of a day index."""
+    return (day + _WEEK_SHIFT) // 7
+
+
+def week_days(week):
+    """Returns the first (Monday) and last (Sunday) day index of a week index."""
+    first = week * 7 - _WEEK_SHIFT
+    return first, first + 6
+
+
+def day_of_datetime(timestamp):
+    """Returns the day index of a naive wall-clock datetime."""
+    return timestamp.toordinal() - _EPOCH_ORDINAL
+
+
+def date_of_day(day):
+    """Returns the calendar date of a day index."""
+    return (EPOCH + datetime.timedelta(days=day)).date()
+
+
+def day_of_date(date):
+    """Returns the day index of a calendar date."""
+    return (date - EPOCH.date()).days
+
+
+def epoch_week(epoch):
+    """Returns the Monday-based week index of wall-clock epoch seconds."""
+    return (epoch // SECONDS_PER_DAY + _WEEK_SHIFT) // 7
+
+
+def completion_columns(timestamp):
+    """Returns the (timestamp, ts_epoch, day_index, week_index) column values for a completion."""
+    epoch = to_epoch(timestamp)
+    day = epoch // SECONDS_PER_DAY
+    return timestamp.isoformat(), epoch, day, (day + _WEEK_SHIFT) // 7
+
+
+def to_local(timestamp, tz=None):
+    """
+    Returns a timestamp as a naive wall-clock datetime. Aware timestamps are
+    converted to `tz` (a tzinfo or zone name), or to the system's local time
+    when it is None; naive timestamps are already wall-clock and returned as-is.
+    """
+    if timestamp.tzinfo is None:
+        return timestamp
+    if isinstance(tz, str):
+        tz = get_timezone(tz)
+    return timestamp.astimezone(tz).replace(tzinfo=None)
+
+
+def get_timezone(name):
+    """
+    Returns the tzinfo of an IANA zone name such as "Europe/Berlin".
+
+    Raises:
+        ValueError: If no such zone is known.
+    """
+    import zoneinfo  # Only needed once a time zone is in play
+    try:
+        return zoneinfo.ZoneInfo(name)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown time zone: {name!r}") from None
+
+
+# --- Periodicities ---
+# A habit's periodicity names a Periodicity from the registry below. Every
+# periodicity maps day indexes to integer period ordinals so that consecutive
+# periods have consecutive ordinals; streaks are runs of consecutive completed
+# ordinals. to_ordinal only uses integer arithmetic, so it maps one day index or
+# a whole NumPy integer array of them in a single call.
+
+class Periodicity:
+    """
+    A kind of period habits are tracked in.
+
+    Attributes:
+        name (str): The periodicity string habits store, e.g. "3x-weekly".
+        required (int): Distinct days with a completion a period needs to count
+            as completed.
+    """
+    required = 1
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.name}>"
+
+    def to_ordinal(self, day):
+        """Maps a day index, or an array of them, to period ordinals."""
+        raise NotImplementedError
+
+    def first_day(self, ordinal):
+        """Returns the first day index of a period."""
+        raise NotImplementedError
+
+    def ordinal_function(self, compact):
+        """
+        Returns a function mapping one completion, a datetime or, when `compact`,
+        wall-clock epoch seconds, to its period ordinal. Subclasses may return
+        faster functions whose ordinals differ from to_ordinal by a constant,
+        which streaks do not notice; use to_ordinal where exact values matter.
+        """
+        to_ordinal = self.to_ordinal
+        if compact:
+            return lambda epoch: to_ordinal(epoch // SECONDS_PER_DAY)
+        return lambda timestamp: to_ordinal(day_of_datetime(timestamp))
+
+    def ordinal_of(self, timestamp, tz=None):
+        """Returns the exact period ordinal of one timestamp, taken on the wall clock of `tz` (see to_local)."""
+        return self.to_ordinal(day_of_datetime(to_local(timestamp, tz)))
+
+    def completed_ordinals(self, days):
+        """
+        Yields the ascending ordinals of the completed periods among ascending
+        day indexes, which may repeat. Each period is read once, so `days` may
+        be a stream.
+        """
+        for ordinal, group in itertools.groupby(days, self.to_ordinal):
+            if self.required == 1 or len(set(group)) >= self.required:
+                yield ordinal
+
+
+class Daily(Periodicity):
+    """One period per calendar day."""
+
+    def to_ordinal(self, day):
+        return day
+
+    def first_day(self, ordinal):
+        return ordinal
+
+    def ordinal_function(self, compact):
+        return day_index if compact else datetime.date.toordinal
+
+
+class Weekly(Periodicity):
+    """Monday-to-Sunday weeks, numbered like week_index."""
+
+    def to_ordinal(self, day):
+        return (day + _WEEK_SHIFT) // 7
+
+    def first_day(self, ordinal):
+        return week_days(ordinal)[0]
+
+    def ordinal_function(self, compact):
+        # Proleptic ordinal 1 (0001-01-01) was a Monday
+        return epoch_week if compact else _ordinal_week
+
+
+def _ordinal_week(timestamp):
+    return (timestamp.toordinal() - 1) // 7
+
+
+class TimesPerWeek(Weekly):
+    """Monday-to-Sunday weeks that need completions on `times` different days."""
+
+    def __init__(self, name, times):
+        super().__init__(name)
+        self.required = times
+
+
+# Days from 0000-03-01 to 1970-01-01 in the proleptic Gregorian calendar, and
+# the month count of 1970-01 in March-based years (see Monthly)
+_CIVIL_EPOCH_DAYS = 719468
+_MONTHS_TO_1970 = 1969 * 12 + 10
+
+
+class Monthly(Periodicity):
+    """
+    Calendar months. Uses the days-to-civil-date arithmetic of H. Hinnant's
+    date algorithms over March-based years, which has no branches and so works
+    on arrays as well.
+    """
+
+    def to_ordinal(self, day):
+        z = day + _CIVIL_EPOCH_DAYS
+        era = z // 146097
+        day_of_era = z - era * 146097
+        year_of_era = (day_of_era - day_of_era // 1460 + day_of_era // 36524 - day_of_era // 146096) // 365
+        day_of_year = day_of_era - (365 * year_of_era + year_of_era // 4 - year_of_era // 100)
+        month = (5 * day_of_year + 2) // 153  # 0 is March
+        return (era * 400 + year_of_era) * 12 + month - _MONTHS_TO_1970
+
+    def first_day(self, ordinal):
+        year, month = divmod(ordinal + _MONTHS_TO_1970, 12)
+        era = year // 400
+        year_of_era = year - era * 400
+        day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + (153 * month + 2) // 5
+        return era * 146097 + day_of_era - _CIVIL_EPOCH_DAYS
+
+
+class EveryNDays(Periodicity):
+    """Fixed runs of `days` days, counted from 1970-01-01."""
+
+    def __init__(self, name, days):
+        super().__init__(name)
+        self.days = days
+
+    def to_ordinal(self, day):
+        return day // self.days
+
+    def first_day(self, ordinal):
+        return ordinal * self.days
+
+
+# (compiled pattern, factory) pairs tried in order; a factory gets the full
+# name followed by the pattern's groups as ints
+_PERIODICITY_PATTERNS = []
+_periodicities = {}
+
+
+def register_periodicity(pattern, factory):
+    """
+    Registers a kind of periodicity. Names matching the regular expression
+    `pattern` in full are built with factory(name, *groups), the groups
+    converted to int. Later registrations take precedence.
+    """
+    _PERIODICITY_PATTERNS.insert(0, (re.compile(pattern), factory))
+    _periodicities.clear()
+
+
+def get_periodicity(name):
+    """Returns the Periodicity for a periodicity string, or None when no registered kind matches."""
+    try:
+        return _periodicities[name]
+    except KeyError:
+        pass
+    periodicity = None
+    for pattern, factory in _PERIODICITY_PATTERNS:
+        match = pattern.fullmatch(name)
+        if match:
+            periodicity = factory(name, *map(int, match.groups()))
+            break
+    _periodicities[name] = periodicity
+    return periodicity
+
+
+register_periodicity(r"every-([1-9][0-9]*)-days", EveryNDays)
+register_periodicity(r"monthly", Monthly)
+register_periodicity(r"([1-7])x-weekly", TimesPerWeek)
+register_periodicity(r"weekly", Weekly)
+register_periodicity(r"daily", Daily)
+
+# Periodicity strings offered to users, with the number in the patterns as N
+PERIODICITY_FORMS = ("daily", "weekly", "Nx-weekly", "monthly", "every-N-days")
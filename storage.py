@@ -1,117 +1,273 @@
 import sqlite3
-import hashlib
-from models import User, Habit
+import contextlib
+import atexit
+import bisect
+import collections
+import copy
+import itertools
+import operator
+import time
+import queue
+import threading
+from models import User, Habit, CompactHabit, StreakSummary, StreakLeaderboardEntry
 import datetime
+import migrations
+import passwords
+import periods
 
 DATABASE_NAME = "habit_tracker.db"
 
+# Owner of habits saved without a user. AUTOINCREMENT user ids start at 1, so
+# no account owns these; load_all_habits still returns them.
+LEGACY_USER_ID = 0
 
-def get_db_connection():
-    """Establishes and returns a connection to the SQLite database."""
-    conn = sqlite3.connect(DATABASE_NAME)
+# unit_of_work nesting depths of connections not from get_db_connection, which
+# cannot hold it themselves, keyed by id(). Entries last only as long as the block.
+_plain_unit_of_work_depths = {}
+
+# The passwords.LoginCache consulted by login_user on every connection, or None.
+# See enable_login_cache.
+_login_cache = None
+
+
+# Pragmas applied to every connection from get_db_connection. WAL lets readers
+# run alongside a writer, and busy_timeout (milliseconds) makes a writer wait for
+# the lock instead of failing with "database is locked". In WAL mode
+# synchronous=NORMAL only syncs at checkpoints, which is durable against
+# application crashes. A negative cache_size is in KiB.
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "cache_size": -16000,
+    "mmap_size": 256 * 1024 * 1024,
+}
+
+
+class Connection(sqlite3.Connection):
+    """
+    The connection class of get_db_connection. It also holds the optional state
+    this module keeps per connection, which therefore goes away with the
+    connection: a write-behind buffer (see enable_write_behind), a completion
+    backend (see set_completion_backend) and a habit cache (see
+    enable_habit_cache). Other connections work without that state.
+    """
+    _write_behind = None
+    _completion_backend = None
+    _habit_cache = None
+    _unit_of_work_depth = 0
+
+
+def _buffer_of(conn):
+    return getattr(conn, "_write_behind", None)
+
+
+def _backend_of(conn):
+    return getattr(conn, "_completion_backend", None)
+
+
+def _cache_of(conn):
+    return getattr(conn, "_habit_cache", None)
+
+
+def _unit_of_work_depth(conn):
+    """
+    The nesting depth of the unit_of_work blocks open on a connection. Writes
+    inside them leave committing to the block.
+    """
+    if isinstance(conn, Connection):
+        return conn._unit_of_work_depth
+    return _plain_unit_of_work_depths.get(id(conn), 0)
+
+
+def _set_unit_of_work_depth(conn, depth):
+    if isinstance(conn, Connection):
+        conn._unit_of_work_depth = depth
+    elif depth:
+        _plain_unit_of_work_depths[id(conn)] = depth
+    else:
+        del _plain_unit_of_work_depths[id(conn)]
+
+
+def _check_connection(conn):
+    if not isinstance(conn, Connection):
+        raise TypeError("This needs a connection from get_db_connection.")
+
+
+def get_db_connection(path=DATABASE_NAME, check_same_thread=True, read_only=False, **pragmas):
+    """
+    Establishes and returns a connection to the SQLite database.
+    The connection is tuned with DEFAULT_PRAGMAS; keyword arguments override
+    individual pragmas, and a value of None leaves that pragma at SQLite's default.
+    With read_only=True the database file must exist and any write fails; the
+    journal mode is left as the file has it, since setting it is a write.
+    """
+    settings = dict(DEFAULT_PRAGMAS, **pragmas)
+    busy_timeout = settings.get("busy_timeout") or 0
+    if read_only:
+        import pathlib  # Only read-only connections need a file: URI
+        settings.pop("journal_mode", None)
+        path = pathlib.Path(path).resolve().as_uri() + "?mode=ro"
+    conn = sqlite3.connect(path, timeout=busy_timeout / 1000, check_same_thread=check_same_thread, uri=read_only,
+                           factory=Connection)
     conn.row_factory = sqlite3.Row  # This allows accessing columns by name
+    for name, value in settings.items():
+        if value is not None:
+            # Pragma values cannot be bound parameters; these come from code, not users
+            conn.execute(f"PRAGMA {name} = {value}")
+    register_functions(conn)
     return conn
 
 
+def register_functions(conn):
+    """
+    Registers the SQL functions that the rollup and streak queries call for
+    periodicities beyond daily and weekly. get_db_connection and create_tables
+    do this; another connection needs it before it saves completions.
+    """
+    conn.create_function("period_ordinal", 2, _sql_period_ordinal, deterministic=True)
+    conn.create_function("period_required", 1, _sql_period_required, deterministic=True)
+
+
+def _sql_period_ordinal(periodicity, day):
+    """period_ordinal(periodicity, day_index) in SQL; unknown periodicities have the single period 0."""
+    period = periods.get_periodicity(periodicity)
+    return period.to_ordinal(day) if period is not None else 0
+
+
+def _sql_period_required(periodicity):
+    """period_required(periodicity) in SQL: the distinct days a period needs to be completed."""
+    period = periods.get_periodicity(periodicity)
+    return period.required if period is not None else 1
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of tuned connections to one database file.
+
+    Connections are opened lazily up to `size` and handed to one thread at a time.
+    An in-memory database is private to its connection, so ':memory:' pools are
+    limited to a single connection.
+    """
+
+    def __init__(self, path=DATABASE_NAME, size=5, **pragmas):
+        if path == ":memory:" and size != 1:
+            raise ValueError("An in-memory database can only be pooled with size=1.")
+        self.path = path
+        self.size = size
+        self.pragmas = pragmas
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def acquire(self, timeout=None):
+        """
+        Returns an idle connection, opening a new one while below `size`.
+        Blocks up to `timeout` seconds (forever when None) for one to be released.
+        """
+        if self._closed:
+            raise RuntimeError("Connection pool is closed.")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                open_new = True
+            else:
+                open_new = False
+        if open_new:
+            try:
+                return get_db_connection(self.path, check_same_thread=False, **self.pragmas)
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No database connection became available within {timeout} seconds.") from None
+
+    def release(self, conn):
+        """Returns a connection to the pool, rolling back anything left uncommitted."""
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+        else:
+            self._idle.put(conn)
+
+    @contextlib.contextmanager
+    def connection(self, timeout=None):
+        """Context manager that acquires a connection and releases it afterwards."""
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """Closes every idle connection; connections still in use close on release."""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
 def create_tables(conn):
-    """Creates the necessary tables for the application if they do not exist."""
-    cursor = conn.cursor()
-    # Users table to store user information and securely hashed passwords
-    cursor.execute("""
-                   CREATE TABLE IF NOT EXISTS users
-                   (
-                       user_id
-                       INTEGER
-                       PRIMARY
-                       KEY
-                       AUTOINCREMENT,
-                       username
-                       TEXT
-                       NOT
-                       NULL
-                       UNIQUE,
-                       password
-                       TEXT
-                       NOT
-                       NULL,
-                       full_name
-                       TEXT,
-                       email
-                       TEXT
-                   );
-                   """)
-    # Habits table to store each habit, linked to a user
-    cursor.execute("""
-                   CREATE TABLE IF NOT EXISTS habits
-                   (
-                       habit_id
-                       INTEGER
-                       PRIMARY
-                       KEY
-                       AUTOINCREMENT,
-                       user_id
-                       INTEGER
-                       NOT
-                       NULL,
-                       name
-                       TEXT
-                       NOT
-                       NULL,
-                       periodicity
-                       TEXT
-                       NOT
-                       NULL,
-                       created_at
-                       TEXT
-                       NOT
-                       NULL,
-                       is_active
-                       INTEGER
-                       NOT
-                       NULL,
-                       FOREIGN
-                       KEY
-                   (
-                       user_id
-                   ) REFERENCES users
-                   (
-                       user_id
-                   ) ON DELETE CASCADE
-                       );
-                   """)
-    # Completions table to log each completion for a habit
-    cursor.execute("""
-                   CREATE TABLE IF NOT EXISTS completions
-                   (
-                       completion_id
-                       INTEGER
-                       PRIMARY
-                       KEY
-                       AUTOINCREMENT,
-                       habit_id
-                       INTEGER
-                       NOT
-                       NULL,
-                       timestamp
-                       TEXT
-                       NOT
-                       NULL,
-                       FOREIGN
-                       KEY
-                   (
-                       habit_id
-                   ) REFERENCES habits
-                   (
-                       habit_id
-                   ) ON DELETE CASCADE
-                       );
-                   """)
-    conn.commit()
+    """
+    Creates or upgrades the application's tables to the current schema version,
+    and registers the SQL functions their queries use on the connection.
+    """
+    register_functions(conn)
+    migrations.migrate(conn)
+
+
+def _commit(conn):
+    """Commits the connection unless a unit_of_work block is deferring commits for it."""
+    if not _unit_of_work_depth(conn):
+        conn.commit()
+
+
+@contextlib.contextmanager
+def unit_of_work(conn):
+    """
+    Groups storage writes into a single transaction.
+    The save_* and delete_* functions called inside the block do not commit on their
+    own; the outermost block commits once on success and rolls back if an exception
+    escapes it. Blocks may be nested. The transaction takes SQLite's write lock
+    when the outermost block is entered.
+    """
+    depth = _unit_of_work_depth(conn)
+    if depth == 0 and not conn.in_transaction:
+        # Queued completions go first: once this connection holds the lock, the
+        # write-behind buffer's connection could not write them
+        _flush_write_behind(conn)
+        # Take the write lock up front: a deferred transaction that reads first can
+        # fail with SQLITE_BUSY when it later upgrades to write, without waiting.
+        conn.execute("BEGIN IMMEDIATE")
+    _set_unit_of_work_depth(conn, depth + 1)
+    try:
+        yield conn
+        if depth == 0:
+            conn.commit()
+    except BaseException:
+        if depth == 0:
+            conn.rollback()
+            # Cached habits may have been patched with the writes just undone
+            _invalidate_habit_cache(conn)
+        raise
+    finally:
+        _set_unit_of_work_depth(conn, depth)
 
 
 def hash_password(password):
-    """Hashes a password for secure storage."""
-    return hashlib.sha256(password.encode()).hexdigest()
+    """Hashes a password for secure storage with a salted KDF (see passwords)."""
+    return passwords.hash_password(password)
 
 
 def register_user(conn, username, password, full_name, email):
@@ -119,12 +275,20 @@ def register_user(conn, username, password, full_name, email):
     Registers a new user with a hashed password.
     Returns True on success, False if the username already exists.
     """
+    return save_user(conn, username, hash_password(password), full_name, email)
+
+
+def save_user(conn, username, password_hash, full_name, email):
+    """
+    Registers a new user with a password already hashed by hash_password, so
+    that the KDF can run outside the write transaction.
+    Returns True on success, False if the username already exists.
+    """
     try:
         cursor = conn.cursor()
-        hashed_password = hash_password(password)
         cursor.execute("INSERT INTO users (username, password, full_name, email) VALUES (?, ?, ?, ?)",
-                       (username, hashed_password, full_name, email))
-        conn.commit()
+                       (username, password_hash, full_name, email))
+        _commit(conn)
         return True
     except sqlite3.IntegrityError:
         return False
@@ -133,78 +297,1780 @@ def register_user(conn, username, password, full_name, email):
 def login_user(conn, username, password):
     """
     Authenticates a user.
+    A password stored with other than the current KDF parameters, or with the
+    unsalted hash of earlier releases, is rehashed on success.
     Returns the user's ID on success, None on failure.
     """
+    verified = verify_login(conn, username, password)
+    if verified is None:
+        return None
+    user_id, stored, rehashed = verified
+    if rehashed is not None:
+        save_rehashed_password(conn, username, password, user_id, stored, rehashed)
+    return user_id
+
+
+def verify_login(conn, username, password):
+    """
+    The read-only half of login_user: authenticates a user and, if the stored
+    hash is outdated, computes its replacement without writing it.
+    Returns (user_id, stored hash, new hash or None) on success, None on failure.
+    """
     cursor = conn.cursor()
     cursor.execute("SELECT user_id, password FROM users WHERE username = ?", (username,))
     user = cursor.fetchone()
-    if user and user['password'] == hash_password(password):
-        return user['user_id']
-    return None
+    if user is None:
+        _spend_kdf(password)
+        return None
+    user_id, stored = user
+    cache = _login_cache
+    if cache is not None and cache.get(username, stored, password) is not None:
+        return user_id, stored, None
+    if not passwords.verify_password(password, stored):
+        return None
+    if passwords.needs_rehash(stored):
+        return user_id, stored, passwords.hash_password(password)
+    if cache is not None:
+        cache.put(username, stored, password, user_id)
+    return user_id, stored, None
+
+
+def save_rehashed_password(conn, username, password, user_id, stored, rehashed):
+    """
+    The write half of login_user: replaces the verified hash `stored` with
+    `rehashed` and records the login in the login cache. Returns the hash now stored.
+    """
+    # Only replace the hash that was verified, in case the password changed meanwhile
+    if conn.execute("UPDATE users SET password = ? WHERE user_id = ? AND password = ?",
+                    (rehashed, user_id, stored)).rowcount:
+        stored = rehashed
+    if _login_cache is not None:
+        _login_cache.put(username, stored, password, user_id)
+    _commit(conn)
+    return stored
+
+
+def login_users(conn, credentials):
+    """
+    Authenticates many (username, password) pairs at once. Passwords are
+    verified on the passwords KDF thread pool, so a burst of logins runs its
+    KDFs concurrently instead of one after another, and rehashes are written in
+    one transaction.
+    Returns the user ID, or None on failure, for each pair in order.
+    """
+    credentials = list(credentials)
+    usernames = list({username for username, _ in credentials})
+    users = {}
+    for start in range(0, len(usernames), _REBUILD_CHUNK_SIZE):
+        chunk = usernames[start:start + _REBUILD_CHUNK_SIZE]
+        placeholders = ", ".join("?" * len(chunk))
+        users.update((username, (user_id, stored)) for user_id, username, stored in _tuple_cursor(conn).execute(
+            f"SELECT user_id, username, password FROM users WHERE username IN ({placeholders})", chunk))
+
+    results = [None] * len(credentials)
+    checks = []
+    for i, (username, password) in enumerate(credentials):
+        user = users.get(username)
+        if user is None:
+            checks.append((i, password, _dummy_hash()))
+        elif _login_cache is not None and _login_cache.get(username, user[1], password) is not None:
+            results[i] = user[0]
+        else:
+            checks.append((i, password, user[1]))
+    verified = passwords.verify_many((password, stored) for _, password, stored in checks)
+    with unit_of_work(conn):
+        for (i, password, stored), ok in zip(checks, verified):
+            username = credentials[i][0]
+            if ok and username in users:
+                user_id, stored = users[username]
+                users[username] = user_id, _finish_login(conn, username, password, user_id, stored)
+                results[i] = user_id
+    return results
+
+
+def _finish_login(conn, username, password, user_id, stored):
+    """Rehashes an outdated stored hash and records the login in the login cache. Returns the stored hash."""
+    if passwords.needs_rehash(stored):
+        return save_rehashed_password(conn, username, password, user_id, stored, passwords.hash_password(password))
+    if _login_cache is not None:
+        _login_cache.put(username, stored, password, user_id)
+    return stored
+
+
+_dummy_hashes = {}
+
+
+def _dummy_hash():
+    """A hash with the current parameters, checked for unknown usernames."""
+    key = tuple(sorted(passwords.KDF_PARAMETERS.items()))
+    if key not in _dummy_hashes:
+        _dummy_hashes[key] = passwords.hash_password("")
+    return _dummy_hashes[key]
 
 
-def save_habit(conn, user_id, habit):
-    """Saves a new habit for a specific user to the database."""
+def _spend_kdf(password):
+    """Runs the KDF once for nothing, so unknown usernames take as long to reject as wrong passwords."""
+    passwords.verify_password(password, _dummy_hash())
+
+
+def enable_login_cache(max_entries=1024, ttl=300.0):
+    """
+    Makes login_user and login_users remember successful logins for `ttl`
+    seconds in a passwords.LoginCache, shared by every connection of the
+    process, so repeating a login skips the KDF. Returns the cache.
+    """
+    global _login_cache
+    _login_cache = passwords.LoginCache(max_entries, ttl)
+    return _login_cache
+
+
+def disable_login_cache():
+    """Forgets every cached login and stops caching."""
+    global _login_cache
+    _login_cache = None
+
+
+def list_users(conn):
+    """Returns (user_id, username) for every user, ordered by user_id."""
+    return _tuple_cursor(conn).execute("SELECT user_id, username FROM users ORDER BY user_id").fetchall()
+
+
+def set_user_timezone(conn, user_id, name):
+    """
+    Sets the IANA time zone (e.g. "Europe/Berlin") whose wall clock a user's
+    timezone-aware completions are recorded in, or clears it with None.
+
+    Raises:
+        ValueError: If the zone is unknown.
+    """
+    if name is not None:
+        periods.get_timezone(name)
+    conn.execute("UPDATE users SET timezone = ? WHERE user_id = ?", (name, user_id))
+    _commit(conn)
+
+
+def get_user_timezone(conn, user_id):
+    """Returns a user's time zone name, or None when none is set."""
+    row = conn.execute("SELECT timezone FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    return row[0] if row is not None else None
+
+
+def _habit_timezone(conn, habit_id):
+    row = conn.execute("""
+        SELECT u.timezone FROM habits h JOIN users u ON u.user_id = h.user_id WHERE h.habit_id = ?
+    """, (habit_id,)).fetchone()
+    return row[0] if row is not None else None
+
+
+def _local_timestamp(conn, habit_id, timestamp, zones=None):
+    """
+    Returns a completion timestamp on the wall clock of the habit's owner.
+    Naive timestamps already are; aware ones are converted to the owner's time
+    zone, or to the system's when the owner has none. `zones` caches the zone
+    of each habit across calls.
+    """
+    if timestamp.tzinfo is None:
+        return timestamp
+    if zones is None:
+        return periods.to_local(timestamp, _habit_timezone(conn, habit_id))
+    if habit_id not in zones:
+        zones[habit_id] = _habit_timezone(conn, habit_id)
+    return periods.to_local(timestamp, zones[habit_id])
+
+
+def save_habit(conn, user_id, habit=None):
+    """
+    Saves a new habit for a specific user to the database, together with any
+    completions it already holds, and sets its habit_id.
+    The older two-argument form save_habit(conn, habit) saves the habit under
+    LEGACY_USER_ID.
+    """
+    if habit is None:
+        user_id, habit = LEGACY_USER_ID, user_id
+    with unit_of_work(conn):
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO habits (user_id, name, periodicity, created_at, is_active) VALUES (?, ?, ?, ?, ?)",
+                       # Use isoformat for date
+                       (user_id, habit.name, habit.periodicity, habit.created_at.isoformat(), 1))
+        habit_id = cursor.lastrowid
+        if habit.completions:
+            save_completions_bulk(conn, [(habit_id, timestamp) for timestamp in habit.completions])
+    _invalidate_habit_cache(conn, user_id)
+    habit.habit_id = habit_id
+    return habit_id  # Return the new habit ID
+
+
+SAVE_COMPLETION_SQL = """
+    INSERT INTO completions (habit_id, timestamp, ts_epoch, day_index, week_index) VALUES (?, ?, ?, ?, ?)
+"""
+
+
+def save_habits_bulk(conn, user_id, habits):
+    """
+    Saves many new habits for a user with one executemany in one transaction.
+    Returns the new habit IDs in the same order as the given habits.
+    """
+    habits = list(habits)
+    if not habits:
+        return []
+    with unit_of_work(conn):
+        cursor = conn.cursor()
+        cursor.executemany("INSERT INTO habits (user_id, name, periodicity, created_at, is_active) "
+                           "VALUES (?, ?, ?, ?, ?)",
+                           [(user_id, h.name, h.periodicity, h.created_at.isoformat(), 1) for h in habits])
+        # The transaction holds the write lock for the whole executemany, so the
+        # AUTOINCREMENT ids handed out are consecutive and end at last_insert_rowid().
+        last_id = cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+    _invalidate_habit_cache(conn, user_id)
+    first_id = last_id - len(habits) + 1
+    return list(range(first_id, last_id + 1))
+
+
+def save_completions_bulk(conn, completions):
+    """
+    Saves many completions with one executemany in one transaction.
+    `completions` is an iterable of (habit_id, timestamp) pairs. The rollups and
+    streak summaries of the affected habits are rebuilt once at the end.
+    Returns the number of completions saved.
+    """
+    zones = {}
+    completions = ((habit_id, _local_timestamp(conn, habit_id, timestamp, zones))
+                   for habit_id, timestamp in completions)
+    if _cache_of(conn) is not None:
+        completions = list(completions)
+    backend = _backend_of(conn)
+    if backend is not None:
+        count = backend.append_many((habit_id, periods.to_epoch_micros(timestamp))
+                                    for habit_id, timestamp in completions)
+        _cache_completions_added(conn, completions)
+        return count
+    _flush_write_behind(conn)
+    count = _insert_completions(conn, completions)
+    _cache_completions_added(conn, completions, persisted=True)
+    return count
+
+
+def _insert_completions(conn, completions):
+    """Inserts completions into the table and rebuilds the affected rollups and summaries. Returns the count."""
+    habit_ids = set()
+
+    def rows():
+        for habit_id, timestamp in completions:
+            habit_ids.add(habit_id)
+            yield (habit_id, *periods.completion_columns(timestamp))
+
+    with unit_of_work(conn):
+        cursor = conn.cursor()
+        cursor.executemany(SAVE_COMPLETION_SQL, rows())
+        rebuild_rollups(conn, habit_ids)
+        rebuild_streak_summaries(conn, habit_ids)
+        return max(cursor.rowcount, 0)
+
+
+# A user's habits are loaded with two ordered queries regardless of habit count:
+# one for the habit rows and one for every completion of those habits. Keeping
+# the completions query to two narrow columns avoids repeating the habit columns
+# on every completion row, which a single LEFT JOIN would do.
+LOAD_USER_HABITS_SQL = """
+    SELECT h.habit_id, h.name, h.periodicity, h.created_at, h.is_active,
+           s.current_streak, s.longest_streak, s.last_period, s.total_count
+    FROM habits h
+    LEFT JOIN habit_streaks s ON s.habit_id = h.habit_id
+    WHERE h.user_id = ?
+    ORDER BY h.habit_id
+"""
+
+LOAD_USER_COMPLETIONS_SQL = """
+    SELECT c.habit_id, c.timestamp
+    FROM habits h
+    JOIN completions c ON c.habit_id = h.habit_id
+    WHERE h.user_id = ?
+    ORDER BY h.habit_id, c.timestamp
+"""
+
+LOAD_ALL_HABITS_SQL = """
+    SELECT h.habit_id, h.name, h.periodicity, h.created_at, h.is_active,
+           s.current_streak, s.longest_streak, s.last_period, s.total_count
+    FROM habits h
+    LEFT JOIN habit_streaks s ON s.habit_id = h.habit_id
+    ORDER BY h.habit_id
+"""
+
+LOAD_ALL_COMPLETIONS_SQL = """
+    SELECT c.habit_id, c.timestamp
+    FROM habits h
+    JOIN completions c ON c.habit_id = h.habit_id
+    ORDER BY c.habit_id, c.timestamp
+"""
+
+
+def _build_habits(habit_rows, completion_rows, parse=datetime.datetime.fromisoformat, habit_class=Habit):
+    """
+    Builds Habit objects from habit rows (with their streak summary columns) and
+    (habit_id, value) completion rows.
+    Completion rows must be grouped by habit_id; they are attached in one pass,
+    converted with `parse` unless it is None. For habit_class=CompactHabit the
+    values are appended to each habit's epochs array.
+    Returns a list of habit_class objects with their completions in timestamp order.
+    """
+    habits = []
+    by_id = {}
+    for row in habit_rows:
+        habit = _habit_from_row(row, habit_class)
+        habits.append(habit)
+        by_id[habit.habit_id] = habit.epochs if habit_class is CompactHabit else habit.completions
+
+    current_id = None
+    completions = None
+    for habit_id, value in completion_rows:
+        if habit_id != current_id:
+            current_id = habit_id
+            completions = by_id[habit_id]
+        completions.append(parse(value) if parse else value)
+    return habits
+
+
+def _habit_from_row(row, habit_class=Habit):
+    """Builds a habit without completions from a habit row with its streak summary columns."""
+    habit_id, name, periodicity, created_at, is_active, *summary = row
+    habit = habit_class(name, periodicity, habit_id, created_at, is_active)
+    if summary[0] is not None:
+        habit.streak_summary = StreakSummary(*summary)
+    return habit
+
+
+def _load_habits(conn, habits_sql, completions_sql, params=(), compact=False, habit_class=Habit):
+    """
+    Runs a habits query and the matching completions query and builds the habits.
+    Completions come from the connection's completion backend instead when it
+    has one, and completions queued for write-behind are merged in.
+    """
+    with _pending_completions(conn) as pending:
+        habit_rows = _tuple_cursor(conn).execute(habits_sql, params)
+        backend = _backend_of(conn)
+        if backend is None:
+            completion_rows = _tuple_cursor(conn).execute(completions_sql, params)
+            parse = None if compact else datetime.datetime.fromisoformat
+        else:
+            habit_rows = habit_rows.fetchall()
+            completion_rows = _backend_completion_rows(backend, habit_rows, compact)
+            parse = None
+        habits = _build_habits(habit_rows, completion_rows, parse, habit_class)
+    return _merge_pending(habits, pending, compact)
+
+
+def _tuple_cursor(conn):
+    """Returns a cursor yielding plain tuples, for rows that are unpacked positionally."""
     cursor = conn.cursor()
-    cursor.execute("INSERT INTO habits (user_id, name, periodicity, created_at, is_active) VALUES (?, ?, ?, ?, ?)",
-                   (user_id, habit.name, habit.periodicity, habit.created_at.isoformat(), 1))  # Use isoformat for date
-    conn.commit()
-    return cursor.lastrowid  # Return the new habit ID
+    cursor.row_factory = None
+    return cursor
 
 
 def load_habits_for_user(conn, user_id):
     """
     Loads all habits for a given user from the database.
+    Habits and completions are fetched with two queries in total instead of one
+    completions query per habit. On a connection with a habit cache (see
+    enable_habit_cache) a cached result is returned when there is one, as
+    copies that the caller may change.
     Returns a list of Habit objects.
     """
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM habits WHERE user_id = ?", (user_id,))
-    habits_data = cursor.fetchall()
+    cache = _cache_of(conn)
+    if cache is not None:
+        habits = cache.get(user_id)
+        if habits is not None:
+            return habits
+    habits = _load_habits(conn, LOAD_USER_HABITS_SQL, LOAD_USER_COMPLETIONS_SQL, (user_id,))
+    if cache is not None:
+        cache.put(user_id, habits)
+    return habits
 
-    habits = []
-    for row in habits_data:
-        habit_id = row['habit_id']
-        name = row['name']
-        periodicity = row['periodicity']
-        created_at = row['created_at']
-        is_active = row['is_active']
-
-        # Load all completions for this specific habit
-        completions_cursor = conn.cursor()
-        completions_cursor.execute("SELECT timestamp FROM completions WHERE habit_id = ? ORDER BY timestamp",
-                                   (habit_id,))
-        completions_data = completions_cursor.fetchall()
-
-        # Convert completion timestamps to datetime objects
-        completions = [datetime.datetime.fromisoformat(c['timestamp']) for c in completions_data]
-
-        # The Habit constructor must accept 6 positional arguments plus self (total 7)
-        habit = Habit(name, periodicity, habit_id, created_at, is_active, completions)
-        habits.append(habit)
 
-    return habits
+def load_all_habits(conn):
+    """
+    Loads every habit in the database regardless of owner.
+    Returns a list of Habit objects.
+    """
+    return _load_habits(conn, LOAD_ALL_HABITS_SQL, LOAD_ALL_COMPLETIONS_SQL)
+
+
+LOAD_USER_COMPLETION_EPOCHS_SQL = """
+    SELECT h.habit_id, c.ts_epoch
+    FROM habits h
+    JOIN completions c ON c.habit_id = h.habit_id
+    WHERE h.user_id = ?
+    ORDER BY h.habit_id, c.ts_epoch
+"""
+
+# Smaller than any day or week index, for queries without a lower bound
+_NO_LOWER_BOUND = -2 ** 62
+
+# Distinct period indexes per habit: day indexes for daily habits, week indexes
+# for weekly ones. Other periodicities read their day rollups through
+# LOAD_USER_COMPLETION_DAYS_SQL, one periodicity at a time.
+LOAD_USER_COMPLETION_PERIODS_SQL = """
+    SELECT h.habit_id, d.day_index AS period
+    FROM habits h
+    JOIN habit_day_rollups d ON d.habit_id = h.habit_id
+    WHERE h.user_id = ? AND h.periodicity = 'daily' AND d.day_index >= ?
+    UNION ALL
+    SELECT h.habit_id, w.week_index
+    FROM habits h
+    JOIN habit_week_rollups w ON w.habit_id = h.habit_id
+    WHERE h.user_id = ? AND h.periodicity = 'weekly' AND w.week_index >= ?
+    ORDER BY 1, 2
+"""
+
+LOAD_USER_COMPLETION_DAYS_SQL = """
+    SELECT h.habit_id, d.day_index
+    FROM habits h
+    JOIN habit_day_rollups d ON d.habit_id = h.habit_id
+    WHERE h.user_id = ? AND h.periodicity = ? AND d.day_index >= ?
+    ORDER BY 1, 2
+"""
+
+
+def load_compact_habits_for_user(conn, user_id):
+    """
+    Loads all habits for a user with completions as integer epoch seconds.
+    No datetime objects are created for completions; see periods.from_epoch
+    for converting a value back when one is needed.
+    Returns a list of Habit objects.
+    """
+    return _load_habits(conn, LOAD_USER_HABITS_SQL, LOAD_USER_COMPLETION_EPOCHS_SQL, (user_id,), compact=True)
+
+
+def load_habit_arrays_for_user(conn, user_id):
+    """
+    Loads all habits for a user as CompactHabit objects, whose completions are
+    kept in an array of epoch seconds. This uses the least memory per completion.
+    Returns a list of CompactHabit objects.
+    """
+    return _load_habits(conn, LOAD_USER_HABITS_SQL, LOAD_USER_COMPLETION_EPOCHS_SQL, (user_id,), compact=True,
+                        habit_class=CompactHabit)
+
+
+def load_completion_periods(conn, user_id, since=None):
+    """
+    Loads the ascending ordinals of the completed periods (day index for daily
+    habits, week index for weekly habits, Periodicity.to_ordinal for the rest)
+    of every habit a user owns, from the rollups. With `since`, a date, only the
+    periods from the one containing it on are loaded, which keeps windowed
+    reports from reading whole histories.
+    Returns a dict mapping habit_id to a list of ints, in habit_id order;
+    habits without completed periods or with an unregistered periodicity are
+    absent.
+    """
+    _flush_write_behind(conn)
+    first_day = periods.day_of_date(since) if since is not None else _NO_LOWER_BOUND
+    backend = _backend_of(conn)
+    if backend is not None:
+        return _backend_completion_periods(conn, backend, user_id, first_day)
+    result = {}
+    current_id = None
+    values = None
+    params = (user_id, first_day, user_id, periods.week_index(first_day))
+    for habit_id, period in _tuple_cursor(conn).execute(LOAD_USER_COMPLETION_PERIODS_SQL, params):
+        if habit_id != current_id:
+            current_id = habit_id
+            values = result[habit_id] = []
+        values.append(period)
+
+    others = conn.execute("""
+        SELECT DISTINCT periodicity FROM habits WHERE user_id = ? AND periodicity NOT IN ('daily', 'weekly')
+    """, (user_id,)).fetchall()
+    for (periodicity,) in others:
+        period = periods.get_periodicity(periodicity)
+        if period is None:
+            continue
+        # Start at the first day of the period containing first_day, so that it is read whole
+        params = (user_id, periodicity, period.first_day(period.to_ordinal(first_day)))
+        rows = _tuple_cursor(conn).execute(LOAD_USER_COMPLETION_DAYS_SQL, params)
+        for habit_id, days in itertools.groupby(rows, key=operator.itemgetter(0)):
+            ordinals = list(period.completed_ordinals(day for _, day in days))
+            if ordinals:
+                result[habit_id] = ordinals
+    return dict(sorted(result.items())) if others else result
+
+
+# --- Streaming ---
+# iter_habits_for_user walks the habits and completions queries side by side
+# with fetchmany, so only one batch of rows of each is held at a time.
+
+def _iter_rows(cursor, batch_size):
+    """Yields the rows of an executed cursor, fetching `batch_size` at a time."""
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def iter_habits_for_user(conn, user_id, batch_size=1000, compact=False):
+    """
+    Streams a user's habits in habit_id order without loading them all.
+
+    Each yielded Habit carries its streak summary, and its `completions` is a
+    one-shot iterator over the habit's completions in timestamp order: datetimes,
+    or epoch seconds with compact=True. The iterator reads from a cursor shared
+    by all habits, so it is only valid until the next habit is requested;
+    completions not consumed by then are skipped. The connection's write-behind
+    buffer is flushed first.
+    """
+    _flush_write_behind(conn)
+    habit_rows = _iter_rows(_tuple_cursor(conn).execute(LOAD_USER_HABITS_SQL, (user_id,)), batch_size)
+    backend = _backend_of(conn)
+    if backend is not None:
+        yield from _iter_backend_habits(backend, habit_rows, batch_size, compact)
+        return
+    completions_sql = LOAD_USER_COMPLETION_EPOCHS_SQL if compact else LOAD_USER_COMPLETIONS_SQL
+    completion_rows = _iter_rows(_tuple_cursor(conn).execute(completions_sql, (user_id,)), batch_size)
+    parse = None if compact else datetime.datetime.fromisoformat
+
+    # Both queries are ordered by habit_id, so each habit's completions are the
+    # next group of completion rows, if that group belongs to it
+    groups = itertools.groupby(completion_rows, key=operator.itemgetter(0))
+    group_id, group = next(groups, (None, None))
+    for row in habit_rows:
+        habit = _habit_from_row(row)
+        habit_id = habit.habit_id
+        if group_id == habit_id:
+            values = map(operator.itemgetter(1), group)
+            habit.completions = map(parse, values) if parse else values
+            yield habit
+            group_id, group = next(groups, (None, None))
+        else:
+            habit.completions = iter(())
+            yield habit
+
+
+# --- SQL-side analytics ---
+# These answer per-habit questions with aggregates in SQLite, so no completion
+# lists reach Python. analyzer keeps the equivalent in-memory functions. Each
+# flushes the connection's write-behind buffer first so its answer includes
+# buffered completions.
+
+def load_last_completions(conn, user_id):
+    """
+    Loads the latest completion timestamp of each of a user's habits.
+    Returns a dict mapping habit_id to a datetime, or to None for habits that
+    were never completed.
+    """
+    _flush_write_behind(conn)
+    backend = _backend_of(conn)
+    if backend is not None:
+        habit_ids = [row[0] for row in conn.execute("SELECT habit_id FROM habits WHERE user_id = ?", (user_id,))]
+        return {habit_id: periods.from_epoch_micros(values[-1]) if values else None
+                for habit_id, values in backend.scan(habit_ids).items()}
+    cursor = _tuple_cursor(conn).execute("""
+        SELECT h.habit_id, (SELECT MAX(c.timestamp) FROM completions c WHERE c.habit_id = h.habit_id)
+        FROM habits h
+        WHERE h.user_id = ?
+    """, (user_id,))
+    return {habit_id: datetime.datetime.fromisoformat(last) if last is not None else None
+            for habit_id, last in cursor}
+
+
+def load_habits_missed_since(conn, user_id, cutoff):
+    """
+    Loads a user's habits whose latest completion is older than `cutoff`, or
+    that were never completed.
+    Returns Habit objects with their streak summary but without completions.
+    """
+    _flush_write_behind(conn)
+    backend = _backend_of(conn)
+    if backend is not None:
+        habit_rows = _tuple_cursor(conn).execute(LOAD_USER_HABITS_SQL, (user_id,)).fetchall()
+        scanned = backend.scan([row[0] for row in habit_rows])
+        cutoff_micros = periods.to_epoch_micros(cutoff)
+        return _build_habits([row for row in habit_rows
+                              if not scanned[row[0]] or scanned[row[0]][-1] < cutoff_micros], ())
+    # ISO-8601 strings of naive datetimes order the same way as the datetimes
+    habit_rows = _tuple_cursor(conn).execute("""
+        SELECT h.habit_id, h.name, h.periodicity, h.created_at, h.is_active,
+               s.current_streak, s.longest_streak, s.last_period, s.total_count
+        FROM habits h
+        LEFT JOIN habit_streaks s ON s.habit_id = h.habit_id
+        WHERE h.user_id = ?
+          AND COALESCE((SELECT MAX(c.timestamp) FROM completions c WHERE c.habit_id = h.habit_id), '') < ?
+        ORDER BY h.habit_id
+    """, (user_id, cutoff.isoformat()))
+    return _build_habits(habit_rows, ())
+
+
+def load_habits_by_periodicity(conn, user_id, periodicity):
+    """
+    Loads a user's habits of one periodicity, e.g. "daily" or "3x-weekly".
+    Returns Habit objects with their streak summary but without completions.
+    """
+    _flush_write_behind(conn)
+    habit_rows = _tuple_cursor(conn).execute("""
+        SELECT h.habit_id, h.name, h.periodicity, h.created_at, h.is_active,
+               s.current_streak, s.longest_streak, s.last_period, s.total_count
+        FROM habits h
+        LEFT JOIN habit_streaks s ON s.habit_id = h.habit_id
+        WHERE h.user_id = ? AND h.periodicity = ?
+        ORDER BY h.habit_id
+    """, (user_id, periodicity))
+    return _build_habits(habit_rows, ())
+
+
+def list_habits(conn, user_id):
+    """
+    Loads a user's habits with their streak summary but without completions.
+    Returns a list of Habit objects.
+    """
+    _flush_write_behind(conn)
+    return _build_habits(_tuple_cursor(conn).execute(LOAD_USER_HABITS_SQL, (user_id,)), ())
+
+
+def find_user(conn, username):
+    """Returns the user ID of a username, or None."""
+    row = conn.execute("SELECT user_id FROM users WHERE username = ?", (username,)).fetchone()
+    return row[0] if row is not None else None
 
 
 def save_completion(conn, habit_id, timestamp):
-    """Saves a completion for a habit to the database."""
+    """
+    Saves a completion for a habit to the database and updates its rollups and
+    streak summary.
+    On a connection with a write-behind buffer (see enable_write_behind) the
+    completion is queued instead, unless a unit_of_work block is open. On a
+    connection with a completion backend it is appended there.
+    A timezone-aware timestamp is recorded on the wall clock of the habit's
+    owner (see set_user_timezone).
+    """
+    timestamp = _local_timestamp(conn, habit_id, timestamp)
+    backend = _backend_of(conn)
+    if backend is not None:
+        backend.append(habit_id, periods.to_epoch_micros(timestamp))
+        _cache_completions_added(conn, [(habit_id, timestamp)])
+        return
+    buffer = _buffer_of(conn)
+    if buffer is not None and not _unit_of_work_depth(conn):
+        buffer.add(habit_id, timestamp)
+        _cache_completions_added(conn, [(habit_id, timestamp)])
+        return
+    columns = periods.completion_columns(timestamp)
     cursor = conn.cursor()
-    cursor.execute("INSERT INTO completions (habit_id, timestamp) VALUES (?, ?)",
-                   (habit_id, timestamp.isoformat()))
-    conn.commit()
+    cursor.execute(SAVE_COMPLETION_SQL, (habit_id, *columns))
+    _record_rollups(conn, habit_id, columns)
+    _record_streak_period(conn, habit_id, columns)
+    _commit(conn)
+    _cache_completions_added(conn, [(habit_id, timestamp)], persisted=True)
+
+
+def save_completions(conn, completions):
+    """
+    Saves many new completions in one transaction and folds them into the
+    rollups and streak summaries incrementally, as save_completion does for
+    one. The work grows with the completions saved rather than with the habits'
+    histories, which suits a stream of small batches; save_completions_bulk
+    rebuilds the affected habits instead, which suits loading histories.
+    `completions` is an iterable of (habit_id, timestamp) pairs. On a
+    connection with a completion backend they are appended there.
+    Returns the number of completions saved.
+    """
+    zones = {}
+    completions = [(habit_id, timestamp if timestamp.tzinfo is None
+                    else _local_timestamp(conn, habit_id, timestamp, zones))
+                   for habit_id, timestamp in completions]
+    if _backend_of(conn) is not None:
+        return save_completions_bulk(conn, completions)
+    # Queued completions are older, and the streak fold expects them first
+    _flush_write_behind(conn)
+    rows = [(habit_id, *periods.completion_columns(timestamp)) for habit_id, timestamp in completions]
+    days = collections.Counter((habit_id, day, week) for habit_id, _, _, day, week in rows)
+    weeks = {(habit_id, week) for habit_id, _, week in days}
+    with unit_of_work(conn):
+        conn.executemany(SAVE_COMPLETION_SQL, rows)
+        conn.executemany(RECORD_DAY_ROLLUPS_SQL, [(*day, count) for day, count in days.items()])
+        conn.executemany(REBUILD_WEEK_ROLLUPS_SQL.format(condition="d.habit_id = ? AND d.day_index BETWEEN ? AND ?"),
+                         [(habit_id, *periods.week_days(week)) for habit_id, week in weeks])
+        _record_streak_periods(conn, rows)
+    _cache_completions_added(conn, completions, persisted=True)
+    return len(rows)
+
+
+def delete_completion(conn, habit_id, timestamp):
+    """
+    Deletes the completions of a habit logged at exactly `timestamp` and rebuilds
+    the habit's rollups and streak summary. Returns the number of completions deleted.
+    An aware `timestamp` is matched on the owner's wall clock, as save_completion stores it.
+    """
+    timestamp = _local_timestamp(conn, habit_id, timestamp)
+    _flush_write_behind(conn)
+    backend = _backend_of(conn)
+    if backend is not None:
+        deleted = backend.delete(habit_id, periods.to_epoch_micros(timestamp))
+        if deleted:
+            _cache_completion_deleted(conn, habit_id, timestamp)
+        return deleted
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM completions WHERE habit_id = ? AND timestamp = ?", (habit_id, timestamp.isoformat()))
+    if cursor.rowcount:
+        rebuild_rollups(conn, [habit_id])
+        rebuild_streak_summaries(conn, [habit_id])
+    _commit(conn)
+    if cursor.rowcount:
+        _cache_completion_deleted(conn, habit_id, timestamp, persisted=True)
+    return cursor.rowcount
 
 
 def delete_habit(conn, habit_id):
     """Deletes a habit and all its associated completions from the database."""
+    _flush_write_behind(conn)
     cursor = conn.cursor()
+    # Foreign keys are not enforced, so the completions do not cascade
+    cursor.execute("DELETE FROM completions WHERE habit_id = ?", (habit_id,))
     cursor.execute("DELETE FROM habits WHERE habit_id = ?", (habit_id,))
-    conn.commit()
+    cursor.execute("DELETE FROM habit_streaks WHERE habit_id = ?", (habit_id,))
+    cursor.execute("DELETE FROM habit_day_rollups WHERE habit_id = ?", (habit_id,))
+    cursor.execute("DELETE FROM habit_week_rollups WHERE habit_id = ?", (habit_id,))
+    _commit(conn)
+    backend = _backend_of(conn)
+    if backend is not None:
+        backend.delete_habits([habit_id])
+    cache = _cache_of(conn)
+    if cache is not None:
+        cache.remove_habit(habit_id)
 
 
 def delete_user(conn, user_id):
     """Deletes a user and all their habits and completions."""
+    _flush_write_behind(conn)
+    backend = _backend_of(conn)
+    if backend is not None:
+        backend.delete_habits([row[0] for row in
+                               conn.execute("SELECT habit_id FROM habits WHERE user_id = ?", (user_id,))])
     cursor = conn.cursor()
+    # Foreign keys are not enforced, so the habits and completions do not cascade
+    for table in ("completions", "habit_streaks", "habit_day_rollups", "habit_week_rollups"):
+        cursor.execute(f"DELETE FROM {table} WHERE habit_id IN (SELECT habit_id FROM habits WHERE user_id = ?)",
+                       (user_id,))
+    cursor.execute("DELETE FROM habits WHERE user_id = ?", (user_id,))
     cursor.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
-    conn.commit()
+    _commit(conn)
+    _invalidate_habit_cache(conn, user_id)
+
+
+# --- Write-behind completion buffer ---
+# Logging completions one save_completion at a time costs one transaction each.
+# A connection can opt in to a write-behind buffer that queues completions in
+# memory and writes them with save_completions_bulk in one transaction. The
+# habit loaders merge queued completions into their results; every other read
+# and write on the connection flushes the buffer first.
+
+class CompletionBuffer:
+    """
+    Queues completions in memory and writes them in batches.
+
+    Queued completions are written in one transaction, in the order they were
+    saved, once `max_pending` are queued or the oldest has waited
+    `flush_interval_ms`, whichever comes first. flush_interval_ms=0 writes
+    every completion before save_completion returns; larger values trade a
+    window of lost writes on a crash for fewer transactions. Batches are
+    written on a dedicated connection to the same database file, from the
+    saving thread or from a background timer thread.
+
+    A failed flush rolls back and keeps its completions queued for the next
+    attempt; the error is kept in `last_error`.
+    """
+
+    def __init__(self, path, max_pending=1000, flush_interval_ms=100, **pragmas):
+        if max_pending < 1:
+            raise ValueError("max_pending must be at least 1.")
+        if flush_interval_ms < 0:
+            raise ValueError("flush_interval_ms cannot be negative.")
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval_ms / 1000
+        self.flushes = 0
+        self.completions_flushed = 0
+        self.last_error = None
+        self._conn = get_db_connection(path, check_same_thread=False, **pragmas)
+        self._pending = []
+        self._oldest_at = None
+        self._lock = threading.RLock()
+        self._wake = threading.Condition(self._lock)
+        self._closed = False
+        self._timer = None
+        if self.flush_interval:
+            self._timer = threading.Thread(target=self._flush_loop, name="completion-write-behind", daemon=True)
+            self._timer.start()
+
+    def add(self, habit_id, timestamp):
+        """Queues a completion, flushing if a threshold is reached."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The completion buffer is closed.")
+            self._pending.append((habit_id, timestamp))
+            if self._oldest_at is None:
+                self._oldest_at = time.monotonic()
+                self._wake.notify()
+            if not self.flush_interval or len(self._pending) >= self.max_pending:
+                self.flush()
+
+    def pending(self):
+        """Returns the queued (habit_id, timestamp) pairs, oldest first."""
+        with self._lock:
+            return list(self._pending)
+
+    def flush(self, conn=None):
+        """
+        Writes every queued completion in one transaction, or within the open
+        transaction of `conn`, the connection the buffer saves for, whose lock
+        the buffer's own connection would wait on. Returns the number written.
+        """
+        with self._lock:
+            if not self._pending:
+                return 0
+            try:
+                if conn is None:
+                    count = save_completions_bulk(self._conn, self._pending)
+                else:
+                    # Already in conn's habit cache, so written without patching it again
+                    count = _insert_completions(conn, self._pending)
+            except Exception as e:
+                self.last_error = e
+                raise
+            self._pending = []
+            self._oldest_at = None
+            self.flushes += 1
+            self.completions_flushed += count
+            return count
+
+    def close(self):
+        """Flushes the queue and stops the buffer. A failed flush leaves it open."""
+        with self._lock:
+            if self._closed:
+                return
+            self.flush()
+            self._closed = True
+            self._wake.notify_all()
+        if self._timer is not None:
+            self._timer.join()
+        self._conn.close()
+
+    def _flush_loop(self):
+        with self._lock:
+            while not self._closed:
+                if self._oldest_at is None:
+                    self._wake.wait()
+                    continue
+                remaining = self._oldest_at + self.flush_interval - time.monotonic()
+                if remaining > 0:
+                    self._wake.wait(remaining)
+                    continue
+                try:
+                    self.flush()
+                except Exception:
+                    # Already recorded in last_error; retry after another interval
+                    self._oldest_at = time.monotonic()
+
+
+def _database_path(conn):
+    """Returns the file path of a connection's main database."""
+    for _, name, path in conn.execute("PRAGMA database_list"):
+        if name == "main" and path:
+            return path
+    raise ValueError("Write-behind needs a file-backed database, not ':memory:'.")
+
+
+def enable_write_behind(conn, max_pending=1000, flush_interval_ms=100, **pragmas):
+    """
+    Routes save_completion calls on `conn` through a CompletionBuffer.
+    Keyword arguments are passed to get_db_connection for the buffer's own
+    connection, e.g. synchronous="FULL". The buffer is also flushed when the
+    interpreter exits normally; call disable_write_behind to flush and stop it
+    earlier. Returns the buffer.
+    """
+    _check_connection(conn)
+    if _buffer_of(conn) is not None:
+        raise ValueError("Write-behind is already enabled on this connection.")
+    if _backend_of(conn) is not None:
+        raise ValueError("Write-behind cannot be combined with a completion backend.")
+    buffer = CompletionBuffer(_database_path(conn), max_pending, flush_interval_ms, **pragmas)
+    conn._write_behind = buffer
+    atexit.register(buffer.close)
+    return buffer
+
+
+def disable_write_behind(conn):
+    """Flushes and removes the write-behind buffer of a connection, if it has one."""
+    buffer = _buffer_of(conn)
+    if buffer is None:
+        return
+    buffer.close()
+    conn._write_behind = None
+    atexit.unregister(buffer.close)
+
+
+def _flush_write_behind(conn):
+    buffer = _buffer_of(conn)
+    if buffer is not None:
+        buffer.flush(conn if conn.in_transaction else None)
+
+
+@contextlib.contextmanager
+def _pending_completions(conn):
+    """
+    Yields the completions queued for `conn`. Flushes wait until the block
+    exits, so a load inside it sees each completion exactly once.
+    """
+    buffer = _buffer_of(conn)
+    if buffer is None:
+        yield ()
+        return
+    with buffer._lock:
+        yield buffer.pending()
+
+
+def _merge_pending(habits, pending, compact=False):
+    """Inserts queued completions into loaded habits, keeping them in ascending order."""
+    if not pending:
+        return habits
+    by_id = {h.habit_id: h for h in habits}
+    for habit_id, timestamp in pending:
+        habit = by_id.get(habit_id)
+        if habit is None:
+            continue
+        iso, epoch, _, _ = periods.completion_columns(timestamp)
+        if isinstance(habit, CompactHabit):
+            bisect.insort(habit.epochs, epoch)
+        else:
+            bisect.insort(habit.completions, epoch if compact else datetime.datetime.fromisoformat(iso))
+        # The persisted summary does not count queued completions yet
+        habit.streak_summary = None
+    return habits
+
+
+# --- Habit cache ---
+# An interactive session loads the same user's habits for every menu action. A
+# connection can opt in to a HabitCache that keeps load_habits_for_user results
+# per user. Writes made through the connection patch the cached habits, so a
+# load after a write costs the write's delta instead of a reload. The cache
+# stores and hands out copies of the habits, so callers may change theirs, as
+# HabitTracker.log_completion does before it saves the completion.
+# Writes made through other connections or processes are not seen.
+
+# Rough per-object sizes for HabitCache.max_bytes: a Habit with its __dict__
+# and strings, and a datetime plus its list slot
+_CACHED_HABIT_BYTES = 600
+_CACHED_COMPLETION_BYTES = 56
+
+
+def _cached_size(habits):
+    return sum(_CACHED_HABIT_BYTES + len(h.completions) * _CACHED_COMPLETION_BYTES for h in habits)
+
+
+def _copy_habit(habit):
+    """A copy of a habit with its own completions list."""
+    habit = copy.copy(habit)
+    habit.completions = list(habit.completions)
+    return habit
+
+
+class HabitCache:
+    """
+    Keeps the habits of recently loaded users, evicting the least recently used
+    user once more than `max_users` are cached or their estimated size exceeds
+    `max_bytes`. A user whose habits alone exceed `max_bytes` is not cached.
+
+    `hits`, `misses` and `evictions` count lookups and evicted users; `size` is
+    the current size estimate in bytes.
+    """
+
+    def __init__(self, max_users=32, max_bytes=64 * 1024 * 1024):
+        if max_users < 1:
+            raise ValueError("max_users must be at least 1.")
+        self.max_users = max_users
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = 0
+        self._entries = collections.OrderedDict()  # user_id -> [habits, size]
+        self._owners = {}  # habit_id -> user_id of every cached habit
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, habit_id):
+        return habit_id in self._owners
+
+    def get(self, user_id):
+        """Returns copies of a user's cached habits, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return [_copy_habit(h) for h in entry[0]]
+
+    def put(self, user_id, habits):
+        """Caches copies of a user's habits, evicting others as needed."""
+        habits = [_copy_habit(h) for h in habits]
+        size = _cached_size(habits)
+        with self._lock:
+            self._discard(user_id)
+            if size > self.max_bytes:
+                return
+            self._entries[user_id] = [habits, size]
+            self._owners.update((h.habit_id, user_id) for h in habits)
+            self.size += size
+            while len(self._entries) > self.max_users or self.size > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, user_id=None):
+        """Drops a user's entry, or every entry when user_id is None."""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+                self._owners.clear()
+                self.size = 0
+            else:
+                self._discard(user_id)
+
+    def add_completions(self, rows, summaries):
+        """
+        Inserts (habit_id, timestamp) rows into the cached habits, keeping their
+        completions in order, and gives each patched habit its summary from the
+        `summaries` dict, or None.
+        """
+        by_habit = {}
+        for habit_id, timestamp in rows:
+            by_habit.setdefault(habit_id, []).append(timestamp)
+        for habit_id, timestamps in by_habit.items():
+            def patch(habit):
+                for timestamp in timestamps:
+                    bisect.insort(habit.completions, timestamp)
+                habit.streak_summary = summaries.get(habit_id)
+            self._patch(habit_id, patch)
+
+    def remove_completions(self, habit_id, timestamp, summary):
+        """Removes a cached habit's completions at exactly `timestamp` and sets its summary."""
+        def patch(habit):
+            habit.completions = [ts for ts in habit.completions if ts != timestamp]
+            habit.streak_summary = summary
+        self._patch(habit_id, patch)
+
+    def remove_habit(self, habit_id):
+        """Removes a habit from its owner's cached habits."""
+        with self._lock:
+            user_id = self._owners.pop(habit_id, None)
+            if user_id is None:
+                return
+            entry = self._entries[user_id]
+            removed = [h for h in entry[0] if h.habit_id == habit_id]
+            entry[0] = [h for h in entry[0] if h.habit_id != habit_id]
+            self._resize(entry, entry[1] - _cached_size(removed))
+
+    def _patch(self, habit_id, patch):
+        """Changes a cached habit with patch(habit)."""
+        with self._lock:
+            user_id = self._owners.get(habit_id)
+            if user_id is None:
+                return
+            entry = self._entries[user_id]
+            habits = entry[0]
+            for i, habit in enumerate(habits):
+                if habit.habit_id == habit_id:
+                    count = len(habit.completions)
+                    patch(habit)
+                    self._resize(entry, entry[1] + (len(habit.completions) - count) * _CACHED_COMPLETION_BYTES)
+                    break
+            if self.size > self.max_bytes:
+                self._discard(user_id)
+                self.evictions += 1
+
+    def _resize(self, entry, size):
+        self.size += size - entry[1]
+        entry[1] = size
+
+    def _discard(self, user_id):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self.size -= entry[1]
+            for habit in entry[0]:
+                self._owners.pop(habit.habit_id, None)
+
+
+def enable_habit_cache(conn, max_users=32, max_bytes=64 * 1024 * 1024):
+    """Caches load_habits_for_user results of `conn` in a new HabitCache. Returns the cache."""
+    _check_connection(conn)
+    if _cache_of(conn) is not None:
+        raise ValueError("This connection already has a habit cache.")
+    cache = conn._habit_cache = HabitCache(max_users, max_bytes)
+    return cache
+
+
+def disable_habit_cache(conn):
+    """Removes the habit cache of a connection, if it has one."""
+    if _cache_of(conn) is not None:
+        conn._habit_cache = None
+
+
+def get_habit_cache(conn):
+    """Returns the habit cache of a connection, or None."""
+    return _cache_of(conn)
+
+
+def _invalidate_habit_cache(conn, user_id=None):
+    cache = _cache_of(conn)
+    if cache is not None:
+        cache.invalidate(user_id)
+
+
+def _load_summaries(conn, habit_ids):
+    """Returns {habit_id: StreakSummary} for those of the given habits that have a summary row."""
+    habit_ids = list(habit_ids)
+    summaries = {}
+    for start in range(0, len(habit_ids), _REBUILD_CHUNK_SIZE):
+        chunk = habit_ids[start:start + _REBUILD_CHUNK_SIZE]
+        placeholders = ", ".join("?" * len(chunk))
+        for habit_id, *summary in _tuple_cursor(conn).execute(f"""
+            SELECT habit_id, current_streak, longest_streak, last_period, total_count
+            FROM habit_streaks WHERE habit_id IN ({placeholders})
+        """, chunk):
+            summaries[habit_id] = StreakSummary(*summary)
+    return summaries
+
+
+def _cache_completions_added(conn, rows, persisted=False):
+    """
+    Patches saved completions into the connection's habit cache. Summaries are
+    reread when the completions went to the completions table (`persisted`);
+    queued or backend completions leave the habit without one, as the loaders do.
+    """
+    cache = _cache_of(conn)
+    if cache is None:
+        return
+    rows = [row for row in rows if row[0] in cache]
+    if rows:
+        cache.add_completions(rows, _load_summaries(conn, {row[0] for row in rows}) if persisted else {})
+
+
+def _cache_completion_deleted(conn, habit_id, timestamp, persisted=False):
+    cache = _cache_of(conn)
+    if cache is not None and habit_id in cache:
+        cache.remove_completions(habit_id, timestamp,
+                                 _load_summaries(conn, [habit_id]).get(habit_id) if persisted else None)
+
+
+# --- Completion backends ---
+# By default completions live in the completions table. A connection can have a
+# completion backend instead, such as completion_log.CompletionLog, which every
+# function of this module then reads and writes completions through. Users and
+# habits stay in SQLite. A backend stores (habit_id, wall-clock epoch
+# microseconds) pairs and provides:
+#   append(habit_id, micros) and append_many(rows) -> number appended
+#   scan(habit_ids) -> {habit_id: ascending list of micros}
+#   delete(habit_id, micros) and delete_habits(habit_ids) -> number deleted
+#   close()
+# Streak summaries are not kept for backend completions, so analyzer computes
+# streaks from the completions themselves.
+
+def set_completion_backend(conn, backend):
+    """Routes the completions of `conn` to `backend`. Returns the backend."""
+    _check_connection(conn)
+    if _backend_of(conn) is not None:
+        raise ValueError("This connection already has a completion backend.")
+    if _buffer_of(conn) is not None:
+        raise ValueError("A completion backend cannot be combined with write-behind.")
+    conn._completion_backend = backend
+    _invalidate_habit_cache(conn)
+    return backend
+
+
+def attach_completion_log(conn, directory, **options):
+    """
+    Stores the completions of `conn` in a completion_log.CompletionLog in
+    `directory`. Keyword arguments are passed to CompletionLog. Returns the log.
+    """
+    _check_connection(conn)
+    import completion_log  # Imported on demand, like any other backend
+    return set_completion_backend(conn, completion_log.CompletionLog(directory, **options))
+
+
+def detach_completion_backend(conn):
+    """Closes and removes the completion backend of a connection, if it has one."""
+    backend = _backend_of(conn)
+    if backend is not None:
+        conn._completion_backend = None
+        backend.close()
+        _invalidate_habit_cache(conn)
+
+
+def _backend_completion_rows(backend, habit_rows, compact):
+    """Yields (habit_id, value) completion rows for habit rows, grouped by habit."""
+    scanned = backend.scan([row[0] for row in habit_rows])
+    for row in habit_rows:
+        habit_id = row[0]
+        for micros in scanned[habit_id]:
+            yield habit_id, micros // 1000000 if compact else periods.from_epoch_micros(micros)
+
+
+def _iter_backend_habits(backend, habit_rows, batch_size, compact):
+    """Yields habits with completion iterators, scanning the backend once per batch of habits."""
+    to_value = (lambda micros: micros // 1000000) if compact else periods.from_epoch_micros
+    while True:
+        batch = list(itertools.islice(habit_rows, batch_size))
+        if not batch:
+            return
+        scanned = backend.scan([row[0] for row in batch])
+        for row in batch:
+            habit = _habit_from_row(row)
+            habit.completions = map(to_value, scanned[habit.habit_id])
+            yield habit
+
+
+def _backend_completion_periods(conn, backend, user_id, first_day):
+    habit_rows = [(habit_id, periods.get_periodicity(periodicity)) for habit_id, periodicity in conn.execute(
+        "SELECT habit_id, periodicity FROM habits WHERE user_id = ? ORDER BY habit_id", (user_id,))]
+    habit_rows = [(habit_id, period) for habit_id, period in habit_rows if period is not None]
+    scanned = backend.scan([habit_id for habit_id, _ in habit_rows])
+    result = {}
+    for habit_id, period in habit_rows:
+        days = sorted({micros // 1000000 // periods.SECONDS_PER_DAY for micros in scanned[habit_id]})
+        values = list(period.completed_ordinals(days))
+        values = values[bisect.bisect_left(values, period.to_ordinal(first_day)):]
+        if values:
+            result[habit_id] = values
+    return result
+
+
+def _backend_export_rows(conn, backend, batch_size):
+    habit_ids = _iter_rows(_tuple_cursor(conn).execute(f"SELECT h.habit_id FROM habits h WHERE {_OWNED_HABITS} "
+                                                       "ORDER BY h.habit_id"), batch_size)
+    while True:
+        batch = [row[0] for row in itertools.islice(habit_ids, batch_size)]
+        if not batch:
+            return
+        scanned = backend.scan(batch)
+        for habit_id in batch:
+            for micros in scanned[habit_id]:
+                yield habit_id, periods.from_epoch_micros(micros).isoformat(), micros
+
+
+# --- Period rollups ---
+# habit_day_rollups holds, per habit and day with a completion, the completion
+# count; habit_week_rollups aggregates those rows per ISO week, with the number
+# of days completed. A week's `completed` flag means the habit met its target:
+# all seven days for a daily habit, Periodicity.required days for any other
+# (one for a weekly habit, N for an "Nx-weekly" one). Day rows
+# only exist for days with completions, so their flag is always set.
+# save_completion folds a completion into its day row and recomputes the one
+# week row from at most seven day rows; deletes rebuild the habit's rollups.
+# Rollups cover the completions table only, so they are not kept for a
+# connection with a completion backend.
+
+RECORD_DAY_ROLLUP_SQL = """
+    INSERT INTO habit_day_rollups (habit_id, day_index, week_index, completions, completed) VALUES (?, ?, ?, 1, 1)
+    ON CONFLICT (habit_id, day_index) DO UPDATE SET completions = completions + 1
+"""
+
+# RECORD_DAY_ROLLUP_SQL for several completions of one day at once
+RECORD_DAY_ROLLUPS_SQL = """
+    INSERT INTO habit_day_rollups (habit_id, day_index, week_index, completions, completed) VALUES (?, ?, ?, ?, 1)
+    ON CONFLICT (habit_id, day_index) DO UPDATE SET completions = completions + excluded.completions
+"""
+
+REBUILD_DAY_ROLLUPS_SQL = """
+    INSERT INTO habit_day_rollups (habit_id, day_index, week_index, completions, completed)
+    SELECT c.habit_id, c.day_index, MAX(c.week_index), COUNT(*), 1
+    FROM completions c
+    WHERE {condition}
+    GROUP BY c.habit_id, c.day_index
+"""
+
+REBUILD_WEEK_ROLLUPS_SQL = """
+    INSERT OR REPLACE INTO habit_week_rollups (habit_id, week_index, completions, days_completed, completed)
+    SELECT d.habit_id, d.week_index, SUM(d.completions), COUNT(*),
+           CASE h.periodicity WHEN 'daily' THEN COUNT(*) = 7 WHEN 'weekly' THEN 1
+                ELSE COUNT(*) >= period_required(h.periodicity) END
+    FROM habit_day_rollups d
+    JOIN habits h ON h.habit_id = d.habit_id
+    WHERE {condition}
+    GROUP BY d.habit_id, d.week_index
+"""
+
+
+def _record_rollups(conn, habit_id, columns):
+    """Folds one newly inserted completion into the habit's day and week rollups."""
+    _, _, day, week = columns
+    conn.execute(RECORD_DAY_ROLLUP_SQL, (habit_id, day, week))
+    conn.execute(REBUILD_WEEK_ROLLUPS_SQL.format(condition="d.habit_id = ? AND d.day_index BETWEEN ? AND ?"),
+                 (habit_id, *periods.week_days(week)))
+
+
+def rebuild_rollups(conn, habit_ids=None):
+    """Recomputes the day and week rollups of the given habits, or of every habit when habit_ids is None."""
+    with unit_of_work(conn):
+        if habit_ids is None:
+            conn.execute("DELETE FROM habit_day_rollups")
+            conn.execute("DELETE FROM habit_week_rollups")
+            conn.execute(REBUILD_DAY_ROLLUPS_SQL.format(condition="1"))
+            conn.execute(REBUILD_WEEK_ROLLUPS_SQL.format(condition="1"))
+            return
+        habit_ids = list(habit_ids)
+        for start in range(0, len(habit_ids), _REBUILD_CHUNK_SIZE):
+            chunk = habit_ids[start:start + _REBUILD_CHUNK_SIZE]
+            placeholders = ", ".join("?" * len(chunk))
+            conn.execute(f"DELETE FROM habit_day_rollups WHERE habit_id IN ({placeholders})", chunk)
+            conn.execute(f"DELETE FROM habit_week_rollups WHERE habit_id IN ({placeholders})", chunk)
+            conn.execute(REBUILD_DAY_ROLLUPS_SQL.format(condition=f"c.habit_id IN ({placeholders})"), chunk)
+            conn.execute(REBUILD_WEEK_ROLLUPS_SQL.format(condition=f"d.habit_id IN ({placeholders})"), chunk)
+
+
+def _check_rollups(conn):
+    _flush_write_behind(conn)
+    if _backend_of(conn) is not None:
+        raise ValueError("Rollups are not kept for a connection with a completion backend.")
+
+
+def load_period_counts(conn, user_id, start, end, unit="day"):
+    """
+    Counts a user's completions per day, or per week with unit="week", from the
+    rollups. `start` and `end` are dates and inclusive; weeks overlapping them
+    count in full.
+    Returns a list of (first date of the period, completions) for every period
+    in the range, including periods without completions.
+    """
+    _check_rollups(conn)
+    first, last = periods.day_of_date(start), periods.day_of_date(end)
+    if unit == "day":
+        table, column = "habit_day_rollups", "day_index"
+        to_date = periods.date_of_day
+    elif unit == "week":
+        table, column = "habit_week_rollups", "week_index"
+        first, last = periods.week_index(first), periods.week_index(last)
+        to_date = lambda week: periods.date_of_day(periods.week_days(week)[0])  # noqa: E731
+    else:
+        raise ValueError(f"Unknown rollup unit: {unit}")
+    # Table and column names come from the two choices above, not from callers
+    counts = dict(_tuple_cursor(conn).execute(f"""
+        SELECT r.{column}, SUM(r.completions)
+        FROM habits h
+        JOIN {table} r ON r.habit_id = h.habit_id
+        WHERE h.user_id = ? AND r.{column} BETWEEN ? AND ?
+        GROUP BY r.{column}
+    """, (user_id, first, last)))
+    return [(to_date(period), counts.get(period, 0)) for period in range(first, last + 1)]
+
+
+def load_completion_rates(conn, user_id, start, end):
+    """
+    Computes the completion rate of each of a user's daily and weekly habits
+    from `start` to `end` (dates, inclusive) from the rollups: the share of its
+    days, or of its weeks overlapping the range, that were completed, counting
+    only periods from the habit's creation on.
+    Returns a dict mapping habit_id to a float between 0 and 1, or to None for
+    habits created after `end`.
+    """
+    _check_rollups(conn)
+    first_day, last_day = periods.day_of_date(start), periods.day_of_date(end)
+    first_week, last_week = periods.week_index(first_day), periods.week_index(last_day)
+    rows = _tuple_cursor(conn).execute("""
+        SELECT h.habit_id, h.periodicity, h.created_at,
+               CASE h.periodicity
+                   WHEN 'daily' THEN (SELECT COUNT(*) FROM habit_day_rollups d
+                                      WHERE d.habit_id = h.habit_id AND d.day_index BETWEEN ? AND ?)
+                   ELSE (SELECT COUNT(*) FROM habit_week_rollups w
+                         WHERE w.habit_id = h.habit_id AND w.week_index BETWEEN ? AND ? AND w.completed)
+               END
+        FROM habits h
+        WHERE h.user_id = ? AND h.periodicity IN ('daily', 'weekly')
+        ORDER BY h.habit_id
+    """, (first_day, last_day, first_week, last_week, user_id))
+    rates = {}
+    for habit_id, periodicity, created_at, completed in rows:
+        created_day = periods.day_of_date(datetime.datetime.fromisoformat(created_at).date())
+        if periodicity == "daily":
+            total = last_day - max(first_day, created_day) + 1
+        else:
+            total = last_week - max(first_week, periods.week_index(created_day)) + 1
+        rates[habit_id] = completed / total if total > 0 else None
+    return rates
+
+
+# --- Streak summaries ---
+# habit_streaks holds, per habit, the current and longest streak, the latest
+# period ordinal and the completion count. A new completion can only extend the
+# current run, start a new one or land in the latest period again, so
+# save_completion updates the row in O(1). Anything else (a completion in an
+# earlier period, a deleted completion, a missing row, a periodicity needing
+# several days per period) rebuilds it from the day rollups, which hold at most
+# one row per day instead of every completion.
+
+def _period_ordinal(periodicity, columns):
+    """
+    Returns the period ordinal of a completion from its completion_columns
+    values, or None when whether the period is completed depends on its other days.
+    """
+    if periodicity == "daily":
+        return columns[2]
+    elif periodicity == "weekly":
+        return columns[3]
+    period = periods.get_periodicity(periodicity)
+    if period is None:
+        return 0  # Unknown periodicities have a single period, as in analyzer.calculate_streak
+    if period.required > 1:
+        return None
+    return period.to_ordinal(columns[2])
+
+
+def _record_streak_periods(conn, rows):
+    """
+    Folds newly inserted completions, given as (habit_id, *completion_columns)
+    rows, into their habits' streak summaries with one UPDATE per habit.
+    """
+    by_habit = {}
+    for row in rows:
+        by_habit.setdefault(row[0], []).append(row[1:])
+    habit_ids = list(by_habit)
+    states = []
+    for start in range(0, len(habit_ids), _REBUILD_CHUNK_SIZE):
+        chunk = habit_ids[start:start + _REBUILD_CHUNK_SIZE]
+        placeholders = ", ".join("?" * len(chunk))
+        states.extend(_tuple_cursor(conn).execute(f"""
+            SELECT h.habit_id, h.periodicity, s.current_streak, s.longest_streak, s.last_period
+            FROM habits h
+            LEFT JOIN habit_streaks s ON s.habit_id = h.habit_id
+            WHERE h.habit_id IN ({placeholders})
+        """, chunk))
+    rebuild = []
+    updates = []
+    for habit_id, periodicity, current, longest, last_period in states:
+        new_periods = [_period_ordinal(periodicity, columns) for columns in by_habit[habit_id]]
+        if current is None or None in new_periods or min(new_periods) < last_period:
+            rebuild.append(habit_id)
+            continue
+        for period in sorted(set(new_periods)):
+            if period > last_period:
+                current = current + 1 if period == last_period + 1 else 1
+                longest = max(longest, current)
+                last_period = period
+        updates.append((current, longest, last_period, len(new_periods), habit_id))
+    if rebuild:
+        rebuild_streak_summaries(conn, rebuild)
+    conn.executemany("""
+        UPDATE habit_streaks
+        SET current_streak = ?, longest_streak = ?, last_period = ?, total_count = total_count + ?
+        WHERE habit_id = ?
+    """, updates)
+
+
+def _record_streak_period(conn, habit_id, columns):
+    """Folds one newly inserted completion into the habit's streak summary."""
+    row = conn.execute("""
+        SELECT h.periodicity, s.current_streak, s.longest_streak, s.last_period
+        FROM habits h
+        LEFT JOIN habit_streaks s ON s.habit_id = h.habit_id
+        WHERE h.habit_id = ?
+    """, (habit_id,)).fetchone()
+    if row is None:
+        return
+    periodicity, current, longest, last_period = row
+    period = _period_ordinal(periodicity, columns)
+    if current is None or period is None or period < last_period:
+        rebuild_streak_summaries(conn, [habit_id])
+        return
+    if period > last_period:
+        current = current + 1 if period == last_period + 1 else 1
+        longest = max(longest, current)
+    conn.execute("""
+        UPDATE habit_streaks
+        SET current_streak = ?, longest_streak = ?, last_period = ?, total_count = total_count + 1
+        WHERE habit_id = ?
+    """, (current, longest, period, habit_id))
+
+
+# Recomputes summaries from completions with the gaps-and-islands technique:
+# within a habit, consecutive distinct periods share the same value of
+# (period - row number), so grouping by it yields one row per run. Only periods
+# with the days their periodicity requires take part in runs; last_period and
+# total_count cover every period with a completion.
+COMPUTE_STREAK_SUMMARIES_SQL = """
+    WITH completion_periods AS (
+        SELECT d.habit_id,
+               CASE h.periodicity WHEN 'daily' THEN d.day_index WHEN 'weekly' THEN d.week_index
+                    ELSE period_ordinal(h.periodicity, d.day_index) END AS period,
+               SUM(d.completions) AS completions,
+               h.periodicity IN ('daily', 'weekly') OR COUNT(*) >= period_required(h.periodicity) AS met
+        FROM habit_day_rollups d
+        JOIN habits h ON h.habit_id = d.habit_id
+        WHERE {condition}
+        GROUP BY d.habit_id, period
+    ),
+    totals AS (
+        SELECT habit_id, MAX(period) AS last_period, SUM(completions) AS completions
+        FROM completion_periods
+        GROUP BY habit_id
+    ),
+    runs AS (
+        SELECT habit_id, COUNT(*) AS length, MAX(period) AS last_period
+        FROM (SELECT habit_id, period,
+                     period - ROW_NUMBER() OVER (PARTITION BY habit_id ORDER BY period) AS island
+              FROM completion_periods
+              WHERE met)
+        GROUP BY habit_id, island
+    ),
+    ranked_runs AS (
+        SELECT habit_id, length,
+               ROW_NUMBER() OVER (PARTITION BY habit_id ORDER BY last_period DESC) AS recency
+        FROM runs
+    )
+    SELECT t.habit_id, COALESCE(MAX(CASE WHEN r.recency = 1 THEN r.length END), 0), COALESCE(MAX(r.length), 0),
+           t.last_period, t.completions
+    FROM totals t
+    LEFT JOIN ranked_runs r ON r.habit_id = t.habit_id
+    GROUP BY t.habit_id
+"""
+
+REBUILD_STREAK_SUMMARIES_SQL = """
+    INSERT OR REPLACE INTO habit_streaks (habit_id, current_streak, longest_streak, last_period, total_count)
+""" + COMPUTE_STREAK_SUMMARIES_SQL
+
+# Keeps each IN (...) list well below SQLite's bound-parameter limit
+_REBUILD_CHUNK_SIZE = 500
+
+
+def rebuild_streak_summaries(conn, habit_ids=None):
+    """
+    Recomputes the streak summaries of the given habits, or of every habit when
+    habit_ids is None, from their day rollups, which must be current (see
+    rebuild_rollups). Habits without completions are left without a summary.
+    """
+    with unit_of_work(conn):
+        if habit_ids is None:
+            conn.execute("DELETE FROM habit_streaks")
+            conn.execute(REBUILD_STREAK_SUMMARIES_SQL.format(condition="1"))
+            return
+        habit_ids = list(habit_ids)
+        for start in range(0, len(habit_ids), _REBUILD_CHUNK_SIZE):
+            chunk = habit_ids[start:start + _REBUILD_CHUNK_SIZE]
+            placeholders = ", ".join("?" * len(chunk))
+            conn.execute(f"DELETE FROM habit_streaks WHERE habit_id IN ({placeholders})", chunk)
+            conn.execute(REBUILD_STREAK_SUMMARIES_SQL.format(condition=f"d.habit_id IN ({placeholders})"), chunk)
+
+
+def compute_streak_summaries(conn, habit_ids):
+    """
+    Computes the streak summaries of the given habits from their day rollups
+    without storing them, so that readers need not take the write lock.
+    Returns a dict mapping habit_id to StreakSummary; habits without
+    completions are absent.
+    """
+    _flush_write_behind(conn)
+    habit_ids = list(habit_ids)
+    summaries = {}
+    for start in range(0, len(habit_ids), _REBUILD_CHUNK_SIZE):
+        chunk = habit_ids[start:start + _REBUILD_CHUNK_SIZE]
+        placeholders = ", ".join("?" * len(chunk))
+        for habit_id, *summary in _tuple_cursor(conn).execute(
+                COMPUTE_STREAK_SUMMARIES_SQL.format(condition=f"d.habit_id IN ({placeholders})"), chunk):
+            summaries[habit_id] = StreakSummary(*summary)
+    return summaries
+
+
+def build_missing_streak_summaries(conn):
+    """Builds the summaries of habits that have completions but no summary row yet."""
+    with unit_of_work(conn):
+        conn.execute(REBUILD_STREAK_SUMMARIES_SQL.format(
+            condition="d.habit_id NOT IN (SELECT habit_id FROM habit_streaks)"))
+
+
+def iter_streak_summaries(conn, batch_size=1000):
+    """
+    Streams the streak summary of every habit in the database, across all users.
+    Rows are fetched `batch_size` at a time, so the whole table is never held in
+    memory. Habits without a summary row are skipped; call
+    build_missing_streak_summaries first to include them.
+    Yields StreakLeaderboardEntry tuples.
+    """
+    _flush_write_behind(conn)
+    cursor = _tuple_cursor(conn)
+    cursor.execute("""
+        SELECT u.user_id, u.username, h.habit_id, h.name, h.periodicity, s.current_streak, s.longest_streak
+        FROM habit_streaks s
+        JOIN habits h ON h.habit_id = s.habit_id
+        JOIN users u ON u.user_id = h.user_id
+    """)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        for row in rows:
+            yield StreakLeaderboardEntry(*row)
+
+
+def load_streak_summaries(conn, user_id):
+    """
+    Loads the streak summaries of a user's habits without their completions.
+    Returns a dict mapping habit_id to StreakSummary.
+    """
+    _flush_write_behind(conn)
+    cursor = _tuple_cursor(conn).execute("""
+        SELECT s.habit_id, s.current_streak, s.longest_streak, s.last_period, s.total_count
+        FROM habits h
+        JOIN habit_streaks s ON s.habit_id = h.habit_id
+        WHERE h.user_id = ?
+    """, (user_id,))
+    return {habit_id: StreakSummary(*summary) for habit_id, *summary in cursor}
+
+
+# --- Bulk export/import ---
+# transfer.py moves whole databases in and out through these. Completion times
+# travel as wall-clock epoch microseconds, so they round-trip exactly.
+
+# Habits with an owner. Deletes used to leave the habits and completions of
+# deleted users and habits behind; those are not exported.
+_OWNED_HABITS = f"(h.user_id = {LEGACY_USER_ID} OR h.user_id IN (SELECT user_id FROM users))"
+
+EXPORT_SQL = {
+    "users": "SELECT user_id, username, password, full_name, email, timezone FROM users ORDER BY user_id",
+    "habits": f"""
+        SELECT h.habit_id, h.user_id, h.name, h.periodicity, h.created_at, h.is_active
+        FROM habits h
+        WHERE {_OWNED_HABITS}
+        ORDER BY h.habit_id
+    """,
+    # isoformat() writes the six fraction digits only when they are not all zero
+    "completions": f"""
+        SELECT c.habit_id, c.timestamp,
+               c.ts_epoch * 1000000 + CAST(substr(c.timestamp || '.000000', 21, 6) AS INTEGER)
+        FROM completions c
+        WHERE EXISTS (SELECT 1 FROM habits h WHERE h.habit_id = c.habit_id AND {_OWNED_HABITS})
+        ORDER BY c.habit_id, c.timestamp
+    """,
+}
+
+IMPORT_COMPLETION_SQL = """
+    INSERT INTO completions (habit_id, timestamp, ts_epoch, day_index, week_index)
+    VALUES (?1, strftime('%Y-%m-%dT%H:%M:%S', ?2, 'unixepoch') || CASE WHEN ?3 THEN printf('.%06d', ?3) ELSE '' END,
+            ?2, ?4, ?5)
+"""
+
+
+def iter_export_rows(conn, table, batch_size=10000):
+    """
+    Streams every row of 'users', 'habits' or 'completions' as a tuple, fetching
+    `batch_size` rows at a time. The columns are those of EXPORT_SQL; completion
+    rows are (habit_id, timestamp, epoch microseconds) in habit_id, timestamp order.
+    """
+    _flush_write_behind(conn)
+    backend = _backend_of(conn)
+    if backend is not None and table == "completions":
+        return _backend_export_rows(conn, backend, batch_size)
+    return _iter_rows(_tuple_cursor(conn).execute(EXPORT_SQL[table]), batch_size)
+
+
+def import_users(conn, rows):
+    """
+    Inserts exported (user_id, username, password, full_name, email, timezone)
+    rows under new ids in one transaction. Password hashes are copied as they
+    are; rows of exports made before time zones, without the last column, get
+    none. Returns a dict mapping each exported user_id to its new id.
+
+    Raises:
+        ValueError: If a username already exists; nothing is imported then.
+    """
+    user_ids = {}
+    with unit_of_work(conn):
+        cursor = conn.cursor()
+        for user_id, username, password, full_name, email, *rest in rows:
+            timezone = rest[0] if rest else None
+            try:
+                cursor.execute("INSERT INTO users (username, password, full_name, email, timezone) "
+                               "VALUES (?, ?, ?, ?, ?)", (username, password, full_name, email, timezone))
+            except sqlite3.IntegrityError:
+                raise ValueError(f"Username already exists: {username}") from None
+            user_ids[user_id] = cursor.lastrowid
+    return user_ids
+
+
+def import_habits(conn, rows, user_ids, batch_size=10000):
+    """
+    Inserts exported (habit_id, user_id, name, periodicity, created_at, is_active)
+    rows under new ids, committing every `batch_size` rows. Owners are remapped
+    through `user_ids`, as returned by import_users; habits of LEGACY_USER_ID,
+    which has no users row, keep it.
+    Returns a dict mapping each exported habit_id to its new id.
+
+    Raises:
+        ValueError: If a habit's owner is not in `user_ids`; its batch is not imported.
+    """
+    habit_ids = {}
+    user_ids = {LEGACY_USER_ID: LEGACY_USER_ID, **user_ids}
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return habit_ids
+        _check_references("users", {row[1] for row in batch}, user_ids)
+        with unit_of_work(conn):
+            cursor = conn.cursor()
+            cursor.executemany(
+                "INSERT INTO habits (user_id, name, periodicity, created_at, is_active) VALUES (?, ?, ?, ?, ?)",
+                [(user_ids[user_id], name, periodicity, created_at, is_active)
+                 for _, user_id, name, periodicity, created_at, is_active in batch])
+            # Consecutive ids, as in save_habits_bulk
+            last_id = cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+        for new_id, row in enumerate(batch, last_id - len(batch) + 1):
+            habit_ids[row[0]] = new_id
+
+
+def import_completions(conn, rows, habit_ids, batch_size=50000):
+    """
+    Inserts (habit_id, epoch microseconds) rows, committing every `batch_size`
+    rows, with habits remapped through `habit_ids` as returned by import_habits.
+    The timestamp text is formatted by SQLite. Rollups and streak summaries of
+    the affected habits are rebuilt once at the end.
+    Returns the number of completions imported.
+
+    Raises:
+        ValueError: If a completion's habit is not in `habit_ids`; its batch is not imported.
+    """
+    _flush_write_behind(conn)
+    backend = _backend_of(conn)
+    touched = set()
+    count = 0
+
+    def params(batch):
+        for habit_id, micros in batch:
+            new_id = habit_ids[habit_id]
+            touched.add(new_id)
+            epoch, fraction = divmod(micros, 1000000)
+            day = epoch // periods.SECONDS_PER_DAY
+            yield new_id, epoch, fraction, day, periods.week_index(day)
+
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            break
+        _check_references("habits", {row[0] for row in batch}, habit_ids)
+        if backend is not None:
+            count += backend.append_many((habit_ids[habit_id], micros) for habit_id, micros in batch)
+            continue
+        with unit_of_work(conn):
+            conn.executemany(IMPORT_COMPLETION_SQL, params(batch))
+        count += len(batch)
+    if backend is not None:
+        return count
+    rebuild_rollups(conn, touched)
+    rebuild_streak_summaries(conn, touched)
+    return count
+
+
+def _check_references(table, referenced, ids):
+    unknown = referenced - ids.keys()
+    if unknown:
+        raise ValueError(f"Rows refer to {table} missing from the import: {sorted(unknown)[:10]}")
 
 
 # --- New Function for Phase 2 Proof ---
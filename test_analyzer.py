@@ -0,0 +1,341 @@
+import datetime
+import itertools
+import random
+
+import pytest
+
+import analyzer
+import periods
+from analyzer import calculate_streak, streak_from_periods
+from models import Habit
+
+
+def reference_calculate_streak(completions, periodicity):
+    """The original calculate_streak, kept verbatim as the behavioural reference."""
+    if not completions:
+        return 0
+
+    sorted_completions = sorted(list(set(completions)))
+    max_streak = 0
+    current_streak = 0
+
+    def get_period_start(date, period):
+        if period == "daily":
+            return date.date()
+        elif period == "weekly":
+            return date.date() - datetime.timedelta(days=date.weekday())
+        return None
+
+    for i in range(len(sorted_completions)):
+        current_date = sorted_completions[i]
+
+        current_period_start = get_period_start(current_date, periodicity)
+
+        if i == 0:
+            current_streak = 1
+        else:
+            prev_date = sorted_completions[i - 1]
+            prev_period_start = get_period_start(prev_date, periodicity)
+
+            if periodicity == "daily":
+                expected_prev_day = current_date.date() - datetime.timedelta(days=1)
+                if prev_period_start == expected_prev_day:
+                    current_streak += 1
+                elif prev_period_start != current_period_start:
+                    current_streak = 1
+            elif periodicity == "weekly":
+                expected_prev_week_start = current_period_start - datetime.timedelta(weeks=1)
+                if prev_period_start == expected_prev_week_start:
+                    current_streak += 1
+                elif prev_period_start != current_period_start:
+                    current_streak = 1
+
+        if current_streak > max_streak:
+            max_streak = current_streak
+
+    return max_streak
+
+
+def random_completions(rng):
+    """
+    Generates a random completion history: clustered runs with gaps, repeated
+    timestamps and several completions per day, sorted or shuffled.
+    """
+    start = datetime.datetime(2024, 12, 20) + datetime.timedelta(days=rng.randrange(400))
+    completions = []
+    day = 0
+    for _ in range(rng.randrange(0, 12)):
+        day += rng.choice((1, 1, 1, 2, 3, 7, 8, 15))
+        for offset in range(rng.randrange(1, 10)):
+            stamp = start + datetime.timedelta(days=day + offset * rng.choice((1, 1, 7)),
+                                               seconds=rng.randrange(86400))
+            completions.extend([stamp] * rng.choice((1, 1, 2)))
+        day += offset
+    if rng.random() < 0.5:
+        completions.sort()
+    else:
+        rng.shuffle(completions)
+    return completions
+
+
+# Property-style equivalence against the original implementation. Each seed is
+# one generated case, so a failure names a reproducible input.
+@pytest.mark.parametrize("seed", range(300))
+def test_calculate_streak_matches_reference(seed):
+    rng = random.Random(seed)
+    completions = random_completions(rng)
+    for periodicity in ("daily", "weekly", "yearly"):
+        assert calculate_streak(completions, periodicity) == reference_calculate_streak(completions, periodicity)
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_compact_completions_match_datetimes(seed):
+    """Epoch-second completions give the same streak as the datetimes they came from."""
+    completions = random_completions(random.Random(seed))
+    epochs = [periods.to_epoch(ts) for ts in completions]
+    for periodicity in ("daily", "weekly"):
+        assert calculate_streak(epochs, periodicity) == reference_calculate_streak(completions, periodicity)
+
+
+def test_streak_counts_each_period_once():
+    """Several completions on the same day extend the streak by one day only."""
+    day = datetime.datetime(2025, 5, 1, 6, 0)
+    completions = [day, day.replace(hour=12), day + datetime.timedelta(days=1), day.replace(hour=23)]
+    assert calculate_streak(completions, "daily") == 2
+    assert calculate_streak(sorted(completions), "daily") == 2
+
+
+def test_streak_from_periods_handles_unsorted_input():
+    assert streak_from_periods([]) == 0
+    assert streak_from_periods([5, 3, 4, 4, 9, 10]) == 3
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_streak_runs_reads_an_ascending_stream_once(seed):
+    rng = random.Random(seed)
+    completions = sorted(random_completions(rng))
+    periodicity = rng.choice(("daily", "weekly"))
+    longest, current = analyzer.streak_runs(iter(completions), periodicity)
+    assert longest == calculate_streak(completions, periodicity)
+    assert current == analyzer.current_streak_for_habit(Habit("h", periodicity, completions=completions))
+
+
+def test_streak_runs_rejects_unsorted_stream():
+    day = datetime.datetime(2025, 5, 2)
+    with pytest.raises(ValueError):
+        analyzer.streak_runs(iter([day, day - datetime.timedelta(days=2)]), "daily")
+
+
+def expected_current_streak(period_ordinals):
+    """Length of the run ending at the latest period, computed the slow way."""
+    distinct = sorted(set(period_ordinals))
+    current = 0
+    while current < len(distinct) and distinct[-1 - current] == distinct[-1] - current:
+        current += 1
+    return current
+
+
+@pytest.fixture(params=["numpy", "python"])
+def batch_backend(request, monkeypatch):
+    """Runs a test against both batch_streaks implementations."""
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(analyzer, "np", None)
+    return request.param
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_batch_streaks_match_per_habit_streaks(seed, batch_backend):
+    rng = random.Random(seed)
+    habits = [Habit(f"Habit {i}", rng.choice(("daily", "weekly", "yearly")), completions=random_completions(rng))
+              for i in range(rng.randrange(1, 40))]
+    flat, offsets = analyzer.habit_period_arrays(habits)
+    longest, current = analyzer.batch_streaks(flat, offsets)
+
+    assert longest == [calculate_streak(h.completions, h.periodicity) for h in habits]
+    assert current == [expected_current_streak(flat[a:b]) for a, b in zip(offsets, offsets[1:])]
+
+
+def test_batch_streaks_edge_cases(batch_backend):
+    assert analyzer.batch_streaks([], [0]) == ([], [])
+    assert analyzer.batch_streaks([], [0, 0, 0]) == ([0, 0], [0, 0])
+    assert analyzer.batch_streaks([3, 1, 2, 2, 7], [0, 0, 4, 5]) == ([0, 3, 1], [0, 3, 1])
+
+
+def test_top_k_streaks_breaks_ties_by_habit_id():
+    day = datetime.datetime(2025, 1, 1)
+    run = [day + datetime.timedelta(days=d) for d in range(3)]
+    habits = [Habit("Short", "daily", habit_id=1, completions=run[:1]),
+              Habit("Tie B", "daily", habit_id=7, completions=run),
+              Habit("Tie A", "daily", habit_id=3, completions=run),
+              Habit("Pair", "daily", habit_id=2, completions=run[:2])]
+
+    assert [h.habit_id for h in analyzer.top_k_streaks(habits, 3)] == [3, 7, 2]
+    assert [h.habit_id for h in analyzer.top_k_streaks(reversed(habits), 3)] == [3, 7, 2]
+    assert len(analyzer.top_k_streaks(habits, 10)) == 4
+    assert analyzer.top_k_streaks(habits, 0) == []
+    assert [h.name for h in analyzer.top_5_streaks(habits)] == ["Tie A", "Tie B", "Pair", "Short"]
+
+
+def test_top_k_streaks_evaluates_metric_once_per_habit():
+    habits = [Habit(f"Habit {i}", "daily", habit_id=i) for i in range(50)]
+    calls = []
+
+    def metric(habit):
+        calls.append(habit.habit_id)
+        return habit.habit_id % 7
+
+    top = analyzer.top_k_streaks(iter(habits), 3, metric=metric)
+    assert sorted(calls) == list(range(50))
+    assert [h.habit_id for h in top] == [6, 13, 20]
+
+
+# Periodicity registry against calendar references
+def reference_period(periodicity, date):
+    """The period of a date and the one after it, worked out with datetime."""
+    if periodicity == "monthly":
+        return (date.year, date.month), (date.year + date.month // 12, date.month % 12 + 1)
+    if periodicity.startswith("every-"):
+        n = periods.day_of_date(date) // int(periodicity.split("-")[1])
+        return n, n + 1
+    monday = date - datetime.timedelta(days=date.weekday())
+    return monday, monday + datetime.timedelta(weeks=1)
+
+
+def reference_registered_streak(completions, periodicity):
+    """Longest run of consecutive completed periods, following each period to the next."""
+    required = int(periodicity[0]) if periodicity.endswith("x-weekly") else 1
+    days = {}
+    for date in {ts.date() for ts in completions}:
+        key, following = reference_period(periodicity, date)
+        days.setdefault(key, [following, 0])[1] += 1
+    completed = {key: following for key, (following, count) in days.items() if count >= required}
+    longest = 0
+    for key in completed:
+        length = 1
+        while completed[key] in completed:
+            key = completed[key]
+            length += 1
+        longest = max(longest, length)
+    return longest
+
+
+def test_monthly_ordinals_match_calendar():
+    monthly = periods.get_periodicity("monthly")
+    rng = random.Random(3)
+    for day in [0, -1, 59, 60, 11016, -719162] + [rng.randrange(-700000, 2900000) for _ in range(2000)]:
+        date = periods.date_of_day(day)
+        ordinal = monthly.to_ordinal(day)
+        assert ordinal == (date.year - 1970) * 12 + date.month - 1
+        assert periods.date_of_day(monthly.first_day(ordinal)) == date.replace(day=1)
+
+
+def test_to_ordinal_maps_arrays():
+    np = pytest.importorskip("numpy")
+    days = np.arange(-3000, 3000, 7, dtype=np.int64)
+    for name in ("daily", "weekly", "2x-weekly", "monthly", "every-5-days"):
+        period = periods.get_periodicity(name)
+        assert period.to_ordinal(days).tolist() == [period.to_ordinal(int(day)) for day in days]
+
+
+@pytest.mark.parametrize("seed", range(60))
+def test_registered_periodicity_streaks_match_reference(seed):
+    rng = random.Random(seed)
+    completions = random_completions(rng)
+    epochs = [periods.to_epoch(ts) for ts in completions]
+    for periodicity in ("2x-weekly", "3x-weekly", "monthly", "every-3-days"):
+        expected = reference_registered_streak(completions, periodicity)
+        assert calculate_streak(completions, periodicity) == expected
+        assert calculate_streak(epochs, periodicity) == expected
+        assert analyzer.streak_runs(iter(sorted(epochs)), periodicity)[0] == expected
+        habit = Habit("h", periodicity, completions=completions)
+        assert analyzer.batch_streaks(*analyzer.habit_period_arrays([habit]))[0] == [expected]
+
+
+def test_periodicity_registry(monkeypatch):
+    monkeypatch.setattr(periods, "_PERIODICITY_PATTERNS", list(periods._PERIODICITY_PATTERNS))
+    monkeypatch.setattr(periods, "_periodicities", {})
+    assert periods.get_periodicity("4x-weekly").required == 4
+    assert periods.get_periodicity("every-10-days").days == 10
+    for name in ("yearly", "0x-weekly", "8x-weekly", "every-0-days", "Daily"):
+        assert periods.get_periodicity(name) is None
+
+    class Fortnightly(periods.EveryNDays):
+        def __init__(self, name):
+            super().__init__(name, 14)
+
+    periods.register_periodicity(r"fortnightly|every-14-days", Fortnightly)
+    assert isinstance(periods.get_periodicity("every-14-days"), Fortnightly)
+    assert calculate_streak([datetime.datetime(2025, 1, 1), datetime.datetime(2025, 1, 10)], "fortnightly") == 2
+
+
+def test_to_local_uses_the_given_zone():
+    moment = datetime.datetime(2025, 6, 30, 23, 30, tzinfo=datetime.timezone.utc)
+    assert periods.to_local(moment, "Europe/Berlin") == datetime.datetime(2025, 7, 1, 1, 30)
+    assert periods.to_local(moment.replace(tzinfo=None), "Europe/Berlin") == moment.replace(tzinfo=None)
+    monthly = periods.get_periodicity("monthly")
+    assert monthly.ordinal_of(moment, "America/New_York") + 1 == monthly.ordinal_of(moment, "Asia/Tokyo")
+    with pytest.raises(ValueError):
+        periods.get_timezone("Nowhere/Special")
+
+
+# Windowed analytics against a period-by-period reference
+def reference_window_stats(ordinals, first, last, rolling):
+    done = [period in set(ordinals) for period in range(first, last + 1)]
+    k = min(rolling, len(done))
+    runs = [len(list(group)) for completed, group in itertools.groupby(done) if completed]
+    trimmed = done[:-1] if done and not done[-1] else done
+    current = 0
+    for completed in reversed(trimmed):
+        if not completed:
+            break
+        current += 1
+    inside = [i for i, completed in enumerate(done) if completed]
+    gaps = [b - a for a, b in zip(inside, inside[1:])]
+    return (len(done), sum(done), sum(done) / len(done), current, max(runs, default=0),
+            sum(1 for gap in gaps if gap > 1), sum(gaps) / len(gaps) if gaps else None,
+            sum(done[-k:]) / k, min(sum(done[i:i + k]) for i in range(len(done) - k + 1)) / k)
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_window_stats_match_reference(seed):
+    rng = random.Random(seed)
+    first = rng.randrange(-10, 10)
+    last = first + rng.randrange(0, 60)
+    rolling = rng.randrange(1, 15)
+    density = rng.random()
+    ordinals = [p for p in range(first - 20, last + 20) if rng.random() < density]
+    stats = analyzer.window_stats(ordinals, first, last, rolling, habit_id=seed)
+    assert stats.habit_id == seed
+    assert tuple(stats[1:]) == pytest.approx(reference_window_stats(ordinals, first, last, rolling))
+
+
+def test_window_reports_start_at_creation_and_summarize():
+    monday = datetime.datetime(2025, 3, 3, 8, 0)
+    daily = Habit("Read", "daily", habit_id=1, created_at=monday,
+                  completions=[monday + datetime.timedelta(days=d) for d in (0, 1, 2, 5, 6)])
+    weekly = Habit("Clean", "weekly", habit_id=2, created_at=monday - datetime.timedelta(weeks=4),
+                   completions=[monday - datetime.timedelta(weeks=w) for w in (0, 2)])
+    new = Habit("Swim", "daily", habit_id=3, created_at=monday + datetime.timedelta(days=6),
+                completions=[monday + datetime.timedelta(days=4)])
+    later = Habit("Later", "daily", habit_id=4, created_at=monday + datetime.timedelta(days=30))
+    other = Habit("Other", "yearly", habit_id=5, created_at=monday)
+    start, end = (monday - datetime.timedelta(days=13)).date(), (monday + datetime.timedelta(days=6)).date()
+
+    reports = analyzer.window_reports([daily, weekly, new, later, other], start, end, rolling=3)
+    by_id = {r.habit_id: r for r in reports}
+    assert sorted(by_id) == [1, 2, 3]
+    # Windows run from creation, so completions before it do not count
+    assert by_id[1][1:8] == (7, 5, 5 / 7, 2, 3, 1, 1.5)
+    assert (by_id[2].periods, by_id[2].completed, by_id[2].current_streak) == (3, 2, 1)
+    assert (by_id[3].periods, by_id[3].completed, by_id[3].current_streak) == (1, 0, 0)
+    assert analyzer.period_indexes(daily) == [periods.day_of_date(monday.date()) + d for d in (0, 1, 2, 5, 6)]
+
+    summary = analyzer.summarize_window(reports)
+    assert (summary.habits, summary.periods, summary.completed, summary.breaks) == (3, 11, 7, 2)
+    assert summary.completion_rate == 7 / 11
+    assert summary.longest_current_streak == 2
+    assert analyzer.summarize_window([]).completion_rate == 0.0
+    with pytest.raises(ValueError):
+        analyzer.window_stats([], 5, 4)
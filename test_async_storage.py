@@ -0,0 +1,104 @@
+import asyncio
+import datetime
+import hashlib
+import threading
+
+import pytest
+
+import passwords
+import storage
+from async_storage import AsyncStorage
+from models import Habit
+
+
+def test_async_storage_round_trip(tmp_path):
+    """Concurrent async writes are committed and visible to async reads."""
+
+    async def scenario():
+        async with AsyncStorage(str(tmp_path / "async.db")) as db:
+            assert await db.register_user("async", "secret", "Async User", "async@example.com")
+            assert not await db.register_user("async", "secret", "Async User", "async@example.com")
+            user_id = await db.login_user("async", "secret")
+            habit_id = await db.save_habit(user_id, Habit("Read", "daily"))
+
+            start = datetime.datetime(2025, 1, 1, 8, 0)
+            await asyncio.gather(*(db.save_completion(habit_id, start + datetime.timedelta(days=d))
+                                   for d in range(50)))
+            habits = await db.load_habits_for_user(user_id)
+            return db, habits
+
+    db, habits = asyncio.run(scenario())
+    assert len(habits[0].completions) == 50
+    assert habits[0].streak_summary.longest_streak == 50
+    # Concurrent writes were grouped into fewer transactions than calls
+    assert db.writes_committed == 53
+    assert db.batches_committed < db.writes_committed
+
+
+def test_failed_write_does_not_affect_its_batch(tmp_path):
+    """A write that raises fails alone; the rest of its group commit still lands."""
+
+    async def scenario():
+        async with AsyncStorage(str(tmp_path / "async.db")) as db:
+            await db.register_user("async", "secret", "Async User", "async@example.com")
+            user_id = await db.login_user("async", "secret")
+            results = await asyncio.gather(db.save_habit(user_id, Habit("Good", "daily")),
+                                           db.save_habit(user_id, None),
+                                           db.save_habit(user_id, Habit("Also good", "weekly")),
+                                           return_exceptions=True)
+            return results, await db.load_habits_for_user(user_id)
+
+    results, habits = asyncio.run(scenario())
+    assert isinstance(results[1], AttributeError)
+    assert [h.name for h in habits] == ["Good", "Also good"]
+
+
+def test_login_rehash_goes_through_the_writer(tmp_path):
+    """Logins verify on the readers; only an outdated hash's replacement is a write."""
+    path = str(tmp_path / "async.db")
+
+    async def scenario():
+        async with AsyncStorage(path) as db:
+            await db.register_user("new", "secret", None, None)
+            conn = storage.get_db_connection(path)
+            conn.execute("INSERT INTO users (username, password) VALUES ('old', ?)",
+                         (hashlib.sha256(b"secret").hexdigest(),))
+            conn.commit()
+            conn.close()
+            writes = db.writes_committed
+            user_ids = [await db.login_user(name, "secret") for name in ("new", "old", "old")]
+            assert await db.login_user("old", "wrong") is None
+            return user_ids, db.writes_committed - writes
+
+    user_ids, writes = asyncio.run(scenario())
+    assert None not in user_ids and writes == 1
+    conn = storage.get_db_connection(path)
+    assert not passwords.needs_rehash(conn.execute("SELECT password FROM users WHERE username = 'old'").fetchone()[0])
+    conn.close()
+
+
+def test_register_hashes_off_the_writer(tmp_path, monkeypatch):
+    """The KDF of a registration does not hold up the writer's transaction."""
+    threads = []
+    real_hash = storage.hash_password
+
+    def recording_hash(password):
+        threads.append(threading.current_thread().name)
+        return real_hash(password)
+
+    monkeypatch.setattr(storage, "hash_password", recording_hash)
+
+    async def scenario():
+        async with AsyncStorage(str(tmp_path / "async.db")) as db:
+            registered = await asyncio.gather(db.register_user("ann", "secret", None, None),
+                                              db.register_user("ann", "secret", None, None))
+            return registered, await db.login_user("ann", "secret")
+
+    registered, user_id = asyncio.run(scenario())
+    assert sorted(registered) == [False, True] and user_id is not None
+    assert len(threads) == 2 and "storage-writer" not in threads
+
+
+def test_async_storage_rejects_memory_database():
+    with pytest.raises(ValueError):
+        AsyncStorage(':memory:')
@@ -0,0 +1,87 @@
+import io
+import json
+
+import pytest
+
+import batch
+import storage
+
+
+@pytest.fixture
+def conn():
+    conn = storage.get_db_connection(':memory:')
+    storage.create_tables(conn)
+    yield conn
+    conn.close()
+
+
+def run(conn, commands, batch_size=1000):
+    out = io.StringIO()
+    lines = [command if isinstance(command, str) else json.dumps(command) for command in commands]
+    counts = batch.run_batch(conn, lines, out, batch_size)
+    return [json.loads(line) for line in out.getvalue().splitlines()], counts
+
+
+def test_stream_registers_logs_and_queries(conn):
+    results, counts = run(conn, [
+        {"op": "register", "username": "ann", "password": "pw"},
+        {"op": "login", "username": "ann", "password": "pw", "id": "a1"},
+        {"op": "add_habit", "name": "Read", "periodicity": "Daily"},
+        *({"op": "log", "habit": "Read", "at": f"2025-03-0{day}T07:00:00"} for day in (1, 2, 3, 5)),
+        {"op": "query", "habit": "Read"},
+        {"op": "log", "user": "ann", "habit": "Read", "at": "2025-03-06T07:00:00"},
+        {"op": "query", "user": "ann"},
+    ])
+    assert counts == (10, 0)
+    assert results[:3] == [{"ok": True, "user_id": 1}, {"ok": True, "user_id": 1, "id": "a1"},
+                           {"ok": True, "habit_id": 1}]
+    assert results[3:7] == [{"ok": True}] * 4
+    read = {"habit_id": 1, "name": "Read", "periodicity": "daily"}
+    assert results[7] == {"ok": True, "habits": [dict(read, current_streak=1, longest_streak=3, completions=4)]}
+    assert results[9] == {"ok": True, "habits": [dict(read, current_streak=2, longest_streak=3, completions=5)]}
+
+
+def test_failed_commands_are_reported_without_stopping(conn):
+    storage.register_user(conn, "ann", "pw", None, None)
+    results, counts = run(conn, [
+        "not json",
+        "[1, 2]",
+        {"op": "fly"},
+        {"op": "log", "habit": "Read"},
+        {"op": "login", "username": "ann", "password": "wrong"},
+        {"op": "register", "username": "ann", "password": "pw"},
+        {"op": "add_habit", "user": "ann", "name": "Read", "periodicity": "yearly"},
+        {"op": "add_habit", "user": "ann", "name": "Read"},
+        {"op": "add_habit", "user": "ann", "name": "Read", "periodicity": "daily"},
+        {"op": "log", "user": "ann", "habit": "Read", "at": "yesterday"},
+        {"op": "log", "user": "bob", "habit": "Read"},
+        {"op": "log", "user": "ann", "habit": "Write", "id": 7},
+        {"op": "log", "user": "ann", "habit": "Read"},
+    ])
+    assert counts == (13, 11)
+    errors = [result.get("error") for result in results]
+    assert errors[0].startswith("Invalid JSON")
+    assert errors[1:] == ["A command must be a JSON object.", "Unknown op: fly", "Not logged in.",
+                          "Invalid username or password.", "Username already exists: ann",
+                          "Unknown periodicity: yearly", "Missing or invalid 'periodicity'.", None,
+                          "Invalid timestamp: yesterday", "Unknown user: bob", "Unknown habit: Write", None]
+    assert results[11]["id"] == 7
+    assert len(storage.load_habits_for_user(conn, 1)[0].completions) == 1
+
+
+def test_results_are_written_per_committed_batch(conn):
+    commands = [{"op": "register", "username": "ann", "password": "pw"},
+                {"op": "add_habit", "user": "ann", "name": "Read", "periodicity": "daily"}]
+    commands += [{"op": "log", "user": "ann", "habit": "Read", "at": f"2025-03-{day:02d}T07:00:00"}
+                 for day in range(1, 21)]
+    writes = []
+
+    class Recorder(io.StringIO):
+        def write(self, text):
+            # Everything reported so far is committed
+            writes.append((text.count("\n"), conn.in_transaction,
+                           conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]))
+            return super().write(text)
+
+    batch.run_batch(conn, map(json.dumps, commands), Recorder(), batch_size=8)
+    assert writes == [(8, False, 6), (8, False, 14), (6, False, 20)]
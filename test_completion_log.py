@@ -0,0 +1,110 @@
+import datetime
+import os
+import random
+import shutil
+
+import pytest
+
+import storage
+from completion_log import CompletionLog
+from models import Habit
+
+
+def random_rows(rng, count, habits=20):
+    return [(rng.randrange(1, habits + 1), rng.randrange(10**12)) for _ in range(count)]
+
+
+def expected_scan(rows, habit_ids):
+    expected = {habit_id: [] for habit_id in habit_ids}
+    for habit_id, micros in rows:
+        if habit_id in expected:
+            expected[habit_id].append(micros)
+    return {habit_id: sorted(values) for habit_id, values in expected.items()}
+
+
+@pytest.mark.parametrize("compact_every", [1, 7, 10**6])
+def test_scan_matches_appends_across_compactions(tmp_path, compact_every):
+    rng = random.Random(compact_every)
+    rows = random_rows(rng, 500)
+    log = CompletionLog(str(tmp_path), shards=3, compact_every=compact_every)
+    for habit_id, micros in rows[:200]:
+        log.append(habit_id, micros)
+    assert log.append_many(rows[200:]) == 300
+    assert len(log) == 500
+    assert log.scan(range(25)) == expected_scan(rows, range(25))
+    log.close()
+
+    reopened = CompletionLog(str(tmp_path), shards=3, compact_every=compact_every)
+    assert reopened.scan(range(25)) == expected_scan(rows, range(25))
+    reopened.close()
+
+
+def test_delete_rewrites_only_matching_records(tmp_path):
+    log = CompletionLog(str(tmp_path), shards=2)
+    log.append_many([(1, 10), (1, 20), (1, 20), (2, 10), (3, 30)])
+    assert log.delete(1, 20) == 2
+    assert log.delete_habits([2, 3]) == 2
+    assert log.delete(1, 99) == 0
+    assert log.scan([1, 2, 3]) == {1: [10], 2: [], 3: []}
+    log.close()
+
+
+def test_recovers_from_torn_record_and_stale_index(tmp_path):
+    directory = str(tmp_path / "log")
+    log = CompletionLog(directory, shards=1, compact_every=2)
+    log.append_many([(1, 5), (2, 6)])  # compacted into the sorted segment
+    stale_index = tmp_path / "stale.idx"
+    shutil.copy(os.path.join(directory, "shard-000.idx"), stale_index)
+    log.append_many([(1, 1), (1, 3)])  # compacted again, bumping the generation
+    log.append(2, 4)
+    log.close()
+
+    # A crash between the log and index renames leaves an index of an older
+    # generation; a crash mid-append leaves a partial record
+    shutil.copy(stale_index, os.path.join(directory, "shard-000.idx"))
+    with open(os.path.join(directory, "shard-000.log"), "ab") as f:
+        f.write(b"\x01\x02\x03")
+
+    recovered = CompletionLog(directory, shards=1, compact_every=2)
+    assert recovered.scan([1, 2]) == {1: [1, 3, 5], 2: [4, 6]}
+    recovered.close()
+
+
+def test_storage_reads_match_sqlite_with_log_attached(tmp_path):
+    start = datetime.datetime(2025, 3, 3, 8, 30, 0, 250)
+    connections = []
+    for attach in (False, True):
+        conn = storage.get_db_connection(':memory:')
+        storage.create_tables(conn)
+        if attach:
+            storage.attach_completion_log(conn, str(tmp_path / "log"), shards=2, compact_every=5)
+        storage.register_user(conn, "logger", "secret", "Log User", "log@example.com")
+        user_id = storage.login_user(conn, "logger", "secret")
+        daily = storage.save_habit(conn, user_id, Habit("Read", "daily"))
+        weekly = storage.save_habit(conn, user_id, Habit("Clean", "weekly"))
+        storage.save_habit(conn, user_id, Habit("Never", "daily"))
+        for days in (0, 1, 2, 4, 4, 9):
+            storage.save_completion(conn, daily, start + datetime.timedelta(days=days, minutes=days))
+        storage.save_completions_bulk(conn, [(weekly, start + datetime.timedelta(days=7 * w)) for w in (0, 1, 3)])
+        storage.delete_completion(conn, daily, start + datetime.timedelta(days=2, minutes=2))
+        connections.append((conn, user_id))
+
+    def snapshot(conn, user_id):
+        return (
+            [(h.name, h.completions) for h in storage.load_habits_for_user(conn, user_id)],
+            [(h.name, list(h.completions)) for h in storage.iter_habits_for_user(conn, user_id, batch_size=2)],
+            [list(h.epochs) for h in storage.load_habit_arrays_for_user(conn, user_id)],
+            storage.load_completion_periods(conn, user_id),
+            storage.load_last_completions(conn, user_id),
+            [h.name for h in storage.load_habits_missed_since(conn, user_id, start + datetime.timedelta(days=8))],
+            list(storage.iter_export_rows(conn, "completions")),
+        )
+
+    assert snapshot(*connections[0]) == snapshot(*connections[1])
+    log_conn, user_id = connections[1]
+    assert log_conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0] == 0
+    storage.delete_user(log_conn, user_id)
+    assert len(storage._backend_of(log_conn)) == 0
+    for conn, _ in connections:
+        storage.detach_completion_backend(conn)
+        conn.close()
@@ -7,12 +7,16 @@ from analyzer import longest_streak, habits_by_periodicity, get_last_completion,
 import storage
 
 
-# A fixture for a temporary in-memory database connection for testing
-@pytest.fixture
-def test_db_conn():
+# A fixture for a temporary in-memory database connection for testing, run once
+# with completions in SQLite and once with them in a completion log
+@pytest.fixture(params=["sqlite", "log"])
+def test_db_conn(request, tmp_path):
     conn = storage.get_db_connection(':memory:')  # Use in-memory DB for fast tests
     storage.create_tables(conn)
+    if request.param == "log":
+        storage.attach_completion_log(conn, str(tmp_path / "completions"), shards=2, compact_every=4)
     yield conn
+    storage.detach_completion_backend(conn)
     conn.close()
 
 
@@ -108,4 +112,21 @@ def test_habits_missed_last_week_with_data(test_db_conn):
     # Check if the function correctly identifies the missed habit
     missed = habits_missed_last_week(habits)
     assert len(missed) == 1
-    assert missed[0].name == "Old Habit"
\ No newline at end of file
+    assert missed[0].name == "Old Habit"
+
+
+def test_load_habits_for_user_groups_completions(test_db_conn):
+    """Test that the joined loader returns every habit with its completions in order."""
+    storage.register_user(test_db_conn, "loader", "secret", "Loader User", "loader@example.com")
+    user_id = storage.login_user(test_db_conn, "loader", "secret")
+    read_id = storage.save_habit(test_db_conn, user_id, Habit("Read", "daily"))
+    storage.save_habit(test_db_conn, user_id, Habit("Clean", "weekly"))
+
+    today = datetime.datetime(2025, 3, 10, 9, 0, 0)
+    for days_ago in (0, 2, 1):
+        storage.save_completion(test_db_conn, read_id, today - datetime.timedelta(days=days_ago))
+
+    habits = storage.load_habits_for_user(test_db_conn, user_id)
+    assert [h.name for h in habits] == ["Read", "Clean"]
+    assert habits[0].completions == sorted(today - datetime.timedelta(days=d) for d in range(3))
+    assert habits[1].completions == []
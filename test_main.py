@@ -0,0 +1,117 @@
+import datetime
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import Main
+import storage
+from models import Habit
+
+
+@pytest.fixture
+def conn():
+    conn = storage.get_db_connection(':memory:')
+    storage.create_tables(conn)
+    storage.register_user(conn, "tester", "secret", "Test User", "tester@example.com")
+    user_id = storage.find_user(conn, "tester")
+    storage.save_habit(conn, user_id, Habit("Read", "daily", created_at=datetime.datetime(2024, 1, 1)))
+    storage.save_habit(conn, user_id, Habit("Gym", "weekly", created_at=datetime.datetime(2024, 1, 2)))
+    yield conn
+    conn.close()
+
+
+def run(conn, *argv):
+    return Main.run_command(conn, Main.parse_command(list(argv)))
+
+
+def test_commands_log_list_and_report_streaks(conn, capsys):
+    assert run(conn, "list", "--user", "tester") == 0
+    assert capsys.readouterr().out == "Read\tdaily\t2024-01-01\nGym\tweekly\t2024-01-02\n"
+
+    for day in (1, 2, 3, 5):
+        assert run(conn, "log", "--user", "tester", "Read", "--at", f"2024-01-0{day}T07:30") == 0
+    assert run(conn, "log", "--user", "tester", "Gym", "--at", "2024-01-04") == 0
+    assert capsys.readouterr().out.count("Completion logged") == 5
+
+    assert run(conn, "streak", "--user", "tester") == 0
+    assert capsys.readouterr().out == "Read\t1\t3\nGym\t1\t1\n"
+    assert run(conn, "streak", "--user", "tester", "Gym") == 0
+    assert capsys.readouterr().out == "Gym\t1\t1\n"
+
+
+def test_commands_reject_unknown_users_and_habits(conn, capsys):
+    assert run(conn, "list", "--user", "nobody") == 1
+    assert run(conn, "log", "--user", "tester", "Swim") == 1
+    assert capsys.readouterr().err == "Unknown user: nobody\nUnknown habit: Swim\n"
+    with pytest.raises(SystemExit):
+        Main.parse_command(["streak"])
+
+
+def test_interactive_app_buffers_writes_only_on_request():
+    assert (Main.parse_command([]).command, Main.parse_command([]).write_behind) == (None, False)
+    assert Main.parse_command(["--db", "other.db", "--write-behind"]).write_behind
+
+
+def test_batch_command_reads_a_file(conn, capsys, tmp_path):
+    commands = tmp_path / "commands.jsonl"
+    commands.write_text('{"op": "log", "user": "tester", "habit": "Read", "at": "2024-01-01T08:00:00"}\n'
+                        '\n'
+                        '{"op": "query", "user": "tester", "habit": "Read"}\n', encoding="utf-8")
+    assert run(conn, "batch", str(commands)) == 0
+    results = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert results[0] == {"ok": True}
+    assert results[1]["habits"][0]["completions"] == 1
+    commands.write_text('{"op": "log", "user": "tester", "habit": "Swim"}\n', encoding="utf-8")
+    assert run(conn, "batch", "--batch-size", "1", str(commands)) == 1
+
+
+def test_window_report_uses_the_loaded_habits(conn, capsys, monkeypatch):
+    user_id = storage.find_user(conn, "tester")
+    today = datetime.datetime.combine(datetime.date.today(), datetime.time(8))
+    storage.save_habit(conn, user_id, Habit("Stretch", "monthly", created_at=today - datetime.timedelta(days=400)))
+    habits = storage.load_habits_for_user(conn, user_id)
+    for habit in habits:
+        for days in (0, 1, 2, 200):
+            habit.log_completion(today - datetime.timedelta(days=days))
+    monkeypatch.setattr("builtins.input", lambda prompt: "3")
+    Main.window_report_cli(habits)
+    out = capsys.readouterr().out
+    assert [line.split()[:2] for line in out.splitlines()[3:6]] == [["Read", "100%"], ["Gym", "100%"],
+                                                                   ["Stretch", "100%"]]
+
+    monkeypatch.setattr("builtins.input", lambda prompt: "7")
+    Main.window_report_cli([Habit("Later", "daily", created_at=today + datetime.timedelta(days=1))])
+    assert capsys.readouterr().out.endswith("No habits were tracked in this window.\n")
+
+
+def test_streak_reads_while_another_connection_writes(tmp_path, capsys):
+    path = str(tmp_path / "habits.db")
+    conn = storage.get_db_connection(path, busy_timeout=100)
+    storage.create_tables(conn)
+    storage.register_user(conn, "tester", "secret", None, None)
+    user_id = storage.find_user(conn, "tester")
+    habit_id = storage.save_habit(conn, user_id, Habit("Read", "daily"))
+    for day in (1, 2, 4):
+        storage.save_completion(conn, habit_id, datetime.datetime(2024, 1, day, 8))
+    # As after a bulk import that left summaries to be built
+    conn.execute("DELETE FROM habit_streaks")
+    conn.commit()
+    writer = storage.get_db_connection(path)
+    writer.execute("BEGIN IMMEDIATE")
+    try:
+        assert run(conn, "streak", "--user", "tester") == 0
+    finally:
+        writer.rollback()
+        writer.close()
+    assert capsys.readouterr().out == "Read\t1\t2\n"
+    assert conn.execute("SELECT COUNT(*) FROM habit_streaks").fetchone()[0] == 0
+    conn.close()
+
+
+def test_command_mode_does_not_import_analysis_modules():
+    # Streak summaries answer the commands, so startup need not pay for NumPy or analyzer
+    code = "import sys, Main; assert 'numpy' not in sys.modules and 'analyzer' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=os.path.dirname(os.path.abspath(Main.__file__)))
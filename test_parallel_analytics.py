@@ -0,0 +1,71 @@
+import datetime
+import sqlite3
+
+import pytest
+
+import analyzer
+import parallel_analytics
+import storage
+from fixtures import load_complex_test_data
+from models import StreakLeaderboardEntry
+
+
+@pytest.fixture
+def analytics_db(tmp_path):
+    path = str(tmp_path / "analytics.db")
+    conn = storage.get_db_connection(path)
+    storage.create_tables(conn)
+    for i in range(7):
+        storage.register_user(conn, f"user{i}", "secret", f"User {i}", f"user{i}@example.com")
+        user_id = storage.login_user(conn, f"user{i}", "secret")
+        load_complex_test_data(conn, num_habits=6 + i, user_id=user_id)
+    yield path, conn
+    conn.close()
+
+
+def expected_analytics(conn, cutoff, k):
+    habits = []
+    entries = []
+    missed = []
+    for user_id, username in storage.list_users(conn):
+        user_habits = storage.load_habits_for_user(conn, user_id)
+        for habit in user_habits:
+            habit.streak_summary = None
+            longest = analyzer.longest_streak_for_habit(habit)
+            current = analyzer.current_streak_for_habit(habit)
+            entries.append(StreakLeaderboardEntry(user_id, username, habit.habit_id, habit.name, habit.periodicity,
+                                                  current, longest))
+        missed += [(user_id, h.habit_id) for h in analyzer.habits_missed_last_week(user_habits, cutoff)]
+        habits += user_habits
+    return (len(habits), sum(len(h.completions) for h in habits), analyzer.longest_streak(habits),
+            analyzer.streak_leaderboard(entries, k), missed)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_global_analytics_matches_in_memory_analyzer(analytics_db, workers):
+    path, conn = analytics_db
+    # Half a day off the generated completion times, which are whole days apart
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=3, hours=12)
+    result = parallel_analytics.global_analytics(path, workers=workers, k=5, cutoff=cutoff, shards=3)
+    assert result.users == 7
+    assert (result.habits, result.completions, result.longest_streak, result.top_streaks, result.missed) == \
+        expected_analytics(conn, cutoff, 5)
+
+
+def test_partition_users_keeps_order_and_balance():
+    users = [(i, f"user{i}") for i in range(10)]
+    parts = parallel_analytics.partition_users(users, 4)
+    assert [len(part) for part in parts] == [3, 3, 2, 2]
+    assert sum(parts, []) == users
+    assert parallel_analytics.partition_users(users[:2], 8) == [[users[0]], [users[1]]]
+    assert parallel_analytics.partition_users([], 4) == []
+
+
+def test_read_only_connection_rejects_writes(analytics_db):
+    path, _ = analytics_db
+    conn = storage.get_db_connection(path, read_only=True)
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute("DELETE FROM users")
+    conn.close()
+    with pytest.raises(ValueError):
+        parallel_analytics.global_analytics(":memory:")
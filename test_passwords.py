@@ -0,0 +1,90 @@
+import hashlib
+
+import pytest
+
+import passwords
+import storage
+
+
+@pytest.fixture
+def conn():
+    conn = storage.get_db_connection(':memory:')
+    storage.create_tables(conn)
+    yield conn
+    storage.disable_login_cache()
+    conn.close()
+
+
+def stored_hash(conn, username):
+    return conn.execute("SELECT password FROM users WHERE username = ?", (username,)).fetchone()[0]
+
+
+@pytest.mark.parametrize("parameters", [{"scheme": passwords.SCRYPT, "n": 2 ** 10, "r": 8, "p": 1},
+                                        {"scheme": passwords.PBKDF2, "iterations": 1000}])
+def test_hashes_are_salted_and_carry_their_parameters(parameters):
+    first = passwords.hash_password("secret", parameters)
+    second = passwords.hash_password("secret", parameters)
+    assert first != second
+    assert first.split("$")[:-2] == [parameters["scheme"], *(str(v) for k, v in parameters.items() if k != "scheme")]
+    assert passwords.verify_password("secret", first)
+    assert not passwords.verify_password("Secret", first)
+    assert not passwords.needs_rehash(first, parameters)
+    assert passwords.needs_rehash(first, dict(parameters, scheme=passwords.PBKDF2, iterations=7))
+    with pytest.raises(ValueError):
+        passwords.hash_password("secret", {"scheme": "md5"})
+
+
+def test_outdated_hashes_are_replaced_on_login(conn, monkeypatch):
+    legacy = hashlib.sha256(b"secret").hexdigest()
+    conn.execute("INSERT INTO users (username, password) VALUES ('old', ?)", (legacy,))
+    conn.commit()
+    assert storage.login_user(conn, "old", "wrong") is None
+    assert stored_hash(conn, "old") == legacy
+
+    user_id = storage.login_user(conn, "old", "secret")
+    assert user_id is not None
+    upgraded = stored_hash(conn, "old")
+    assert upgraded.startswith("scrypt$") and not passwords.needs_rehash(upgraded)
+
+    monkeypatch.setattr(passwords, "KDF_PARAMETERS", {"scheme": passwords.PBKDF2, "iterations": 2000})
+    assert storage.login_user(conn, "old", "secret") == user_id
+    assert stored_hash(conn, "old").startswith("pbkdf2_sha256$2000$")
+    assert storage.login_user(conn, "old", "secret") == user_id
+    assert storage.login_user(conn, "nobody", "secret") is None
+
+
+def test_login_cache_skips_the_kdf_until_expiry(conn, monkeypatch):
+    storage.register_user(conn, "ann", "secret", "Ann", None)
+    cache = storage.enable_login_cache(max_entries=2)
+    user_id = storage.login_user(conn, "ann", "secret")
+
+    def no_kdf(password, stored):
+        raise AssertionError("the KDF ran")
+
+    monkeypatch.setattr(passwords, "verify_password", no_kdf)
+    assert storage.login_user(conn, "ann", "secret") == user_id
+    assert (cache.hits, cache.misses) == (1, 1)
+    monkeypatch.undo()
+    # A wrong password is never answered from the cache
+    assert storage.login_user(conn, "ann", "wrong") is None
+
+    cache.ttl = 0
+    cache.put("ann", stored_hash(conn, "ann"), "secret", user_id)
+    assert cache.get("ann", stored_hash(conn, "ann"), "secret") is None
+    for i in range(3):
+        cache.ttl = 60
+        cache.put(f"user{i}", "hash", "pw", i)
+    assert len(cache) == 2 and cache.get("user0", "hash", "pw") is None
+
+
+def test_login_users_matches_login_user(conn):
+    for name in ("ann", "bob", "cat"):
+        storage.register_user(conn, name, f"{name}-pw", name, None)
+    conn.execute("UPDATE users SET password = ? WHERE username = 'cat'", (hashlib.sha256(b"cat-pw").hexdigest(),))
+    conn.commit()
+    credentials = [("ann", "ann-pw"), ("bob", "wrong"), ("cat", "cat-pw"), ("dan", "dan-pw"), ("ann", "ann-pw")]
+    storage.enable_login_cache()
+    results = storage.login_users(conn, credentials)
+    assert results == [storage.login_user(conn, *pair) for pair in credentials]
+    assert results[1] is None and results[3] is None and results[0] == results[4] is not None
+    assert not passwords.needs_rehash(stored_hash(conn, "cat"))
@@ -0,0 +1,872 @@
+import datetime
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import analyzer
+import migrations
+import periods
+import storage
+from models import Habit
+
+
+@pytest.fixture
+def test_db_conn():
+    conn = storage.get_db_connection(':memory:')
+    storage.create_tables(conn)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def user_id(test_db_conn):
+    storage.register_user(test_db_conn, "tester", "secret", "Test User", "tester@example.com")
+    return storage.login_user(test_db_conn, "tester", "secret")
+
+
+def query_plan(conn, sql, params=()):
+    """Returns the EXPLAIN QUERY PLAN detail lines for a statement."""
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+# Schema migrations
+def test_create_tables_sets_current_schema_version(test_db_conn):
+    """A fresh database is migrated all the way to the latest version."""
+    assert migrations.get_schema_version(test_db_conn) == migrations.SCHEMA_VERSION
+
+
+def test_migrate_upgrades_existing_database_without_data_loss():
+    """A pre-migration (version 0) database keeps its rows when it is upgraded."""
+    conn = sqlite3.connect(':memory:')
+    migrations.MIGRATIONS[0](conn)
+    conn.execute("INSERT INTO users (username, password) VALUES ('old', 'x')")
+    conn.execute("INSERT INTO habits (user_id, name, periodicity, created_at, is_active) "
+                 "VALUES (1, 'Read', 'daily', '2025-01-01T00:00:00', 1)")
+    conn.execute("INSERT INTO completions (habit_id, timestamp) VALUES (1, '2025-01-02T08:00:00')")
+    conn.commit()
+    assert migrations.get_schema_version(conn) == 0
+
+    assert migrations.migrate(conn) == migrations.SCHEMA_VERSION
+    assert migrations.get_schema_version(conn) == migrations.SCHEMA_VERSION
+    assert conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0] == 1
+    # Running it again is a no-op
+    assert migrations.migrate(conn) == migrations.SCHEMA_VERSION
+
+
+def test_failed_migration_step_is_rolled_back(test_db_conn, monkeypatch):
+    """A step that raises leaves neither its changes nor a version bump behind."""
+    version = migrations.get_schema_version(test_db_conn)
+
+    def broken_step(conn):
+        conn.execute("CREATE TABLE half_done (x INTEGER)")
+        raise ValueError("boom")
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS + [broken_step])
+    monkeypatch.setattr(migrations, "SCHEMA_VERSION", version + 1)
+    with pytest.raises(ValueError):
+        migrations.migrate(test_db_conn)
+    assert migrations.get_schema_version(test_db_conn) == version
+    tables = {row[0] for row in test_db_conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert "half_done" not in tables
+
+
+def test_migrate_refuses_newer_database(test_db_conn):
+    """A database written by a newer release is not touched."""
+    test_db_conn.execute(f"PRAGMA user_version = {migrations.SCHEMA_VERSION + 1}")
+    with pytest.raises(RuntimeError):
+        migrations.migrate(test_db_conn)
+
+
+# Query plans of the hot queries
+def test_user_habit_load_uses_indexes(test_db_conn):
+    """The per-user load searches both tables by index and needs no sort step."""
+    plan = query_plan(test_db_conn, storage.LOAD_USER_HABITS_SQL, (1,))
+    assert any("USING INDEX idx_habits_user_id" in line for line in plan)
+    assert not any("TEMP B-TREE" in line for line in plan)
+
+    plan = query_plan(test_db_conn, storage.LOAD_USER_COMPLETIONS_SQL, (1,))
+    assert any("USING COVERING INDEX idx_habits_user_id" in line for line in plan)
+    assert any("USING COVERING INDEX idx_completions_habit_timestamp" in line for line in plan)
+    assert not any("TEMP B-TREE" in line for line in plan)
+
+
+def test_ordered_completion_fetch_uses_covering_index(test_db_conn):
+    """Fetching one habit's completions in order is served entirely from the index."""
+    plan = query_plan(test_db_conn,
+                      "SELECT timestamp FROM completions WHERE habit_id = ? ORDER BY timestamp", (1,))
+    assert any("USING COVERING INDEX idx_completions_habit_timestamp" in line for line in plan)
+    assert not any("TEMP B-TREE" in line for line in plan)
+
+
+# Batched writes
+def test_save_habits_bulk_returns_ids_in_order(test_db_conn, user_id):
+    """Bulk-saved habits get consecutive IDs that match their input order."""
+    storage.save_habit(test_db_conn, user_id, Habit("Existing", "daily"))
+    habits = [Habit(f"Habit {i}", "daily" if i % 2 else "weekly") for i in range(5)]
+    habit_ids = storage.save_habits_bulk(test_db_conn, user_id, habits)
+
+    loaded = {h.habit_id: h for h in storage.load_habits_for_user(test_db_conn, user_id)}
+    assert [loaded[habit_id].name for habit_id in habit_ids] == [h.name for h in habits]
+    assert storage.save_habits_bulk(test_db_conn, user_id, []) == []
+
+
+def test_save_completions_bulk(test_db_conn, user_id):
+    """Bulk-saved completions are loaded back in timestamp order."""
+    habit_id = storage.save_habit(test_db_conn, user_id, Habit("Read", "daily"))
+    start = datetime.datetime(2025, 1, 1, 8, 0, 0)
+    stamps = [start + datetime.timedelta(days=d) for d in (2, 0, 1)]
+    assert storage.save_completions_bulk(test_db_conn, ((habit_id, ts) for ts in stamps)) == 3
+
+    habit = storage.load_habits_for_user(test_db_conn, user_id)[0]
+    assert habit.completions == sorted(stamps)
+
+
+def test_deleted_habits_and_users_leave_no_completions(test_db_conn, user_id):
+    """Foreign keys are off, so deletes remove the children themselves."""
+    day = datetime.datetime(2025, 3, 3, 7)
+    read_id = storage.save_habit(test_db_conn, user_id, Habit("Read", "daily", completions=[day]))
+    storage.save_habit(test_db_conn, user_id, Habit("Walk", "daily", completions=[day]))
+    storage.save_habit(test_db_conn, Habit("Stretch", "daily", completions=[day]))
+    storage.delete_habit(test_db_conn, read_id)
+    assert [h.name for h in storage.load_all_habits(test_db_conn)] == ["Walk", "Stretch"]
+    storage.delete_user(test_db_conn, user_id)
+    assert [(h.name, h.completions) for h in storage.load_all_habits(test_db_conn)] == [("Stretch", [day])]
+    assert test_db_conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0] == 1
+
+
+def test_unit_of_work_commits_once(test_db_conn, user_id):
+    """Writes inside a unit of work stay uncommitted until the block exits."""
+    with storage.unit_of_work(test_db_conn):
+        habit_id = storage.save_habit(test_db_conn, user_id, Habit("Read", "daily"))
+        with storage.unit_of_work(test_db_conn):
+            storage.save_completion(test_db_conn, habit_id, datetime.datetime(2025, 1, 1))
+        assert test_db_conn.in_transaction
+    assert not test_db_conn.in_transaction
+    assert len(storage.load_habits_for_user(test_db_conn, user_id)[0].completions) == 1
+
+
+def test_unit_of_work_depth_is_kept_per_connection(test_db_conn, user_id):
+    """A block open on a connection defers no commits on a connection opened later."""
+    with storage.unit_of_work(test_db_conn):
+        assert storage._unit_of_work_depth(test_db_conn) == 1
+        other = storage.get_db_connection(':memory:')
+        storage.create_tables(other)
+        storage.save_habit(other, Habit("Read", "daily"))
+        assert not other.in_transaction
+        other.close()
+    assert storage._unit_of_work_depth(test_db_conn) == 0
+    plain = sqlite3.connect(':memory:')
+    with storage.unit_of_work(plain):
+        assert storage._unit_of_work_depth(plain) == 1
+    assert storage._plain_unit_of_work_depths == {}
+    plain.close()
+
+
+def test_unit_of_work_rolls_back_on_error(test_db_conn, user_id):
+    """An exception escaping the block discards every write made inside it."""
+    with pytest.raises(RuntimeError):
+        with storage.unit_of_work(test_db_conn):
+            storage.save_habit(test_db_conn, user_id, Habit("Read", "daily"))
+            raise RuntimeError("abort")
+    assert storage.load_habits_for_user(test_db_conn, user_id) == []
+
+
+def test_create_tables_registers_sql_functions_on_plain_connections():
+    """Completions save on a connection that get_db_connection did not open."""
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    storage.create_tables(conn)
+    habit_id = storage.save_habit(conn, Habit("Read", "daily"))
+    storage.save_completion(conn, habit_id, datetime.datetime(2025, 3, 10, 8))
+    assert storage.load_streak_summaries(conn, storage.LEGACY_USER_ID)[habit_id].current_streak == 1
+    conn.close()
+
+
+# Integer time columns
+def test_migration_backfills_integer_time_columns():
+    """Completions written before version 3 get epoch, day and week indexes."""
+    conn = sqlite3.connect(':memory:')
+    for step in migrations.MIGRATIONS[:2]:
+        step(conn)
+    conn.execute("PRAGMA user_version = 2")
+    conn.execute("INSERT INTO completions (habit_id, timestamp) VALUES (1, '2025-03-10T23:30:00.250000')")
+    conn.commit()
+
+    migrations.migrate(conn)
+    epoch, day, week = conn.execute("SELECT ts_epoch, day_index, week_index FROM completions").fetchone()
+    assert periods.from_epoch(epoch) == datetime.datetime(2025, 3, 10, 23, 30)
+    assert periods.EPOCH + datetime.timedelta(days=day) == datetime.datetime(2025, 3, 10)
+    # 2025-03-10 is a Monday, so it starts a new week and the Sunday before does not
+    assert week == periods.week_index(day) == periods.week_index(day - 1) + 1 == periods.week_index(day + 6)
+
+
+def test_compact_loaders_match_datetime_loader(test_db_conn, user_id):
+    """Compact loaders return the same history as integers, usable by calculate_streak."""
+    daily_id = storage.save_habit(test_db_conn, user_id, Habit("Read", "daily"))
+    weekly_id = storage.save_habit(test_db_conn, user_id, Habit("Clean", "weekly"))
+    start = datetime.datetime(2025, 3, 3, 7, 15)
+    daily = [start + datetime.timedelta(days=d, hours=h) for d in (0, 1, 2, 4) for h in (0, 12)]
+    weekly = [start + datetime.timedelta(weeks=w, days=w) for w in (0, 1, 3)]
+    storage.save_completions_bulk(test_db_conn, [(daily_id, ts) for ts in daily] + [(weekly_id, ts) for ts in weekly])
+
+    full = storage.load_habits_for_user(test_db_conn, user_id)
+    compact = storage.load_compact_habits_for_user(test_db_conn, user_id)
+    for full_habit, compact_habit in zip(full, compact):
+        assert [periods.from_epoch(e) for e in compact_habit.completions] == full_habit.completions
+        assert analyzer.calculate_streak(compact_habit.completions, compact_habit.periodicity) == \
+            analyzer.calculate_streak(full_habit.completions, full_habit.periodicity)
+
+    period_lists = storage.load_completion_periods(test_db_conn, user_id)
+    assert analyzer.streak_from_periods(period_lists[daily_id]) == 3
+    assert analyzer.streak_from_periods(period_lists[weekly_id]) == 2
+    assert len(period_lists[daily_id]) == 4
+
+
+def test_habit_arrays_loader_matches_datetime_loader(test_db_conn, user_id):
+    """CompactHabit keeps epochs in an array and exposes the same datetimes lazily."""
+    habit_id = storage.save_habit(test_db_conn, user_id, Habit("Read", "daily"))
+    stamps = [datetime.datetime(2025, 3, d, 7, 15) for d in (1, 2, 3, 5)]
+    storage.save_completions_bulk(test_db_conn, [(habit_id, ts) for ts in stamps])
+
+    full = storage.load_habits_for_user(test_db_conn, user_id)[0]
+    compact = storage.load_habit_arrays_for_user(test_db_conn, user_id)[0]
+    assert not hasattr(compact, "__dict__")
+    assert compact.epochs.typecode == "q"
+    assert list(compact.epochs) == [periods.to_epoch(ts) for ts in stamps]
+    assert compact.completions == full.completions and compact.completions[-1] == stamps[-1]
+    assert compact.streak_summary == full.streak_summary
+    compact.streak_summary = None
+    assert analyzer.longest_streak_for_habit(compact) == analyzer.longest_streak_for_habit(full) == 3
+    assert analyzer.longest_streak([compact]) == 3
+
+
+# Streak summaries
+def summary_from_completions(habit):
+    """The summary a habit should have, computed from its loaded completions."""
+    ordinals = [periods.to_epoch(ts) for ts in habit.completions]
+    flat, offsets = analyzer.habit_period_arrays([Habit(habit.name, habit.periodicity, completions=ordinals)])
+    longest, current = analyzer.batch_streaks(flat, offsets)
+    return longest[0], current[0], len(habit.completions)
+
+
+@pytest.mark.parametrize("periodicity", ["daily", "weekly"])
+def test_streak_summary_tracks_every_save(test_db_conn, user_id, periodicity):
+    """In-order saves update the summary incrementally; out-of-order saves rebuild it."""
+    habit_id = storage.save_habit(test_db_conn, user_id, Habit("Habit", periodicity))
+    start = datetime.datetime(2025, 1, 6, 8, 0)
+    step = datetime.timedelta(days=1 if periodicity == "daily" else 7)
+    # Runs of 3 and 4, a same-period repeat, then a late completion filling the gap
+    offsets = [0, 1, 2, 2, 4, 5, 6, 7, 3]
+    for offset in offsets:
+        storage.save_completion(test_db_conn, habit_id, start + offset * step + datetime.timedelta(hours=offset))
+        habit = storage.load_habits_for_user(test_db_conn, user_id)[0]
+        summary = habit.streak_summary
+        assert (summary.longest_streak, summary.current_streak, summary.total_count) == \
+            summary_from_completions(habit)
+    assert habit.streak_summary.longest_streak == 8
+    assert analyzer.longest_streak_for_habit(habit) == analyzer.calculate_streak(habit.completions, periodicity)
+
+
+def test_streak_summary_after_bulk_save_and_delete(test_db_conn, user_id):
+    """Bulk saves and deleted completions leave the summary matching the completions."""
+    habit_id = storage.save_habit(test_db_conn, user_id, Habit("Read", "daily"))
+    start = datetime.datetime(2025, 2, 1, 9, 0)
+    stamps = [start + datetime.timedelta(days=d) for d in range(6)]
+    storage.save_completions_bulk(test_db_conn, [(habit_id, ts) for ts in stamps])
+    assert storage.load_streak_summaries(test_db_conn, user_id)[habit_id].longest_streak == 6
+
+    assert storage.delete_completion(test_db_conn, habit_id, stamps[2]) == 1
+    summary = storage.load_streak_summaries(test_db_conn, user_id)[habit_id]
+    assert (summary.longest_streak, summary.current_streak, summary.total_count) == (3, 3, 5)
+
+    storage.delete_habit(test_db_conn, habit_id)
+    assert storage.load_streak_summaries(test_db_conn, user_id) == {}
+
+
+def test_save_completions_matches_single_saves(test_db_conn, user_id):
+    """Batches folded in incrementally leave the same rollups and summaries as one save at a time."""
+    other = storage.get_db_connection(':memory:')
+    storage.create_tables(other)
+    storage.register_user(other, "tester", "secret", "Test User", "tester@example.com")
+    kinds = ["daily", "weekly", "3x-weekly", "monthly"]
+    habit_ids = storage.save_habits_bulk(test_db_conn, user_id, [Habit(kind, kind) for kind in kinds])
+    storage.save_habits_bulk(other, user_id, [Habit(kind, kind) for kind in kinds])
+    rng = random.Random(5)
+    start = datetime.datetime(2025, 1, 1)
+    # Mostly in order, with some completions landing in earlier periods
+    completions = [(rng.choice(habit_ids), start + datetime.timedelta(hours=7 * i + rng.randrange(-100, 5)))
+                   for i in range(600)]
+    for i in range(0, len(completions), 50):
+        assert storage.save_completions(test_db_conn, completions[i:i + 50]) == len(completions[i:i + 50])
+    for habit_id, timestamp in completions:
+        storage.save_completion(other, habit_id, timestamp)
+
+    for query in ("SELECT habit_id, timestamp, ts_epoch, day_index, week_index FROM completions ORDER BY 1, 2",
+                  "SELECT * FROM habit_day_rollups ORDER BY 1, 2",
+                  "SELECT * FROM habit_week_rollups ORDER BY 1, 2",
+                  "SELECT * FROM habit_streaks ORDER BY 1"):
+        assert list(map(tuple, test_db_conn.execute(query))) == list(map(tuple, other.execute(query)))
+    other.close()
+
+
+def test_analyzer_serves_streaks_from_summaries(test_db_conn, user_id):
+    """Loaded habits answer streak queries from their summary without rescanning completions."""
+    habit_id = storage.save_habit(test_db_conn, user_id, Habit("Read", "daily"))
+    storage.save_completion(test_db_conn, habit_id, datetime.datetime(2025, 2, 1))
+    habit = storage.load_habits_for_user(test_db_conn, user_id)[0]
+    habit.completions = None  # any attempt to scan completions would now fail
+    assert analyzer.longest_streak_for_habit(habit) == 1
+    assert analyzer.longest_streak([habit]) == 1
+    assert analyzer.top_5_streaks([habit]) == [habit]
+
+
+def test_streak_leaderboard_across_users(test_db_conn, user_id):
+    """The leaderboard streams every user's summaries and ranks them deterministically."""
+    storage.register_user(test_db_conn, "other", "secret", "Other User", "other@example.com")
+    other_id = storage.login_user(test_db_conn, "other", "secret")
+    start = datetime.datetime(2025, 4, 1, 7, 0)
+    lengths = {(user_id, "Read"): 4, (user_id, "Walk"): 2, (other_id, "Swim"): 4, (other_id, "Cook"): 1}
+    for (owner, name), length in lengths.items():
+        habit_id = storage.save_habit(test_db_conn, owner, Habit(name, "daily"))
+        storage.save_completions_bulk(test_db_conn, [(habit_id, start + datetime.timedelta(days=d))
+                                                     for d in range(length)])
+    # A summary row that has gone missing is rebuilt before ranking
+    test_db_conn.execute("DELETE FROM habit_streaks WHERE habit_id = 1")
+    storage.build_missing_streak_summaries(test_db_conn)
+
+    entries = storage.iter_streak_summaries(test_db_conn, batch_size=1)
+    top = analyzer.streak_leaderboard(entries, k=3)
+    assert [(e.username, e.name, e.longest_streak) for e in top] == \
+        [("tester", "Read", 4), ("other", "Swim", 4), ("tester", "Walk", 2)]
+    with pytest.raises(ValueError):
+        analyzer.streak_leaderboard([], metric="total")
+
+
+# SQL-side analytics against the in-memory reference implementations
+@pytest.fixture
+def varied_habits(test_db_conn, user_id):
+    """A user with daily and weekly habits, some never completed, some long idle."""
+    rng = random.Random(42)
+    now = datetime.datetime(2025, 6, 30, 12, 0)
+    completions = []
+    for i in range(30):
+        habit_id = storage.save_habit(test_db_conn, user_id, Habit(f"Habit {i}", rng.choice(("daily", "weekly"))))
+        last_days_ago = rng.choice((0, 3, 6, 7, 8, 20, None))
+        if last_days_ago is not None:
+            completions += [
+                (habit_id, now - datetime.timedelta(days=last_days_ago + d, microseconds=rng.randrange(10**6)))
+                for d in range(rng.randrange(1, 5))]
+    # Habits of another user must not leak into the results
+    storage.register_user(test_db_conn, "other", "secret", "Other User", "other@example.com")
+    other_id = storage.login_user(test_db_conn, "other", "secret")
+    storage.save_habit(test_db_conn, other_id, Habit("Foreign", "daily"))
+    storage.save_completions_bulk(test_db_conn, completions)
+    return now, storage.load_habits_for_user(test_db_conn, user_id)
+
+
+def test_load_last_completions_matches_analyzer(test_db_conn, user_id, varied_habits):
+    _, habits = varied_habits
+    assert storage.load_last_completions(test_db_conn, user_id) == \
+        {h.habit_id: analyzer.get_last_completion(h.completions) for h in habits}
+
+
+@pytest.mark.parametrize("days", [0, 7, 8, 30])
+def test_load_habits_missed_since_matches_analyzer(test_db_conn, user_id, varied_habits, days):
+    now, habits = varied_habits
+    cutoff = now - datetime.timedelta(days=days)
+    expected = analyzer.habits_missed_last_week(habits, cutoff=cutoff)
+    missed = storage.load_habits_missed_since(test_db_conn, user_id, cutoff)
+    assert [h.habit_id for h in missed] == [h.habit_id for h in expected]
+    assert all(h.completions == [] for h in missed)
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_iter_habits_for_user_streams_each_habit_once(test_db_conn, user_id, varied_habits, compact):
+    _, habits = varied_habits
+    loaded = storage.load_compact_habits_for_user(test_db_conn, user_id) if compact else habits
+    streamed = [(h.habit_id, h.streak_summary, list(h.completions))
+                for h in storage.iter_habits_for_user(test_db_conn, user_id, batch_size=3, compact=compact)]
+    assert streamed == [(h.habit_id, h.streak_summary, h.completions) for h in loaded]
+
+    # Completions left unread are skipped when the next habit is requested
+    for i, habit in enumerate(storage.iter_habits_for_user(test_db_conn, user_id, batch_size=3)):
+        if i % 2:
+            assert list(habit.completions) == habits[i].completions
+        else:
+            next(habit.completions, None)
+
+
+def test_streamed_analytics_match_loaded_habits(test_db_conn, user_id, varied_habits):
+    now, habits = varied_habits
+    cutoff = now - datetime.timedelta(days=7)
+
+    def stream():
+        return storage.iter_habits_for_user(test_db_conn, user_id, batch_size=4)
+
+    assert analyzer.longest_streak_streamed(stream()) == analyzer.longest_streak(habits)
+    for habit in stream():
+        habit.streak_summary = None  # force the single-pass scan of the completions
+        (_, longest, current), = analyzer.iter_streaks([habit])
+        expected = habits[[h.habit_id for h in habits].index(habit.habit_id)]
+        assert (longest, current) == (analyzer.calculate_streak(expected.completions, expected.periodicity),
+                                      analyzer.current_streak_for_habit(expected))
+    assert [(h.habit_id, last) for h, last in analyzer.iter_last_completions(stream())] == \
+        [(h.habit_id, analyzer.get_last_completion(h.completions)) for h in habits]
+    assert [h.habit_id for h in analyzer.iter_habits_missed(stream(), cutoff)] == \
+        [h.habit_id for h in analyzer.habits_missed_last_week(habits, cutoff)]
+    compact = storage.iter_habits_for_user(test_db_conn, user_id, compact=True)
+    assert [h.habit_id for h in analyzer.iter_habits_missed(compact, cutoff)] == \
+        [h.habit_id for h in analyzer.habits_missed_last_week(habits, cutoff)]
+
+
+@pytest.mark.parametrize("periodicity", ["daily", "weekly", "monthly"])
+def test_load_habits_by_periodicity_matches_analyzer(test_db_conn, user_id, varied_habits, periodicity):
+    _, habits = varied_habits
+    loaded = storage.load_habits_by_periodicity(test_db_conn, user_id, periodicity)
+    expected = analyzer.habits_by_periodicity(habits, periodicity)
+    assert [h.habit_id for h in loaded] == [h.habit_id for h in expected]
+    assert [analyzer.longest_streak_for_habit(h) for h in loaded] == \
+        [analyzer.calculate_streak(h.completions, h.periodicity) for h in expected]
+
+
+# Period rollups
+def rollup_rows(conn):
+    return (conn.execute("SELECT * FROM habit_day_rollups ORDER BY habit_id, day_index").fetchall(),
+            conn.execute("SELECT * FROM habit_week_rollups ORDER BY habit_id, week_index").fetchall())
+
+
+def test_rollups_maintained_incrementally_match_rebuild(test_db_conn, user_id):
+    daily_id = storage.save_habit(test_db_conn, user_id, Habit("Read", "daily"))
+    weekly_id = storage.save_habit(test_db_conn, user_id, Habit("Clean", "weekly"))
+    monday = datetime.datetime(2025, 3, 3, 7, 0)
+    stamps = [monday + datetime.timedelta(days=d, hours=h) for d in range(9) for h in (0, 5)]
+    random.Random(7).shuffle(stamps)
+    for ts in stamps:
+        storage.save_completion(test_db_conn, daily_id, ts)
+    for ts in stamps[:5]:
+        storage.save_completion(test_db_conn, weekly_id, ts)
+    storage.delete_completion(test_db_conn, daily_id, monday + datetime.timedelta(days=8, hours=5))
+    incremental = rollup_rows(test_db_conn)
+    storage.rebuild_rollups(test_db_conn)
+    assert rollup_rows(test_db_conn) == incremental
+
+    day = periods.day_of_date(monday.date())
+    week = periods.week_index(day)
+    assert [tuple(row)[1:] for row in incremental[0] if row[0] == daily_id] == \
+        [(day + d, week + d // 7, 2 if d < 8 else 1, 1) for d in range(9)]
+    # The first week of the daily habit has all seven days; the weekly habit counts any completion
+    assert [tuple(row)[1:] for row in incremental[1] if row[0] == daily_id] == \
+        [(week, 14, 7, 1), (week + 1, 3, 2, 0)]
+    assert all(row[4] == 1 for row in incremental[1] if row[0] == weekly_id)
+
+    storage.delete_habit(test_db_conn, daily_id)
+    assert all(row[0] == weekly_id for rows in rollup_rows(test_db_conn) for row in rows)
+    storage.delete_user(test_db_conn, user_id)
+    assert rollup_rows(test_db_conn) == ([], [])
+
+
+def test_migration_backfills_rollups(test_db_conn, user_id):
+    habit_id = storage.save_habit(test_db_conn, user_id, Habit("Read", "daily"))
+    storage.save_completions_bulk(test_db_conn,
+                                  [(habit_id, datetime.datetime(2025, 3, d, 7, 0)) for d in (1, 1, 2, 5)])
+    expected = rollup_rows(test_db_conn)
+    test_db_conn.execute("DROP TABLE habit_day_rollups")
+    test_db_conn.execute("DROP TABLE habit_week_rollups")
+    migrations.MIGRATIONS[4](test_db_conn)
+    assert rollup_rows(test_db_conn) == expected
+
+
+@pytest.mark.parametrize("unit", ["day", "week"])
+def test_load_period_counts_matches_bucketed_completions(test_db_conn, user_id, varied_habits, unit):
+    now, habits = varied_habits
+    start, end = (now - datetime.timedelta(days=20)).date(), now.date()
+    counts = storage.load_period_counts(test_db_conn, user_id, start, end, unit)
+
+    def period_start(date):
+        return date - datetime.timedelta(days=date.weekday()) if unit == "week" else date
+    expected = {}
+    for h in habits:
+        for ts in h.completions:
+            expected[period_start(ts.date())] = expected.get(period_start(ts.date()), 0) + 1
+    assert [date for date, _ in counts] == sorted({period_start(start + datetime.timedelta(days=d))
+                                                   for d in range((end - start).days + 1)})
+    assert counts == [(date, expected.get(date, 0)) for date, _ in counts]
+    with pytest.raises(ValueError):
+        storage.load_period_counts(test_db_conn, user_id, start, end, "month")
+
+
+@pytest.mark.parametrize("days", [1, 7, 40])
+def test_window_reports_from_rollups_match_completions(test_db_conn, user_id, varied_habits, days):
+    now, habits = varied_habits
+    start = (now - datetime.timedelta(days=days - 1)).date()
+    for habit in habits:
+        habit.created_at = now - datetime.timedelta(days=60)
+    from_rollups = analyzer.window_reports(habits, start, now.date(),
+                                           storage.load_completion_periods(test_db_conn, user_id, start))
+    assert from_rollups == analyzer.window_reports(habits, start, now.date())
+    assert len(from_rollups) == len(habits)
+
+
+def test_load_completion_rates(test_db_conn, user_id):
+    created = datetime.datetime(2025, 3, 1, 9, 0)
+    daily_id = storage.save_habit(test_db_conn, user_id, Habit("Read", "daily", created_at=created))
+    weekly_id = storage.save_habit(test_db_conn, user_id, Habit("Clean", "weekly", created_at=created))
+    late_id = storage.save_habit(test_db_conn, user_id, Habit("Later", "daily", created_at=created.replace(month=5)))
+    storage.save_completions_bulk(test_db_conn,
+                                  [(daily_id, created + datetime.timedelta(days=d)) for d in (0, 1, 1, 5)]
+                                  + [(weekly_id, created + datetime.timedelta(weeks=w)) for w in (1, 2)])
+    # Daily: 3 of the 10 days from creation; weekly: 2 of the 3 ISO weeks overlapping 2025-03-01..10
+    rates = storage.load_completion_rates(test_db_conn, user_id, datetime.date(2025, 2, 1), datetime.date(2025, 3, 10))
+    assert rates == {daily_id: 3 / 10, weekly_id: 2 / 3, late_id: None}
+
+
+# Registered periodicities and time zones
+def test_summaries_and_periods_of_registered_periodicities(test_db_conn, user_id):
+    """Incremental summaries and rollup periods agree with analyzer for periodicities beyond daily and weekly."""
+    rng = random.Random(5)
+    start = datetime.datetime(2025, 1, 6, 7, 0)
+    stamps = sorted(start + datetime.timedelta(days=rng.randrange(120), hours=rng.randrange(16)) for _ in range(90))
+    habits = []
+    for periodicity in ("3x-weekly", "monthly", "every-3-days"):
+        habit = Habit(periodicity, periodicity, created_at=start)
+        storage.save_habit(test_db_conn, user_id, habit)
+        habit.completions = rng.sample(stamps, 60)
+        for ts in habit.completions:
+            storage.save_completion(test_db_conn, habit.habit_id, ts)
+        habits.append(habit)
+
+    summaries = storage.load_streak_summaries(test_db_conn, user_id)
+    storage.rebuild_streak_summaries(test_db_conn)
+    assert storage.load_streak_summaries(test_db_conn, user_id) == summaries
+    since = (start + datetime.timedelta(days=50)).date()
+    loaded = storage.load_completion_periods(test_db_conn, user_id)
+    recent = storage.load_completion_periods(test_db_conn, user_id, since)
+    for habit in habits:
+        assert (summaries[habit.habit_id].longest_streak, summaries[habit.habit_id].current_streak) == \
+            analyzer.streak_runs(sorted(habit.completions), habit.periodicity)
+        assert summaries[habit.habit_id].total_count == 60
+        assert loaded[habit.habit_id] == analyzer.period_indexes(habit)
+        first, _ = analyzer.window_bounds(habit.periodicity, since, since)
+        assert recent[habit.habit_id] == [p for p in loaded[habit.habit_id] if p >= first]
+
+    # A 3x-weekly week is completed once three different days have completions
+    weeks = test_db_conn.execute("SELECT days_completed, completed FROM habit_week_rollups WHERE habit_id = ?",
+                                 (habits[0].habit_id,)).fetchall()
+    assert all(completed == (days >= 3) for days, completed in weeks)
+
+
+def test_aware_completions_are_recorded_in_the_owner_timezone(test_db_conn, user_id):
+    habit_id = storage.save_habit(test_db_conn, user_id, Habit("Read", "daily"))
+    assert storage.get_user_timezone(test_db_conn, user_id) is None
+    with pytest.raises(ValueError):
+        storage.set_user_timezone(test_db_conn, user_id, "Mars/Olympus_Mons")
+    storage.set_user_timezone(test_db_conn, user_id, "Asia/Tokyo")
+    assert storage.get_user_timezone(test_db_conn, user_id) == "Asia/Tokyo"
+
+    # 20:00 UTC on Sunday is 05:00 on Monday in Tokyo
+    utc = datetime.timezone.utc
+    storage.save_completion(test_db_conn, habit_id, datetime.datetime(2025, 3, 2, 20, 0, tzinfo=utc))
+    storage.save_completions_bulk(test_db_conn, [(habit_id, datetime.datetime(2025, 3, 3, 20, 0, tzinfo=utc)),
+                                                 (habit_id, datetime.datetime(2025, 3, 5, 9, 0))])
+    habit, = storage.load_habits_for_user(test_db_conn, user_id)
+    assert habit.completions == [datetime.datetime(2025, 3, 3, 5, 0), datetime.datetime(2025, 3, 4, 5, 0),
+                                 datetime.datetime(2025, 3, 5, 9, 0)]
+    assert storage.delete_completion(test_db_conn, habit_id, datetime.datetime(2025, 3, 3, 20, 0, tzinfo=utc)) == 1
+
+
+# Habit cache
+def uncached_habits(conn, user_id):
+    habits = storage._load_habits(conn, storage.LOAD_USER_HABITS_SQL, storage.LOAD_USER_COMPLETIONS_SQL, (user_id,))
+    return [(h.habit_id, h.name, h.completions, h.streak_summary) for h in habits]
+
+
+def cached_habits(conn, user_id):
+    return [(h.habit_id, h.name, h.completions, h.streak_summary) for h in storage.load_habits_for_user(conn, user_id)]
+
+
+def test_habit_cache_is_patched_by_writes(test_db_conn, user_id):
+    cache = storage.enable_habit_cache(test_db_conn)
+    day = datetime.datetime(2025, 3, 3, 7, 0)
+    read_id = storage.save_habit(test_db_conn, user_id, Habit("Read", "daily", completions=[day]))
+    walk_id = storage.save_habit(test_db_conn, user_id, Habit("Walk", "weekly"))
+    first = storage.load_habits_for_user(test_db_conn, user_id)
+    snapshot = [list(h.completions) for h in first]
+
+    writes = [
+        lambda: storage.save_completion(test_db_conn, read_id, day + datetime.timedelta(days=1)),
+        lambda: storage.save_completion(test_db_conn, read_id, day - datetime.timedelta(days=3)),
+        lambda: storage.save_completions_bulk(test_db_conn, [
+            (walk_id, day), (read_id, day + datetime.timedelta(days=2)),
+            (walk_id, day - datetime.timedelta(weeks=1))]),
+        lambda: storage.delete_completion(test_db_conn, read_id, day),
+        lambda: storage.delete_habit(test_db_conn, walk_id),
+    ]
+    for write in writes:
+        write()
+        assert cached_habits(test_db_conn, user_id) == uncached_habits(test_db_conn, user_id)
+    assert (cache.hits, cache.misses) == (len(writes), 1)
+    # The cache hands out copies, so a list returned earlier is unchanged
+    assert [h.completions for h in first] == snapshot
+
+    storage.save_habit(test_db_conn, user_id, Habit("Swim", "daily"))
+    assert cached_habits(test_db_conn, user_id) == uncached_habits(test_db_conn, user_id)
+    assert cache.misses == 2
+
+    with pytest.raises(RuntimeError):
+        with storage.unit_of_work(test_db_conn):
+            storage.save_completion(test_db_conn, read_id, day + datetime.timedelta(days=9))
+            raise RuntimeError("abort")
+    assert cached_habits(test_db_conn, user_id) == uncached_habits(test_db_conn, user_id)
+    assert cache.misses == 3
+    storage.disable_habit_cache(test_db_conn)
+
+
+def test_connection_state_goes_away_with_the_connection(tmp_path):
+    """A new connection never inherits the habit cache or backend of a closed one."""
+    for _ in range(20):
+        conn = storage.get_db_connection(':memory:')
+        storage.enable_habit_cache(conn)
+        log = storage.attach_completion_log(conn, str(tmp_path / "log"))
+        conn.close()
+        log.close()
+        conn = storage.get_db_connection(':memory:')
+        assert storage.get_habit_cache(conn) is None and storage._backend_of(conn) is None
+        conn.close()
+    with pytest.raises(TypeError):
+        storage.enable_habit_cache(sqlite3.connect(':memory:'))
+
+
+def test_habit_cache_evicts_least_recently_used_users(test_db_conn):
+    user_ids = []
+    for name in ("ann", "bob", "cat"):
+        storage.register_user(test_db_conn, name, "pw", name, None)
+        user_ids.append(storage.login_user(test_db_conn, name, "pw"))
+        storage.save_habit(test_db_conn, user_ids[-1], Habit("Read", "daily", completions=[
+            datetime.datetime(2025, 1, 1) + datetime.timedelta(days=d) for d in range(10)]))
+    cache = storage.enable_habit_cache(test_db_conn, max_users=2)
+    ann, bob, cat = user_ids
+    for user in (ann, bob, ann, cat):
+        storage.load_habits_for_user(test_db_conn, user)
+    # bob was least recently used when cat arrived
+    assert (cache.hits, cache.misses, cache.evictions, len(cache)) == (1, 3, 1, 2)
+    storage.load_habits_for_user(test_db_conn, bob)
+    assert cache.misses == 4
+    storage.disable_habit_cache(test_db_conn)
+
+    # The size cap evicts too, and a user larger than the whole cap is not cached
+    one_user = storage._CACHED_HABIT_BYTES + 10 * storage._CACHED_COMPLETION_BYTES
+    cache = storage.enable_habit_cache(test_db_conn, max_bytes=2 * one_user)
+    for user in (ann, bob, cat):
+        storage.load_habits_for_user(test_db_conn, user)
+    assert (len(cache), cache.size, cache.evictions) == (2, 2 * one_user, 1)
+    storage.disable_habit_cache(test_db_conn)
+    cache = storage.enable_habit_cache(test_db_conn, max_bytes=one_user - 1)
+    storage.load_habits_for_user(test_db_conn, ann)
+    assert (len(cache), cache.size) == (0, 0)
+    storage.disable_habit_cache(test_db_conn)
+
+
+# Connection factory and pool
+def test_get_db_connection_applies_pragmas(tmp_path):
+    conn = storage.get_db_connection(str(tmp_path / "tuned.db"), synchronous="FULL")
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == storage.DEFAULT_PRAGMAS["busy_timeout"]
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 2  # FULL
+    conn.close()
+
+
+def test_connection_pool_concurrent_writers(tmp_path):
+    """Threads sharing a pool can all log completions without lock errors."""
+    path = str(tmp_path / "pool.db")
+    pool = storage.ConnectionPool(path, size=4)
+    with pool.connection() as conn:
+        storage.create_tables(conn)
+        storage.register_user(conn, "tester", "secret", "Test User", "tester@example.com")
+        user_id = storage.login_user(conn, "tester", "secret")
+        habit_id = storage.save_habit(conn, user_id, Habit("Read", "daily"))
+
+    errors = []
+
+    def writer(worker):
+        try:
+            for i in range(25):
+                with pool.connection(timeout=10) as conn:
+                    storage.save_completion(conn, habit_id, datetime.datetime(2025, 1, 1, worker, i))
+                    storage.load_habits_for_user(conn, user_id)
+        except Exception as exc:  # collected and asserted in the main thread
+            errors.append(exc)
+
+    threads = [threading.Thread(target=writer, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with pool.connection() as conn:
+        habit = storage.load_habits_for_user(conn, user_id)[0]
+    assert len(habit.completions) == 200
+    assert habit.streak_summary.total_count == 200
+    pool.close()
+
+
+def test_connection_pool_bounds_open_connections(tmp_path):
+    pool = storage.ConnectionPool(str(tmp_path / "bounded.db"), size=1)
+    conn = pool.acquire()
+    with pytest.raises(TimeoutError):
+        pool.acquire(timeout=0.01)
+    conn.execute("BEGIN")
+    pool.release(conn)
+    reused = pool.acquire()
+    assert reused is conn and not reused.in_transaction
+    pool.release(reused)
+    pool.close()
+
+    with pytest.raises(ValueError):
+        storage.ConnectionPool(':memory:', size=2)
+
+
+# Write-behind completion buffer
+@pytest.fixture
+def file_db(tmp_path):
+    path = str(tmp_path / "buffered.db")
+    conn = storage.get_db_connection(path)
+    storage.create_tables(conn)
+    storage.register_user(conn, "tester", "secret", "Test User", "tester@example.com")
+    user_id = storage.login_user(conn, "tester", "secret")
+    habit_id = storage.save_habit(conn, user_id, Habit("Read", "daily"))
+    yield path, conn, user_id, habit_id
+    storage.disable_write_behind(conn)
+    conn.close()
+
+
+def stored_completions(conn, habit_id):
+    rows = conn.execute("SELECT timestamp FROM completions WHERE habit_id = ? ORDER BY completion_id", (habit_id,))
+    return [datetime.datetime.fromisoformat(row[0]) for row in rows]
+
+
+def test_write_behind_reads_see_buffered_completions(file_db):
+    path, conn, user_id, habit_id = file_db
+    storage.enable_write_behind(conn, max_pending=100, flush_interval_ms=60_000)
+    stamps = [datetime.datetime(2025, 1, day, 8) for day in (3, 1, 2)]
+    for ts in stamps:
+        storage.save_completion(conn, habit_id, ts)
+
+    assert stored_completions(conn, habit_id) == []
+    habit = storage.load_habits_for_user(conn, user_id)[0]
+    assert habit.completions == sorted(stamps)
+    assert analyzer.longest_streak_for_habit(habit) == 3
+    compact = storage.load_compact_habits_for_user(conn, user_id)[0]
+    assert compact.completions == [periods.to_epoch(ts) for ts in sorted(stamps)]
+    # SQL-side reads flush first
+    assert storage.load_last_completions(conn, user_id) == {habit_id: stamps[0]}
+    assert stored_completions(conn, habit_id) == stamps
+
+
+def test_write_behind_flushes_in_save_order_at_size_threshold(file_db):
+    path, conn, user_id, habit_id = file_db
+    buffer = storage.enable_write_behind(conn, max_pending=3, flush_interval_ms=60_000)
+    stamps = [datetime.datetime(2025, 1, 5 - i, 8) for i in range(4)]
+    for ts in stamps:
+        storage.save_completion(conn, habit_id, ts)
+
+    assert buffer.flushes == 1
+    assert stored_completions(conn, habit_id) == stamps[:3]
+    assert buffer.pending() == [(habit_id, stamps[3])]
+    storage.disable_write_behind(conn)
+    assert stored_completions(conn, habit_id) == stamps
+    assert storage.load_streak_summaries(conn, user_id)[habit_id].longest_streak == 4
+
+
+def test_write_behind_durability_levels(file_db):
+    path, conn, user_id, habit_id = file_db
+    buffer = storage.enable_write_behind(conn, flush_interval_ms=0)
+    storage.save_completion(conn, habit_id, datetime.datetime(2025, 1, 1, 8))
+    assert buffer.pending() == [] and len(stored_completions(conn, habit_id)) == 1
+    storage.disable_write_behind(conn)
+
+    buffer = storage.enable_write_behind(conn, flush_interval_ms=20)
+    storage.save_completion(conn, habit_id, datetime.datetime(2025, 1, 2, 8))
+    deadline = time.monotonic() + 5
+    while buffer.pending() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(stored_completions(conn, habit_id)) == 2
+
+
+def test_write_behind_failed_flush_keeps_completions(file_db, monkeypatch):
+    path, conn, user_id, habit_id = file_db
+    buffer = storage.enable_write_behind(conn, max_pending=2, flush_interval_ms=60_000)
+    storage.save_completion(conn, habit_id, datetime.datetime(2025, 1, 1, 8))
+    real_bulk = storage.save_completions_bulk
+
+    def failing_bulk(bulk_conn, completions):
+        # Writes part of the batch before failing, as an I/O error mid-flush would
+        with storage.unit_of_work(bulk_conn):
+            real_bulk(bulk_conn, completions[:1])
+            raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(storage, "save_completions_bulk", failing_bulk)
+    with pytest.raises(sqlite3.OperationalError):
+        storage.save_completion(conn, habit_id, datetime.datetime(2025, 1, 2, 8))
+    assert len(buffer.pending()) == 2
+    assert stored_completions(conn, habit_id) == []  # the partial batch was rolled back
+    assert isinstance(buffer.last_error, sqlite3.OperationalError)
+
+    monkeypatch.setattr(storage, "save_completions_bulk", real_bulk)
+    assert buffer.flush() == 2
+    assert stored_completions(conn, habit_id) == [datetime.datetime(2025, 1, 1, 8), datetime.datetime(2025, 1, 2, 8)]
+
+
+def test_write_behind_flushes_on_interpreter_exit(file_db):
+    """Completions still queued when the process exits normally are written by the atexit hook."""
+    path, conn, user_id, habit_id = file_db
+    script = (
+        "import datetime, storage\n"
+        f"conn = storage.get_db_connection({path!r})\n"
+        "storage.enable_write_behind(conn, flush_interval_ms=60_000)\n"
+        f"storage.save_completion(conn, {habit_id}, datetime.datetime(2025, 1, 1, 8))\n"
+    )
+    subprocess.run([sys.executable, "-c", script], check=True, cwd=os.path.dirname(os.path.abspath(storage.__file__)))
+    assert stored_completions(conn, habit_id) == [datetime.datetime(2025, 1, 1, 8)]
+
+
+def test_write_behind_flushes_before_taking_the_write_lock(tmp_path):
+    """Queued completions never wait on a transaction of the connection they were saved on."""
+    conn = storage.get_db_connection(str(tmp_path / "buffered.db"), busy_timeout=200)
+    storage.create_tables(conn)
+    read_id = storage.save_habit(conn, Habit("Read", "daily"))
+    storage.enable_write_behind(conn, flush_interval_ms=60_000)
+    day = datetime.datetime(2025, 1, 1, 8)
+    storage.save_completion(conn, read_id, day)
+    walk_id = storage.save_habit(conn, Habit("Walk", "daily", completions=[day]))
+    storage.save_completion(conn, read_id, day + datetime.timedelta(days=1))
+    conn.execute("INSERT INTO users (username, password) VALUES ('raw', 'x')")  # an open implicit transaction
+    storage.delete_habit(conn, walk_id)
+    assert stored_completions(conn, read_id) == [day, day + datetime.timedelta(days=1)]
+    storage.disable_write_behind(conn)
+    conn.close()
+
+
+def test_write_behind_requires_file_database(test_db_conn):
+    with pytest.raises(ValueError):
+        storage.enable_write_behind(test_db_conn)
+
+
+def test_habit_cache_sees_queued_completions_once(file_db):
+    path, conn, user_id, habit_id = file_db
+    buffer = storage.enable_write_behind(conn, flush_interval_ms=60_000)
+    storage.enable_habit_cache(conn)
+    storage.save_completion(conn, habit_id, datetime.datetime(2025, 1, 1, 8))
+    storage.load_habits_for_user(conn, user_id)
+    storage.save_completion(conn, habit_id, datetime.datetime(2025, 1, 2, 8))
+    expected = [datetime.datetime(2025, 1, 1, 8), datetime.datetime(2025, 1, 2, 8)]
+    assert storage.load_habits_for_user(conn, user_id)[0].completions == expected
+    buffer.flush()
+    assert storage.load_habits_for_user(conn, user_id)[0].completions == expected
+    storage.disable_habit_cache(conn)
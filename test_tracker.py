@@ -0,0 +1,82 @@
+import datetime
+
+import pytest
+
+import storage
+from habit import Habit
+from tracker import HabitTracker
+
+
+@pytest.fixture
+def test_db_conn():
+    conn = storage.get_db_connection(':memory:')
+    storage.create_tables(conn)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def user_id(test_db_conn):
+    storage.register_user(test_db_conn, "tester", "secret", "Test User", "tester@example.com")
+    return storage.login_user(test_db_conn, "tester", "secret")
+
+
+def test_in_memory_indexes():
+    tracker = HabitTracker()
+    run = tracker.add_habit("Run", "Daily", "Morning run")
+    read = tracker.add_habit("Read", "daily")
+    clean = tracker.add_habit("Clean", "weekly")
+    second_run = tracker.add_habit("Run", "weekly")
+
+    assert isinstance(run, Habit) and run.description == "Morning run"
+    assert tracker.habits == [run, read, clean, second_run]
+    assert tracker.list_habits("daily") == [run, read]
+    assert tracker.list_habits("WEEKLY") == [clean, second_run]
+    assert tracker.find_by_name("Run") == [run, second_run]
+
+    tracker.delete_habit("Run")
+    assert tracker.habits == [read, clean]
+    assert tracker.list_habits("daily") == [read]
+    assert tracker.find_by_name("Run") == []
+    assert len(tracker) == 2
+
+
+def test_write_through_matches_storage(test_db_conn, user_id):
+    tracker = HabitTracker(test_db_conn, user_id)
+    read = tracker.add_habit("Read", "daily")
+    clean = tracker.add_habit("Clean", "weekly")
+    assert read.habit_id is not None and tracker.get(read.habit_id) is read
+
+    ts = datetime.datetime(2025, 3, 10, 8)
+    tracker.log_completion(read.habit_id, ts)
+    tracker.delete_habit_by_id(clean.habit_id)
+    assert tracker.get(clean.habit_id) is None
+
+    reloaded = HabitTracker.load(test_db_conn, user_id)
+    assert [h.habit_id for h in reloaded.habits] == [read.habit_id]
+    assert reloaded.get(read.habit_id).completions == [ts]
+    assert reloaded.get(read.habit_id).streak_summary.total_count == 1
+
+
+def test_logging_on_cached_habits_saves_once(test_db_conn, user_id):
+    """A tracker changes its habits before saving, which must not reach the habit cache."""
+    habit_id = HabitTracker(test_db_conn, user_id).add_habit("Read", "daily").habit_id
+    storage.enable_habit_cache(test_db_conn)
+    ts = datetime.datetime(2025, 3, 10, 8)
+    HabitTracker.load(test_db_conn, user_id).log_completion(habit_id, ts)
+    HabitTracker.load(test_db_conn, user_id).log_completion(habit_id, ts + datetime.timedelta(days=1))
+    assert HabitTracker.load(test_db_conn, user_id).get(habit_id).completions == [ts, ts + datetime.timedelta(days=1)]
+    storage.disable_habit_cache(test_db_conn)
+
+
+def test_saved_habit_keeps_logged_completions(test_db_conn, user_id):
+    """Completions logged before a habit is saved are persisted with it."""
+    habit = Habit("Stretch", "daily")
+    habit.log_completion(datetime.datetime(2025, 3, 9, 8))
+    habit.log_completion(datetime.datetime(2025, 3, 10, 8))
+    HabitTracker(test_db_conn, user_id).add(habit)
+
+    loaded = storage.load_habits_for_user(test_db_conn, user_id)
+    assert loaded[0].habit_id == habit.habit_id
+    assert loaded[0].completions == habit.completions
+    assert loaded[0].streak_summary.longest_streak == 2
@@ -0,0 +1,155 @@
+import datetime
+import random
+
+import pytest
+
+import storage
+import transfer
+from models import Habit
+
+
+@pytest.fixture
+def test_db_conn():
+    conn = storage.get_db_connection(':memory:')
+    storage.create_tables(conn)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def source_conn(test_db_conn):
+    """Two users, one with a time zone, with daily and weekly habits, sub-second and pre-1970 timestamps."""
+    rng = random.Random(7)
+    completions = []
+    for username in ("alice", "bob"):
+        storage.register_user(test_db_conn, username, "secret", None, f"{username}@example.com")
+        user_id = storage.login_user(test_db_conn, username, "secret")
+        if username == "alice":
+            storage.set_user_timezone(test_db_conn, user_id, "Europe/Berlin")
+        habit_ids = storage.save_habits_bulk(test_db_conn, user_id, [Habit('Read, "slowly"', "daily"),
+                                                                     Habit("Clean", "weekly")])
+        start = datetime.datetime(1969, 12, 1, 6, 30)
+        for habit_id in habit_ids:
+            completions += [(habit_id, start + datetime.timedelta(days=rng.randrange(120),
+                                                                  microseconds=rng.choice((0, rng.randrange(10**6)))))
+                            for _ in range(150)]
+    storage.save_completions_bulk(test_db_conn, completions)
+    return test_db_conn
+
+
+def snapshot(conn, skip_users=0):
+    """Every row reachable from the users, with ids replaced by names."""
+    users = conn.execute(
+        "SELECT username, password, full_name, email, timezone FROM users ORDER BY user_id").fetchall()
+    habits = conn.execute("""
+        SELECT u.username, h.name, h.periodicity, h.created_at, h.is_active, s.current_streak, s.longest_streak
+        FROM habits h JOIN users u USING (user_id) LEFT JOIN habit_streaks s USING (habit_id)
+        ORDER BY h.habit_id
+    """).fetchall()
+    completions = conn.execute("""
+        SELECT u.username, h.name, c.timestamp, c.ts_epoch, c.day_index, c.week_index
+        FROM completions c JOIN habits h USING (habit_id) JOIN users u USING (user_id)
+        ORDER BY 1, 2, 3
+    """).fetchall()
+    return [tuple(r) for r in users[skip_users:]], [tuple(r) for r in habits], [tuple(r) for r in completions]
+
+
+@pytest.mark.parametrize("fmt", transfer.FORMATS)
+def test_export_import_round_trip_remaps_ids(source_conn, tmp_path, fmt):
+    path = str(tmp_path / f"export.{fmt}")
+    counts = transfer.export_data(source_conn, path, fmt)
+    assert counts == {"users": 2, "habits": 4, "completions": 600}
+
+    target = storage.get_db_connection(':memory:')
+    storage.create_tables(target)
+    # Existing rows push the imported ids past the exported ones
+    storage.register_user(target, "carol", "secret", "Carol", "carol@example.com")
+    storage.save_habit(target, storage.login_user(target, "carol", "secret"), Habit("Walk", "daily"))
+
+    assert transfer.import_data(target, path, fmt, batch_size=64) == counts
+    users, habits, completions = snapshot(target, skip_users=1)
+    assert (users, habits[1:], completions) == snapshot(source_conn)
+    target.close()
+
+
+@pytest.mark.parametrize("fmt", transfer.FORMATS)
+def test_round_trip_keeps_legacy_habits(source_conn, tmp_path, fmt):
+    habit_id = storage.save_habit(source_conn, Habit("Stretch", "daily"))
+    storage.save_completion(source_conn, habit_id, datetime.datetime(2024, 3, 1, 7))
+    path = str(tmp_path / f"export.{fmt}")
+    counts = transfer.export_data(source_conn, path, fmt)
+    assert counts == {"users": 2, "habits": 5, "completions": 601}
+
+    target = storage.get_db_connection(':memory:')
+    storage.create_tables(target)
+    assert transfer.import_data(target, path, fmt) == counts
+    legacy = target.execute("""
+        SELECT h.name, c.timestamp FROM habits h JOIN completions c USING (habit_id) WHERE h.user_id = ?
+    """, (storage.LEGACY_USER_ID,)).fetchall()
+    assert [tuple(r) for r in legacy] == [("Stretch", "2024-03-01T07:00:00")]
+    target.close()
+
+
+@pytest.mark.parametrize("fmt", transfer.FORMATS)
+def test_round_trip_after_deletes_skips_orphans(source_conn, tmp_path, fmt):
+    storage.delete_habit(source_conn, 1)
+    storage.delete_user(source_conn, storage.find_user(source_conn, "bob"))
+    # Rows that deletes of earlier releases left behind
+    source_conn.execute("INSERT INTO habits (habit_id, user_id, name, periodicity, created_at, is_active) "
+                        "VALUES (99, 42, 'Orphan', 'daily', '2024-01-01T00:00:00', 1)")
+    source_conn.execute("INSERT INTO completions (habit_id, timestamp) VALUES (99, '2024-01-02T08:00:00'), "
+                        "(98, '2024-01-02T08:00:00')")
+    source_conn.commit()
+    path = str(tmp_path / f"export.{fmt}")
+    assert transfer.export_data(source_conn, path, fmt) == {"users": 1, "habits": 1, "completions": 150}
+
+    target = storage.get_db_connection(':memory:')
+    storage.create_tables(target)
+    assert transfer.import_data(target, path, fmt)["completions"] == 150
+    assert snapshot(target) == snapshot(source_conn)
+    target.close()
+
+
+def test_import_rejects_unknown_references_atomically(test_db_conn, tmp_path):
+    path = tmp_path / "export.jsonl"
+    path.write_text('{"table": "users", "user_id": 1, "username": "dora", "password": "x", '
+                    '"full_name": null, "email": null, "timezone": null}\n'
+                    '{"table": "habits", "habit_id": 1, "user_id": 1, "name": "Read", "periodicity": "daily", '
+                    '"created_at": "2024-01-01T00:00:00", "is_active": 1}\n'
+                    '{"table": "completions", "habit_id": 1, "timestamp": "2024-01-02T08:00:00"}\n'
+                    '{"table": "completions", "habit_id": 7, "timestamp": "2024-01-02T08:00:00"}\n', encoding="utf-8")
+    with pytest.raises(ValueError, match="habits missing"):
+        transfer.import_data(test_db_conn, str(path), batch_size=1)
+    for table in ("users", "habits", "completions"):
+        assert test_db_conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] == 0
+
+
+def test_import_reads_exports_without_time_zones(test_db_conn, tmp_path):
+    path = tmp_path / "export.jsonl"
+    path.write_text('{"table": "users", "user_id": 4, "username": "dora", "password": "x", '
+                    '"full_name": null, "email": null}\n', encoding="utf-8")
+    assert transfer.import_data(test_db_conn, str(path))["users"] == 1
+    assert storage.get_user_timezone(test_db_conn, storage.find_user(test_db_conn, "dora")) is None
+
+
+def test_binary_export_is_smaller_than_text(source_conn, tmp_path):
+    transfer.export_data(source_conn, str(tmp_path / "export.jsonl"), "jsonl")
+    transfer.export_data(source_conn, str(tmp_path / "export.bin"), "binary")
+    assert (tmp_path / "export.bin").stat().st_size * 4 < (tmp_path / "export.jsonl").stat().st_size
+
+
+def test_import_rejects_existing_username(source_conn, tmp_path):
+    path = str(tmp_path / "export.jsonl")
+    transfer.export_data(source_conn, path)
+    with pytest.raises(ValueError):
+        transfer.import_data(source_conn, path)
+    assert source_conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 2
+
+
+def test_unknown_format_and_foreign_file(source_conn, tmp_path):
+    with pytest.raises(ValueError):
+        transfer.export_data(source_conn, str(tmp_path / "export.xml"), "xml")
+    foreign = tmp_path / "foreign.bin"
+    foreign.write_bytes(b"PAR1" * 4)
+    with pytest.raises(ValueError):
+        transfer.import_data(source_conn, str(foreign), "binary")
@@ -1,22 +1,111 @@
 from habit import Habit
+import storage
+
 
 class HabitTracker:
     """
-    Manages multiple habits.
+    Manages multiple habits in memory, indexed by habit_id, name and periodicity.
+
+    Habits are kept in insertion order, and each index maps a key to an
+    insertion-ordered dict of the matching habits. Lookups by habit_id are
+    therefore O(1), and filtering or deleting by name or periodicity is O(k) in
+    the number of matching habits rather than a scan of every habit.
+
+    Given a connection and a user_id, the tracker writes through to storage:
+    added habits, logged completions and deletes are saved before the indexes
+    change. Without a connection it is purely in-memory.
     """
 
-    def __init__(self):
-        self.habits = []
+    def __init__(self, conn=None, user_id=None):
+        if conn is not None and user_id is None:
+            raise ValueError("A tracker that writes to storage needs a user_id.")
+        self.conn = conn
+        self.user_id = user_id
+        # Keyed by id(habit), so habits without a habit_id can be indexed too
+        self._habits = {}
+        self._by_id = {}
+        self._by_name = {}
+        self._by_periodicity = {}
+
+    @classmethod
+    def load(cls, conn, user_id):
+        """Returns a write-through tracker holding every habit a user owns."""
+        tracker = cls(conn, user_id)
+        for habit in storage.load_habits_for_user(conn, user_id):
+            tracker._index(habit)
+        return tracker
+
+    @property
+    def habits(self):
+        """All habits, in the order they were added."""
+        return list(self._habits.values())
+
+    def __len__(self):
+        return len(self._habits)
+
+    def _index(self, habit):
+        key = id(habit)
+        self._habits[key] = habit
+        if habit.habit_id is not None:
+            self._by_id[habit.habit_id] = habit
+        self._by_name.setdefault(habit.name, {})[key] = habit
+        self._by_periodicity.setdefault(habit.periodicity, {})[key] = habit
+
+    def _unindex(self, habit):
+        key = id(habit)
+        del self._habits[key]
+        if habit.habit_id is not None:
+            del self._by_id[habit.habit_id]
+        for index, value in ((self._by_name, habit.name), (self._by_periodicity, habit.periodicity)):
+            bucket = index[value]
+            del bucket[key]
+            if not bucket:
+                del index[value]
 
     def add_habit(self, name, periodicity, description=""):
         habit = Habit(name, periodicity, description)
-        self.habits.append(habit)
+        return self.add(habit)
+
+    def add(self, habit):
+        """Adds an existing Habit, saving it first if the tracker writes to storage."""
+        if self.conn is not None and habit.habit_id is None:
+            storage.save_habit(self.conn, self.user_id, habit)
+        self._index(habit)
         return habit
 
+    def get(self, habit_id):
+        """Returns the habit with a habit_id, or None."""
+        return self._by_id.get(habit_id)
+
+    def find_by_name(self, name):
+        """Returns every habit with the given name."""
+        return list(self._by_name.get(name, {}).values())
+
     def list_habits(self, periodicity=None):
         if periodicity:
-            return [h for h in self.habits if h.periodicity == periodicity]
+            return list(self._by_periodicity.get(periodicity.lower(), {}).values())
         return self.habits
 
+    def log_completion(self, habit_id, timestamp=None):
+        """Logs a completion for a habit in memory and, when writing through, in storage."""
+        habit = self._by_id[habit_id]
+        habit.log_completion(timestamp)
+        if self.conn is not None:
+            storage.save_completion(self.conn, habit_id, habit.completions[-1])
+        return habit
+
     def delete_habit(self, name):
-        self.habits = [h for h in self.habits if h.name != name]
+        """Deletes every habit with the given name."""
+        for habit in self.find_by_name(name):
+            self._delete(habit)
+
+    def delete_habit_by_id(self, habit_id):
+        """Deletes the habit with a habit_id, if there is one."""
+        habit = self._by_id.get(habit_id)
+        if habit is not None:
+            self._delete(habit)
+
+    def _delete(self, habit):
+        if self.conn is not None and habit.habit_id is not None:
+            storage.delete_habit(self.conn, habit.habit_id)
+        self._unindex(habit)
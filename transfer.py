@@ -0,0 +1,271 @@
+"""
+Bulk export and import of whole habit tracker databases.
+
+Three formats are supported:
+
+* "csv": a directory holding users.csv, habits.csv and completions.csv.
+* "jsonl": one JSON Lines file; every line is an object with a "table" key.
+* "binary": a compact columnar file. Completions are written in blocks whose
+  habit ids are run-length encoded and whose timestamps are delta-encoded
+  wall-clock epoch microseconds, each column compressed with zlib.
+
+Exports stream from storage with fetchmany, and imports insert in batches
+within one transaction, so neither side holds the whole database in memory and
+a failed import leaves the database as it was. Imported users
+and habits get new ids and all references are remapped, so an export can be
+loaded into a database that already has data.
+"""
+import array
+import csv
+import datetime
+import itertools
+import json
+import operator
+import os
+import struct
+import sys
+import zlib
+
+import periods
+import storage
+
+FORMATS = ("csv", "jsonl", "binary")
+TABLES = ("users", "habits", "completions")
+COLUMNS = {
+    "users": ("user_id", "username", "password", "full_name", "email", "timezone"),
+    "habits": ("habit_id", "user_id", "name", "periodicity", "created_at", "is_active"),
+    "completions": ("habit_id", "timestamp"),
+}
+# Columns converted back to int when read from CSV
+_INT_COLUMNS = {"user_id", "habit_id", "is_active"}
+# Nullable columns; CSV writes NULL as an empty field, which reads back as None
+_NULLABLE_COLUMNS = {"full_name", "email", "timezone"}
+
+
+def export_data(conn, path, fmt="jsonl"):
+    """
+    Writes every user, habit and completion in the database to `path`, which is
+    a directory for "csv" and a file otherwise.
+    Returns a dict mapping each table name to the number of rows written.
+    """
+    writer = _writer(fmt)
+    return writer(path, ((table, storage.iter_export_rows(conn, table)) for table in TABLES))
+
+
+def import_data(conn, path, fmt="jsonl", batch_size=50000):
+    """
+    Loads an export written by export_data into the database in one
+    transaction, inserting `batch_size` habits or completions at a time.
+    Returns a dict mapping each table name to the number of rows imported.
+
+    Raises:
+        ValueError: If a username already exists or a row refers to a user or
+            habit missing from the export; nothing is imported then.
+    """
+    reader = _reader(fmt)
+    counts = dict.fromkeys(TABLES, 0)
+    user_ids = {}
+    habit_ids = {}
+    with storage.unit_of_work(conn):
+        for table, rows in reader(path):
+            if table == "users":
+                user_ids = storage.import_users(conn, rows)
+                counts[table] = len(user_ids)
+            elif table == "habits":
+                habit_ids = storage.import_habits(conn, rows, user_ids, batch_size)
+                counts[table] = len(habit_ids)
+            else:
+                counts[table] = storage.import_completions(conn, rows, habit_ids, batch_size)
+    return counts
+
+
+def _writer(fmt):
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    return {"csv": _write_csv, "jsonl": _write_jsonl, "binary": _write_binary}[fmt]
+
+
+def _reader(fmt):
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    return {"csv": _read_csv, "jsonl": _read_jsonl, "binary": _read_binary}[fmt]
+
+
+def _text_rows(table, rows):
+    """Yields export rows with the columns of COLUMNS[table]; completions keep the ISO timestamp."""
+    if table == "completions":
+        return ((habit_id, timestamp) for habit_id, timestamp, _ in rows)
+    return rows
+
+
+def _completion_values(habit_id, timestamp):
+    return int(habit_id), periods.to_epoch_micros(datetime.datetime.fromisoformat(timestamp))
+
+
+# --- CSV ---
+
+def _write_csv(path, tables):
+    os.makedirs(path, exist_ok=True)
+    counts = {}
+    for table, rows in tables:
+        with open(os.path.join(path, f"{table}.csv"), "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS[table])
+            count = 0
+            for count, row in enumerate(_text_rows(table, rows), 1):
+                writer.writerow(row)
+        counts[table] = count
+    return counts
+
+
+def _read_csv(path):
+    for table in TABLES:
+        with open(os.path.join(path, f"{table}.csv"), newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            if table == "completions":
+                yield table, itertools.starmap(_completion_values, reader)
+            else:
+                converters = [int if name in _INT_COLUMNS else _null_if_empty if name in _NULLABLE_COLUMNS else str
+                              for name in header]
+                yield table, (tuple(convert(v) for convert, v in zip(converters, row)) for row in reader)
+
+
+def _null_if_empty(value):
+    return value or None
+
+
+# --- JSON Lines ---
+
+def _write_jsonl(path, tables):
+    counts = {}
+    with open(path, "w", encoding="utf-8") as f:
+        for table, rows in tables:
+            count = 0
+            if table == "completions":
+                # ISO timestamps need no escaping, so these lines are formatted
+                # directly instead of going through json.dumps
+                for count, (habit_id, timestamp) in enumerate(_text_rows(table, rows), 1):
+                    f.write(f'{{"table": "completions", "habit_id": {habit_id}, "timestamp": "{timestamp}"}}\n')
+            else:
+                for count, row in enumerate(rows, 1):
+                    record = {"table": table}
+                    record.update(zip(COLUMNS[table], row))
+                    f.write(json.dumps(record) + "\n")
+            counts[table] = count
+    return counts
+
+
+def _read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        records = map(json.loads, f)
+        for table, group in itertools.groupby(records, key=operator.itemgetter("table")):
+            if table == "completions":
+                yield table, (_completion_values(r["habit_id"], r["timestamp"]) for r in group)
+            else:
+                # Nullable columns may be missing from exports made before they were added
+                columns = [(c, c in _NULLABLE_COLUMNS) for c in COLUMNS[table]]
+                yield table, (tuple(r.get(c) if nullable else r[c] for c, nullable in columns) for r in group)
+
+
+# --- Columnar binary ---
+# The file is MAGIC followed by frames of a one-byte kind, a payload length and
+# the payload. Users (U) and habits (H) frames hold a zlib-compressed JSON list of
+# rows. A completions (C) frame holds one block: its row count and three
+# length-prefixed zlib-compressed little-endian int64 columns, namely the
+# delta-encoded habit id of each run of equal ids, the run lengths and the
+# delta-encoded epoch microseconds. An E frame ends the file.
+
+MAGIC = b"HTCOLv1\n"
+BLOCK_ROWS = 65536
+_FRAME = struct.Struct("<cQ")
+_U32 = struct.Struct("<I")
+_FRAME_KINDS = {"users": b"U", "habits": b"H", "completions": b"C"}
+_FRAME_TABLES = {kind: table for table, kind in _FRAME_KINDS.items()}
+
+
+def _pack_column(values):
+    column = array.array("q", values)
+    if sys.byteorder == "big":
+        column.byteswap()
+    data = zlib.compress(column.tobytes())
+    return _U32.pack(len(data)) + data
+
+
+def _unpack_columns(payload, offset, count):
+    columns = []
+    for _ in range(count):
+        (size,) = _U32.unpack_from(payload, offset)
+        offset += _U32.size
+        column = array.array("q")
+        column.frombytes(zlib.decompress(payload[offset:offset + size]))
+        if sys.byteorder == "big":
+            column.byteswap()
+        columns.append(column)
+        offset += size
+    return columns
+
+
+def _deltas(values):
+    return itertools.chain(values[:1], map(operator.sub, itertools.islice(values, 1, None), values))
+
+
+def _encode_block(rows):
+    habit_ids = [row[0] for row in rows]
+    micros = [row[2] for row in rows]
+    run_ids = []
+    run_lengths = []
+    for habit_id, run in itertools.groupby(habit_ids):
+        run_ids.append(habit_id)
+        run_lengths.append(sum(1 for _ in run))
+    return (_U32.pack(len(rows)) + _pack_column(_deltas(run_ids)) + _pack_column(run_lengths)
+            + _pack_column(_deltas(micros)))
+
+
+def _decode_block(payload):
+    run_ids, run_lengths, micros = _unpack_columns(payload, _U32.size, 3)
+    habit_ids = itertools.chain.from_iterable(map(itertools.repeat, itertools.accumulate(run_ids), run_lengths))
+    return zip(habit_ids, itertools.accumulate(micros))
+
+
+def _write_binary(path, tables):
+    counts = {}
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        for table, rows in tables:
+            kind = _FRAME_KINDS[table]
+            count = 0
+            encode = _encode_block if table == "completions" else \
+                (lambda block: zlib.compress(json.dumps(block).encode("utf-8")))
+            rows = iter(rows)
+            while True:
+                block = list(itertools.islice(rows, BLOCK_ROWS))
+                if not block:
+                    break
+                payload = encode(block)
+                f.write(_FRAME.pack(kind, len(payload)))
+                f.write(payload)
+                count += len(block)
+            counts[table] = count
+        f.write(_FRAME.pack(b"E", 0))
+    return counts
+
+
+def _read_frames(f):
+    while True:
+        kind, size = _FRAME.unpack(f.read(_FRAME.size))
+        if kind == b"E":
+            return
+        yield kind, f.read(size)
+
+
+def _read_binary(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Not a binary habit tracker export: {path}")
+        for kind, frames in itertools.groupby(_read_frames(f), key=operator.itemgetter(0)):
+            if kind == b"C":
+                rows = itertools.chain.from_iterable(_decode_block(payload) for _, payload in frames)
+            else:
+                rows = (tuple(row) for _, payload in frames for row in json.loads(zlib.decompress(payload)))
+            yield _FRAME_TABLES[kind], rows